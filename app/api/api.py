@@ -4,7 +4,8 @@ from app.api import (
     routes_users,
     routes_contacts,
     routes_emergency,
-    routes_centros, routes_guias
+    routes_centros, routes_guias,
+    routes_media
 )
 
 api_router = APIRouter()
@@ -42,4 +43,10 @@ api_router.include_router(
 api_router.include_router(
     routes_guias.router,
     prefix="/guias", 
-    tags=["guias"])
\ No newline at end of file
+    tags=["guias"])
+
+api_router.include_router(
+    routes_media.router,
+    prefix="/media",
+    tags=["Multimedia"]
+)
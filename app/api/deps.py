@@ -8,6 +8,7 @@ from app.models.user import User
 from app.crud import crud_user
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 def get_token_data(token: str = Depends(oauth2_scheme)) -> Dict[str, Any]:
     """Decodifica y valida el token JWT"""
@@ -24,6 +25,23 @@ def get_current_token(token: str = Depends(oauth2_scheme)) -> dict:
     """Obtiene los datos del token actual"""
     return get_token_data(token)
 
+def get_stream_token(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    access_token: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Token para conexiones de streaming (SSE).
+    EventSource no permite enviar cabeceras, así que también se acepta
+    el token como parámetro ?access_token=...
+    """
+    return get_token_data(token or access_token or "")
+
+def get_optional_token(token: Optional[str] = Depends(oauth2_scheme_optional)) -> Optional[Dict[str, Any]]:
+    """Datos del token si la request trae uno (inválido → 401); None si no trae"""
+    if not token:
+        return None
+    return get_token_data(token)
+
 def get_current_user(
     payload: Dict[str, Any] = Depends(get_token_data),
     db: Session = Depends(get_db)
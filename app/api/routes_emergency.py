@@ -1,25 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Request, Response, Query, Header, Form, File, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, joinedload
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from datetime import datetime, timedelta
 from uuid import UUID
+import asyncio
+import binascii
+import csv
+import hashlib
+import io
+import json
 import logging
-from pydantic import BaseModel
+import os
+import uuid
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
 from app.models.informe_mision import InformeMision
 
-from app.api.deps import get_current_user, get_db, get_current_token
+from app.api.deps import get_current_user, get_db, get_current_token, get_optional_token, get_stream_token
+from app.core.config import settings
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.rate_limiter import RateLimiter
+from app.core.ttl_cache import TTLCache
+from app.db.session import SessionLocal
+from app.crud import crud_user
 from app.crud.crud_contact import crud_contact
-from app.crud.crud_peticion import crud_peticion
-from app.models.user import User
+from app.crud.crud_outbox import crud_outbox
+from app.crud.crud_transicion import crud_transicion
+from app.crud.crud_peticion import crud_peticion, DispatchResult, ESTADOS_ACTIVOS, ESTADO_DESPACHADA, ESTADO_RESUELTA
+from app.models.user import User, RolUsuarioEnum
 from app.schemas.contact import (
     EmergencyAlertRequest,
     EmergencyAlertResponse,
     UbicacionCreate,EmergencyReportRequest,
     EmergencyReportResponse
 )
-from app.models.peticion import Peticion
+from app.models.evento_outbox import EVENTO_FOTO_INFORME
+from app.models.peticion import Peticion, MEDIA_PENDIENTE
 from app.models.ubicacion import Ubicacion
-from app.services.storage_service import storage_service
+from app.services.media_spool import spool_to_disk, spool_base64, discard, UploadTooLarge
+from app.services.outbox_worker import outbox_worker
+from app.services.transition_log import transition_log
+from app.services.chunked_upload import chunked_uploads, IncompleteUpload
+from app.services.alert_projection import (
+    alert_projection,
+    record_from_peticion,
+    alerta_radar,
+    mision_profesional
+)
+from app.services.radar_feed import radar_feed, format_sse, EVENTO_REINICIO
+from app.services.professional_locator import professional_locator, eta_minutos
+from app.services.location_history import location_history
+from app.services.mission_notifier import mission_notifier
+from app.services.triage_queue import triage_queue, TriageQueue
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -30,6 +64,93 @@ class DespachoRequest(BaseModel):
 class FinalizarMisionRequest(BaseModel):
     informe: str
     foto_base64: Optional[str] = None
+class IniciarSubidaAudioRequest(BaseModel):
+    total_bytes: int = Field(..., gt=0, le=settings.MAX_AUDIO_UPLOAD_BYTES)
+    filename: Optional[str] = None
+class PosicionProfesionalRequest(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    accuracy: Optional[float] = None
+    # Epoch en ms del GPS del celular, acotado a lo que datetime puede representar
+    timestamp: Optional[int] = Field(None, ge=0, le=253402300799999)
+
+# Cada cuánto se manda un comentario SSE para que los proxies no corten la conexión
+RADAR_KEEPALIVE_SECONDS = 15
+# Máximo que una app de profesional puede quedar esperando en el long-poll de /mision
+MISION_ESPERA_MAXIMA_SECONDS = 60
+
+# Reportes ya registrados, por clave de idempotencia (los reintentos no tocan la BD)
+reportes_recientes = TTLCache(
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS
+)
+
+# Primera página de /history por usuario: (limit, respuesta). Un reporte
+# nuevo del usuario la invalida.
+historial_usuarios = TTLCache(
+    max_entries=settings.HISTORY_CACHE_SIZE,
+    ttl_seconds=settings.HISTORY_CACHE_TTL_SECONDS
+)
+
+# Alertas enviadas por usuario en la ventana de EMERGENCY_RATE_LIMIT_SECONDS.
+# /report la actualiza y /alert/status responde desde aquí; tras un reinicio
+# cada usuario se siembra desde la BD en su primera consulta. Es por proceso:
+# no ve los reportes que atienden otros workers.
+limitador_alertas = RateLimiter(
+    max_requests=1,
+    window_seconds=settings.EMERGENCY_RATE_LIMIT_SECONDS
+)
+
+def _clave_idempotencia(user_id: UUID, header_key: Optional[str]) -> Optional[str]:
+    """
+    Clave de idempotencia del reporte: solo la cabecera Idempotency-Key que
+    manda la app (sin cabecera, cada reporte es una alerta nueva; una clave
+    derivada del contenido podría descartar una segunda alerta real). Se
+    combina con el usuario y se guarda como SHA-256 para que las claves de
+    distintos usuarios no choquen.
+    """
+    if not header_key:
+        return None
+    return hashlib.sha256(f"{user_id}:{header_key}".encode("utf-8")).hexdigest()
+
+def _registrar_reporte(db: Session, **kwargs) -> Tuple[str, List[Peticion]]:
+    """
+    Crear las peticiones del reporte y actualizar la proyección (corre en el threadpool).
+    Retorna el ID del reporte y las peticiones creadas (vacías si era un reintento).
+    """
+    idempotency_key = kwargs.get("idempotency_key")
+    try:
+        peticiones = crud_peticion.create_emergency_report(db, **kwargs)
+    except IntegrityError:
+        # Reintento concurrente del mismo reporte: ya lo guardó otra request
+        existente = None
+        if idempotency_key:
+            existente = crud_peticion.get_report_id_by_idempotency_key(db, idempotency_key=idempotency_key)
+        if existente is None:
+            raise
+        return str(existente), []
+
+    alert_projection.apply_created([record_from_peticion(p) for p in peticiones])
+    limitador_alertas.record(str(kwargs["user_id"]), peticiones[0].creado_en)
+    historial_usuarios.delete(str(kwargs["user_id"]))
+    return str(peticiones[0].id), peticiones
+
+def _alertas_activas(db: Session) -> List[dict]:
+    """Alertas activas desde la proyección en memoria (o la BD si no está lista)"""
+    if alert_projection.ready:
+        return [alerta_radar(record) for record in alert_projection.active_alerts()]
+    return [alerta_radar(record_from_peticion(p)) for p in crud_peticion.get_alertas_activas(db)]
+
+def _alertas_activas_por_id(db: Session, ids: List[str]) -> List[dict]:
+    """De los IDs dados, las alertas que siguen activas"""
+    if alert_projection.ready:
+        records = [alert_projection.get_alert(alerta_id) for alerta_id in ids]
+        return [alerta_radar(record) for record in records if record is not None]
+    return [
+        alerta_radar(record_from_peticion(p))
+        for p in crud_peticion.get_by_ids(db, ids=ids)
+        if p.estado_code in ESTADOS_ACTIVOS
+    ]
 
 @router.get("/alert/status")
 def get_alert_status(
@@ -39,19 +160,28 @@ def get_alert_status(
     """
     Verificar el estado de alertas del usuario.
     Indica si puede enviar una alerta o cuánto debe esperar.
+
+    Responde desde el limitador en memoria de este proceso; si el usuario no
+    tiene entrada (primera consulta tras un reinicio, o sus reportes los
+    atendió otro worker) se siembra con sus reportes recientes de la BD.
+    Con varios workers, un reporte que llega a otro proceso después de la
+    siembra no se ve aquí hasta que la limpieza periódica olvida la entrada:
+    la respuesta es orientativa.
     """
-    can_send = crud_peticion.can_send_alert(db, user_id=current_user.id)
-    recent_count = crud_peticion.get_recent_peticion_count(
-        db, 
-        user_id=current_user.id, 
-        minutes=1
-    )
-    
-    wait_seconds = 0 if can_send else (60 - recent_count * 60)
+    user_id = str(current_user.id)
+
+    if not limitador_alertas.is_tracked(user_id):
+        limitador_alertas.seed(user_id, crud_peticion.get_recent_report_times(
+            db,
+            user_id=user_id,
+            seconds=limitador_alertas.window_seconds
+        ))
+
+    can_send, wait_seconds, recent_count = limitador_alertas.peek(user_id)
     
     return {
         "can_send_alert": can_send,
-        "wait_seconds": max(0, wait_seconds),
+        "wait_seconds": wait_seconds,
         "recent_alerts": recent_count,
         "message": "Puedes enviar una alerta" if can_send else f"Espera {wait_seconds} segundos"
     }
@@ -60,125 +190,368 @@ def get_alert_status(
 def get_emergency_history(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
-    limit: int = 10
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
     """
-    Obtener historial de alertas enviadas por el usuario.
+    Obtener historial de alertas enviadas por el usuario, de la más reciente
+    a la más antigua. Para la siguiente página se envía `next_cursor` como
+    `cursor`.
+
+    Es una sola consulta por página (contacto y ubicación por JOIN). La
+    primera página queda en caché por usuario hasta su próximo reporte o
+    HISTORY_CACHE_TTL_SECONDS.
     """
-    peticiones = crud_peticion.get_user_peticiones(
+    user_key = str(current_user.id)
+    if cursor is None:
+        cached = historial_usuarios.get(user_key)
+        if cached is not None and cached[0] == limit:
+            return cached[1]
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    filas = crud_peticion.get_user_history(
         db=db,
         user_id=current_user.id,
+        after=after,
         limit=limit
     )
-    
-    return {
-        "total": len(peticiones),
+
+    next_cursor = None
+    if len(filas) == limit:
+        next_cursor = encode_cursor(filas[-1].creado_en, filas[-1].id)
+
+    respuesta = {
+        "total": len(filas),
         "alerts": [
             {
                 "id": str(p.id),
-                "contact": p.contacto.nombre if p.contacto else "Desconocido",
+                "contact": p.contacto_nombre or "Desconocido",
                 "status": p.estado_code,
                 "sent_at": p.creado_en,
                 "location": {
-                    "address": p.ubicacion.direccion if p.ubicacion else None,
-                    "latitude": float(p.ubicacion.latitud) if p.ubicacion else None,
-                    "longitude": float(p.ubicacion.longitud) if p.ubicacion else None
-                } if p.ubicacion else None
+                    "address": p.direccion,
+                    "latitude": float(p.latitud),
+                    "longitude": float(p.longitud)
+                } if p.latitud is not None else None
             }
-            for p in peticiones
-        ]
+            for p in filas
+        ],
+        "next_cursor": next_cursor
     }
+    if cursor is None:
+        historial_usuarios.set(user_key, (limit, respuesta))
+    return respuesta
 # Endpoint para recibir alertas de emergencia desde la app móvil
 @router.post("/report")
 async def report_emergency_alert(
     *,
     db: Session = Depends(get_db),
     report_request: EmergencyReportRequest,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     """
     Recibir reporte de alerta de emergencia enviada desde la aplicación móvil.
+
+    El trabajo de BD corre en el threadpool para no frenar el event loop. El
+    reporte se guarda y se confirma de inmediato; si trae audio, se decodifica
+    a disco, queda en estado "pendiente" y la subida se registra en el outbox
+    en la misma transacción (el MediaWorker lo sube y lo asocia después).
+
+    Los reintentos con la misma Idempotency-Key devuelven el report_id
+    original sin crear nuevas peticiones. Sin la cabecera no se deduplica.
+    """
+    audio_path = None
+    if report_request.audio:
+        try:
+            audio_path = await run_in_threadpool(spool_base64, report_request.audio, suffix=".m4a")
+        except (ValueError, binascii.Error):
+            logger.warning(f"Audio inválido en el reporte del usuario {current_user.id}; se registra sin audio")
+    return await _reportar_con_audio(db, current_user, report_request, idempotency_key, audio_path)
+
+# Variante multipart: el audio viaja como archivo, no como base64 dentro del JSON
+@router.post("/report/multipart")
+async def report_emergency_alert_multipart(
+    *,
+    request: Request,
+    db: Session = Depends(get_db),
+    datos: str = Form(..., description="EmergencyReportRequest en JSON (sin audio)"),
+    audio: Optional[UploadFile] = File(None),
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """
+    Igual que /report, con el audio como parte multipart/form-data.
+
+    El archivo se copia a disco por partes (tope MAX_AUDIO_UPLOAD_BYTES) y el
+    MediaWorker lo sube por partes desde ahí: la memoria por request no
+    depende de la duración de la grabación.
+    """
+    _verificar_tamano(request, settings.MAX_AUDIO_UPLOAD_BYTES)
+    try:
+        report_request = EmergencyReportRequest.model_validate_json(datos)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    audio_path = None
+    if audio is not None:
+        audio_path = await _guardar_archivo(audio, settings.MAX_AUDIO_UPLOAD_BYTES)
+    return await _reportar_con_audio(db, current_user, report_request, idempotency_key, audio_path)
+
+async def _reportar_con_audio(
+    db: Session,
+    current_user: User,
+    report_request: EmergencyReportRequest,
+    idempotency_key: Optional[str],
+    audio_path: Optional[str]
+) -> dict:
+    audio_encolado = False
+    try:
+        respuesta, audio_encolado = await _procesar_reporte(
+            db, current_user, report_request, idempotency_key, audio_path
+        )
+        return respuesta
+    finally:
+        if audio_encolado:
+            outbox_worker.wake()
+        elif audio_path:
+            # Si el audio no se encoló (reintento o error), el archivo ya no sirve
+            discard(audio_path)
+
+# ----------- Subida reanudable del audio de un reporte -----------
+# 1. POST /report/{report_id}/audio            -> upload_id y tamaño de cada parte
+# 2. PUT  /audio/subidas/{upload_id}/{indice}   -> cuerpo crudo de la parte (se puede repetir)
+#    GET  /audio/subidas/{upload_id}            -> partes recibidas / faltantes (para reanudar)
+# 3. POST /audio/subidas/{upload_id}/finalizar  -> une las partes y encola la subida a Cloudinary
+
+def _estado_subida(manifest: dict) -> dict:
+    recibidas = chunked_uploads.received(manifest) if not manifest["finalizada"] else []
+    return {
+        "upload_id": manifest["upload_id"],
+        "report_id": manifest["report_id"],
+        "chunk_bytes": manifest["chunk_bytes"],
+        "total_chunks": manifest["total_chunks"],
+        "recibidas": recibidas,
+        "faltantes": sorted(set(range(manifest["total_chunks"])) - set(recibidas))
+            if not manifest["finalizada"] else [],
+        "finalizada": manifest["finalizada"]
+    }
+
+def _subida_del_usuario(upload_id: str, token_data: dict) -> dict:
+    manifest = chunked_uploads.get(upload_id)
+    if manifest is None or manifest["usuario_id"] != token_data.get("sub"):
+        raise HTTPException(status_code=404, detail="Subida no encontrada")
+    return manifest
+
+@router.post("/report/{report_id}/audio")
+def iniciar_subida_audio(
+    report_id: str,
+    payload: IniciarSubidaAudioRequest,
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Iniciar la subida por partes del audio de un reporte ya registrado.
+    Pensado para conexiones inestables: si se corta, solo se reenvían las
+    partes que faltan.
+    """
+    try:
+        peticion_ids = crud_peticion.get_report_peticion_ids(
+            db, report_id=UUID(report_id), user_id=token_data.get("sub")
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido")
+    if not peticion_ids:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+
+    manifest = chunked_uploads.create(
+        report_id=report_id,
+        usuario_id=token_data.get("sub"),
+        peticion_ids=[str(peticion_id) for peticion_id in peticion_ids],
+        total_bytes=payload.total_bytes,
+        chunk_bytes=settings.AUDIO_UPLOAD_CHUNK_BYTES,
+        filename=payload.filename
+    )
+    # El audio se marca pendiente recién al finalizar: una subida abandonada
+    # no deja el reporte esperando ni pisa un audio que ya estaba listo
+    return _estado_subida(manifest)
+
+@router.get("/audio/subidas/{upload_id}")
+def get_estado_subida_audio(upload_id: str, token_data: dict = Depends(get_current_token)):
+    """Partes recibidas y faltantes de una subida (para reanudar)"""
+    return _estado_subida(_subida_del_usuario(upload_id, token_data))
+
+@router.put("/audio/subidas/{upload_id}/{indice}")
+async def subir_parte_audio(
+    upload_id: str,
+    indice: int,
+    request: Request,
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Recibir una parte (cuerpo crudo, application/octet-stream). Se escribe a
+    disco a medida que llega (en el threadpool); reenviar una parte ya
+    recibida la reemplaza. Mientras la subida se finaliza responde 409: las
+    partes ya se están uniendo.
     """
+    manifest = await run_in_threadpool(_subida_del_usuario, upload_id, token_data)
+    if manifest["finalizada"]:
+        raise HTTPException(status_code=409, detail="La subida ya fue finalizada")
+    if not 0 <= indice < manifest["total_chunks"]:
+        raise HTTPException(status_code=400, detail="Índice de parte inválido")
+    if await run_in_threadpool(chunked_uploads.is_finalizing, manifest):
+        raise HTTPException(status_code=409, detail="La subida se está finalizando")
+
+    esperado = chunked_uploads.expected_size(manifest, indice)
+    out, tmp = await run_in_threadpool(chunked_uploads.open_chunk, manifest)
+    escritos = 0
+    try:
+        try:
+            async for data in request.stream():
+                escritos += len(data)
+                if escritos > esperado:
+                    raise HTTPException(status_code=413, detail=f"La parte debe tener {esperado} bytes")
+                await run_in_threadpool(out.write, data)
+        finally:
+            await run_in_threadpool(out.close)
+        if escritos != esperado:
+            raise HTTPException(status_code=400, detail=f"Parte incompleta: {escritos} de {esperado} bytes")
+        if not await run_in_threadpool(chunked_uploads.commit_chunk, manifest, indice, tmp):
+            raise HTTPException(status_code=409, detail="La subida se está finalizando")
+    except BaseException:
+        discard(tmp)
+        raise
+
+    return {"indice": indice, "bytes": escritos}
+
+@router.post("/audio/subidas/{upload_id}/finalizar")
+def finalizar_subida_audio(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Unir las partes (en disco, sin cargarlas en memoria) y encolar la subida
+    del audio en el outbox (misma transacción que marca el audio pendiente).
+    Si faltan partes responde 409 con la lista. Repetir la llamada sobre una
+    subida ya finalizada no vuelve a subir nada.
+    """
+    manifest = _subida_del_usuario(upload_id, token_data)
+    if manifest["finalizada"]:
+        return _estado_subida(manifest)
+
+    if not chunked_uploads.claim_finalize(manifest):
+        raise HTTPException(status_code=409, detail="La subida se está finalizando")
+    try:
+        path = chunked_uploads.assemble(manifest)
+    except IncompleteUpload as e:
+        chunked_uploads.release_finalize(manifest)
+        raise HTTPException(
+            status_code=409,
+            detail={"mensaje": "Faltan partes", "faltantes": e.args[0]}
+        )
+    except Exception:
+        chunked_uploads.release_finalize(manifest)
+        raise
+
+    try:
+        crud_peticion.enqueue_audio(
+            db,
+            peticion_ids=[UUID(peticion_id) for peticion_id in manifest["peticion_ids"]],
+            audio_archivo=path
+        )
+    except Exception:
+        # Las partes siguen en disco: el cliente puede volver a finalizar
+        discard(path)
+        chunked_uploads.release_finalize(manifest)
+        raise
+
+    alert_projection.apply_audio(manifest["peticion_ids"], None, MEDIA_PENDIENTE)
+    chunked_uploads.mark_finalized(manifest)
+    outbox_worker.wake()
+    return _estado_subida(manifest)
+
+def _verificar_tamano(request: Request, max_bytes: int):
+    """Rechazar antes de leer el cuerpo si Content-Length ya supera el tope"""
+    content_length = request.headers.get("content-length")
+    # Margen para los campos del formulario y los separadores multipart
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 1024 * 1024:
+        raise HTTPException(status_code=413, detail="El archivo supera el tamaño máximo permitido")
+
+async def _guardar_archivo(upload: UploadFile, max_bytes: int) -> str:
+    """Copiar el archivo subido a disco (en el threadpool). Responde 413 si es muy grande."""
+    suffix = os.path.splitext(upload.filename or "")[1]
+    try:
+        return await run_in_threadpool(spool_to_disk, upload.file, max_bytes=max_bytes, suffix=suffix)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="El archivo supera el tamaño máximo permitido")
+    finally:
+        await upload.close()
+
+async def _procesar_reporte(
+    db: Session,
+    current_user: User,
+    report_request: EmergencyReportRequest,
+    idempotency_key: Optional[str],
+    audio_path: Optional[str]
+) -> Tuple[dict, bool]:
+    """
+    Registrar el reporte (común a /report y /report/multipart).
+    Retorna la respuesta y si se encoló la subida del audio (`audio_path`).
+    """
+    clave = _clave_idempotencia(current_user.id, idempotency_key)
+    if clave:
+        report_id = reportes_recientes.get(clave)
+        if report_id:
+            logger.info(f"Reintento del reporte {report_id} del usuario {current_user.id}")
+            return {
+                "success": True,
+                "message": "Reporte de alerta registrado exitosamente",
+                "report_id": report_id,
+                "timestamp": datetime.utcnow()
+            }, False
     
     try:
-        # 1. Obtener IDs de contactos válidos (MANTENEMOS TU LÓGICA ORIGINAL)
-        contact_ids = []
-        for contact_data in report_request.contacts:
-            try:
-                contact = crud_contact.get(db=db, id=UUID(contact_data.id))
-                if contact and contact.usuario_id == current_user.id:
-                    contact_ids.append(contact.id)
-            except (ValueError, Exception):
-                continue
+        # 1. Obtener IDs de contactos válidos en una sola consulta
+        contact_ids = await run_in_threadpool(
+            crud_contact.get_owned_ids,
+            db,
+            user_id=current_user.id,
+            ids=[contact_data.id for contact_data in report_request.contacts]
+        )
         
         if not contact_ids:
             logger.warning(f"Usuario {current_user.id} reportó alerta sin contactos válidos")
 
-        # 2. Crear Ubicación en BD (MODIFICADO: Creamos el modelo DB directamente)
-        ubicacion_id = None
-        if report_request.location:
-            ubicacion = Ubicacion(
-                direccion=report_request.location.address or "Ubicación desde dispositivo",
-                latitud=report_request.location.latitude,
-                longitud=report_request.location.longitude
-            )
-            db.add(ubicacion)
-            db.flush() # Para obtener el ID
-            ubicacion_id = ubicacion.id
-        
-                # --- 2. NUEVA LÓGICA DE AUDIO (Insertar antes de crear peticiones) ---
-        audio_url = None
-        if report_request.audio:
-            # El frontend envía el Base64, aquí lo convertimos a URL
-            # Esto puede tardar unos segundos, por eso es bueno que sea async
-            audio_url = storage_service.upload_base64_audio(report_request.audio)
-    # ---------------------------------------------------------------------
-        peticiones = []
+        # 2. Crear ubicación, peticiones y el evento de subida del audio en
+        # una sola transacción, sin esperar a la subida
         report_id = None
-        # 3. Crear peticiones MANUALMENTE para incluir Audio y Mensaje
+        audio_encolado = False
         try:
-            # A. Siempre creamos UNA petición principal para la Central Operativa (Radar)
-            peticion_central = Peticion(
-                usuario_id=current_user.id,
-                contacto_id=None, # No pertenece a un contacto, va a la policía/operador
-                ubicacion_id=ubicacion_id,
-                estado_code="en_triaje", # <-- IMPORTANTE: Este estado lo hace aparecer en el mapa
-                creado_en=datetime.utcnow(),        
+            report_id, peticiones = await run_in_threadpool(
+                _registrar_reporte,
+                db,
+                user_id=current_user.id,
+                contact_ids=contact_ids,
+                location=report_request.location,
                 mensaje=report_request.mensaje or report_request.message,
-                audio=audio_url
+                audio_archivo=audio_path,
+                idempotency_key=clave
             )
-            db.add(peticion_central)
-            peticiones.append(peticion_central)
-
-            # B. Si además hay contactos personales, les creamos su registro
-            for contact_id in contact_ids:
-                peticion_contacto = Peticion(
-                    usuario_id=current_user.id,
-                    contacto_id=contact_id,
-                    ubicacion_id=ubicacion_id,
-                    estado_code="en_triaje",
-                    creado_en=datetime.utcnow(),        
-                    mensaje=report_request.mensaje or report_request.message,
-                    audio=audio_url
-                )
-                db.add(peticion_contacto)
-                peticiones.append(peticion_contacto)
-            
-            db.commit()
-            
-            # Refrescar para obtener IDs y datos
-            for p in peticiones:
-                db.refresh(p)
-
-            if peticiones:
-                report_id = str(peticiones[0].id) # Guardamos el ID de la central
-                
+            # Guardamos el ID de la central para responder a los reintentos
+            if clave:
+                reportes_recientes.set(clave, report_id)
+
+            # 3. El audio se sube en segundo plano (outbox) y se asocia al terminar
+            audio_encolado = bool(audio_path and peticiones)
         except Exception as e:
             logger.error(f"Error creando peticiones para reporte: {e}")
-            try:
-                db.rollback()
-            except:
-                pass
 
         # Log para auditoría
         logger.info(
@@ -192,12 +565,12 @@ async def report_emergency_alert(
             "message": "Reporte de alerta registrado exitosamente",
             "report_id": report_id,
             "timestamp": datetime.utcnow()
-        }
+        }, audio_encolado
         
     except Exception as e:
         logger.error(f"Error procesando reporte de emergencia: {e}")
         try:
-            db.rollback()
+            await run_in_threadpool(db.rollback)
         except:
             pass
         
@@ -206,41 +579,156 @@ async def report_emergency_alert(
             "message": "Alerta enviada correctamente, reporte parcial registrado",
             "report_id": None,
             "timestamp": datetime.utcnow()
-        }
+        }, False
 # 2. Endpoint para obtener alertas para el Radar Web
 @router.get("/activas")
 def get_alertas_activas(
+    request: Request,
+    response: Response,
+    since: Optional[str] = None,
     db: Session = Depends(get_db),
     token_data: dict = Depends(get_current_token)
 ):
-    """Obtiene todas las emergencias que necesitan atención en la central"""
+    """
+    Obtiene todas las emergencias que necesitan atención en la central.
+
+    Con `since` (el cursor devuelto por una llamada anterior, o el id de un
+    evento SSE) devuelve solo las alertas que aparecieron, cambiaron o salieron
+    del conjunto activo desde entonces. Si nada cambió responde 304; el cursor
+    actual viaja también en la cabecera ETag (sirve con If-None-Match).
+    """
     
     # Validar que solo el operador vea esto (Opcional por ahora, recomendado a futuro)
     # if token_data.get("rol") != "Operador_Central": ...
 
-    # Buscar peticiones en estado pendiente o en triaje
-    # Usamos joinedload para traer la ubicación en la misma consulta
-    peticiones = db.query(Peticion).options(joinedload(Peticion.ubicacion)).filter(
-        Peticion.estado_code.in_(["pendiente", "en_triaje"])
-    ).all()
-    
-    resultado = []
-    for p in peticiones:
-        # Extraemos coordenadas si la petición tiene ubicación registrada
-        lat = p.ubicacion.latitud if p.ubicacion else None
-        lng = p.ubicacion.longitud if p.ubicacion else None
-        
-        resultado.append({
-            "id": str(p.id),
-            "usuario_id": str(p.usuario_id),
-            "estado": p.estado_code,
-            "lat": lat,
-            "lng": lng,
-            # Si tienes un campo de fecha, envíalo (ej. p.fecha_creacion), sino envíamos "Ahora"
-            "fecha": "Ahora" 
-        })
-    
-    return resultado
+    # El cursor se lee antes de consultar: un cambio concurrente se repetirá
+    # en la próxima consulta en lugar de perderse
+    cursor = radar_feed.current_cursor()
+    etag = f'"{cursor}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    if since is None:
+        # Buscar peticiones en estado pendiente o en triaje
+        response.headers["ETag"] = etag
+        return _alertas_activas(db)
+
+    changes = radar_feed.changes_since(since)
+    if changes is not None and not changes:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    if changes is None:
+        # Cursor desconocido o vencido: se envía el estado completo
+        return {
+            "cursor": cursor,
+            "completo": True,
+            "alertas": _alertas_activas(db),
+            "eliminadas": []
+        }
+
+    # Volver a leer solo las alertas tocadas
+    changed_ids = list(dict.fromkeys(event["data"]["id"] for event in changes))
+    activas = _alertas_activas_por_id(db, changed_ids)
+    activas_ids = {alerta["id"] for alerta in activas}
+
+    return {
+        "cursor": cursor,
+        "completo": False,
+        "alertas": activas,
+        "eliminadas": [alerta_id for alerta_id in changed_ids if alerta_id not in activas_ids]
+    }
+
+# Cola de triaje: las próximas N alertas a atender
+@router.get("/activas/priorizadas")
+def get_alertas_priorizadas(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Alertas activas en orden de atención según el puntaje de triaje
+    (antigüedad, alertas repetidas del usuario, audio / mensaje y distancia
+    al profesional libre más cercano). Se lee de la cola que se mantiene en
+    memoria; no se reordena en cada request.
+    """
+    cola = triage_queue
+    if not alert_projection.ready:
+        # Sin proyección: armar la cola para esta request desde la BD
+        cola = TriageQueue()
+        cola.replace(
+            [record_from_peticion(p) for p in crud_peticion.get_alertas_activas(db)],
+            busy=[str(p.profesional_id) for p in crud_peticion.get_misiones_activas(db)]
+        )
+
+    items, total = cola.page(offset=offset, limit=limit)
+    return {
+        "total": total,
+        "alertas": [
+            {
+                **alerta_radar(item["record"]),
+                "puntaje": item["puntaje"],
+                "alertas_del_usuario": item["alertas_del_usuario"],
+                "distancia_profesional_km": item["distancia_profesional_km"]
+            }
+            for item in items
+        ]
+    }
+
+@router.get("/activas/stream")
+async def stream_alertas_activas(
+    request: Request,
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_stream_token)
+):
+    """
+    Feed en vivo del radar (Server-Sent Events).
+
+    Envía un evento "snapshot" con las alertas activas y luego un evento por
+    cada alerta creada, despachada, resuelta o con audio actualizado. La BD
+    no se consulta: el snapshot sale de la proyección de alertas activas.
+    """
+    # Suscribirse antes del snapshot para no perder eventos intermedios
+    subscription = radar_feed.subscribe()
+
+    # Si el navegador reconecta con Last-Event-ID se reenvía solo lo perdido
+    replay = radar_feed.changes_since(request.headers.get("last-event-id"))
+    snapshot = None
+    if replay is None:
+        try:
+            cursor = radar_feed.current_cursor()
+            snapshot = await run_in_threadpool(_alertas_activas, db)
+        except Exception:
+            radar_feed.unsubscribe(subscription)
+            raise
+
+    async def event_stream():
+        try:
+            if snapshot is not None:
+                yield format_sse("snapshot", snapshot, cursor)
+            else:
+                for event in replay:
+                    yield format_sse(event["tipo"], event["data"], event["cursor"])
+
+            while not await request.is_disconnected():
+                if subscription.overflowed:
+                    yield format_sse(EVENTO_REINICIO, {"motivo": "consumidor lento"})
+                    break
+
+                event = await subscription.next_event(timeout=RADAR_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event["tipo"], event["data"], event["cursor"])
+        finally:
+            radar_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # 3. Endpoint para que el Operador despache una unidad
 @router.put("/{peticion_id}/despachar")
@@ -250,40 +738,136 @@ def despachar_alerta(
     db: Session = Depends(get_db),
     token_data: dict = Depends(get_current_token)
 ):
-    """Asigna un profesional a la alerta (Máximo 1 misión activa por profesional)"""
-    
-    # 1. Verificar si el profesional ya tiene una misión en curso
-    mision_activa = db.query(Peticion).filter(
-        Peticion.profesional_id == payload.profesional_id,
-        Peticion.estado_code == "despachada"
-    ).first()
-    
-    if mision_activa:
-        raise HTTPException(status_code=400, detail="Este profesional ya tiene una misión en curso.")
+    """
+    Asigna un profesional a la alerta (Máximo 1 misión activa por profesional).
 
-    # 2. Despachar
-    peticion = db.query(Peticion).filter(Peticion.id == peticion_id).first()
-    if not peticion:
+    El despacho es una única actualización atómica en la BD: dos operadores
+    que despachan a la vez nunca asignan dos misiones al mismo profesional
+    ni la misma alerta dos veces. Los conflictos responden 409.
+    """
+    try:
+        peticion_uuid = UUID(peticion_id)
+        profesional_uuid = UUID(payload.profesional_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    resultado, peticion = crud_peticion.dispatch(
+        db,
+        peticion_id=peticion_uuid,
+        profesional_id=profesional_uuid,
+        operador_id=token_data.get("sub")
+    )
+
+    if resultado == DispatchResult.NO_ENCONTRADA:
         raise HTTPException(status_code=404, detail="Emergencia no encontrada")
-        
-    peticion.estado_code = "despachada"
-    peticion.profesional_id = payload.profesional_id
-    peticion.operador_id = token_data.get("sub") 
-    
-    db.commit()
-    return {"message": "Unidad despachada", "estado": peticion.estado_code}
+    if resultado == DispatchResult.PROFESIONAL_NO_ENCONTRADO:
+        raise HTTPException(status_code=404, detail="Profesional no encontrado")
+    if resultado == DispatchResult.PROFESIONAL_OCUPADO:
+        raise HTTPException(status_code=409, detail="Este profesional ya tiene una misión en curso.")
+    if resultado == DispatchResult.NO_DESPACHABLE:
+        raise HTTPException(status_code=409, detail="La emergencia ya fue despachada o cerrada.")
+
+    alert_projection.apply_dispatched(record_from_peticion(peticion))
+    return {"message": "Unidad despachada", "estado": ESTADO_DESPACHADA}
+
+# Recomendación: profesionales libres más cercanos a la alerta
+@router.get("/{peticion_id}/profesionales-cercanos")
+def get_profesionales_cercanos(
+    peticion_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Profesionales ordenados por distancia (y tiempo estimado de llegada) a la
+    ubicación de la alerta, sin los que ya tienen una misión despachada.
+    Se calcula sobre el índice en memoria de sus últimas posiciones.
+    """
+    record = alert_projection.get_alert(peticion_id) if alert_projection.ready else None
+    if record is None:
+        try:
+            peticiones = crud_peticion.get_by_ids(db, ids=[UUID(peticion_id)])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ID inválido")
+        if not peticiones:
+            raise HTTPException(status_code=404, detail="Emergencia no encontrada")
+        record = record_from_peticion(peticiones[0])
+
+    if record["lat"] is None or record["lng"] is None:
+        raise HTTPException(status_code=422, detail="La emergencia no tiene ubicación")
+
+    if alert_projection.ready:
+        ocupados = alert_projection.busy_professionals()
+    else:
+        ocupados = [str(p.profesional_id) for p in crud_peticion.get_misiones_activas(db)]
+
+    cercanos = professional_locator.nearest(
+        record["lat"],
+        record["lng"],
+        limit=limit,
+        max_km=settings.DISPATCH_SEARCH_RADIUS_KM,
+        exclude=ocupados
+    )
+    nombres = crud_user.get_full_names(db, [profesional_id for profesional_id, _, _ in cercanos])
+
+    return [
+        {
+            "profesional_id": profesional_id,
+            "nombre": nombres.get(profesional_id),
+            "distancia_km": round(distancia, 2),
+            "eta_minutos": eta_minutos(distancia),
+            "posicion_actualizada": actualizado_en
+        }
+        for profesional_id, distancia, actualizado_en in cercanos
+    ]
+
 # 4. Endpoint para obtener el historial completo de emergencias (para auditoría de tiempos)
 @router.get("/historial")
 def get_historial_alertas(
     db: Session = Depends(get_db),
-    # token_data: dict = Depends(get_current_token) # Opcional: Proteger para admins
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    estado: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    profesional_id: Optional[UUID] = None,
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    token_data: Optional[dict] = Depends(get_optional_token)
 ):
-    """Obtiene el historial completo de emergencias para auditoría de tiempos"""
-    # Obtenemos todas las peticiones ordenadas de la más reciente a la más antigua
-    peticiones = db.query(Peticion).order_by(Peticion.creado_en.desc()).all()
+    """
+    Obtiene el historial de emergencias para auditoría de tiempos.
+
+    - formato=json: una página de `limit` filas, de la más reciente a la más
+      antigua, con IDs truncados. Para la siguiente página se envía
+      `next_cursor` como `cursor`.
+    - formato=ndjson / csv: exportación completa en streaming con memoria
+      constante (cursor del lado del servidor), con IDs completos. Solo
+      para operadores de la central (401 sin token, 403 con otro rol).
+
+    Filtros opcionales: estado, rango de fechas [desde, hasta) y profesional.
+    """
+    filtros = {
+        "estado": estado,
+        "desde": desde,
+        "hasta": hasta,
+        "profesional_id": profesional_id
+    }
+
+    if formato != "json":
+        _exigir_operador(db, token_data)
+        return _exportar_historial(formato, filtros)
+
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    filas = crud_peticion.get_historial_page(db, after=after, limit=limit, **filtros)
     
     resultado = []
-    for p in peticiones:
+    for p in filas:
         resultado.append({
             "id": str(p.id)[:8], # Solo los primeros 8 caracteres para que la tabla sea legible
             "estado": p.estado_code,
@@ -291,69 +875,342 @@ def get_historial_alertas(
             "victima_id": str(p.usuario_id)[:8],
             "profesional_id": str(p.profesional_id)[:8] if p.profesional_id else "Sin asignar"
         })
-    return resultado
+
+    next_cursor = None
+    if len(filas) == limit:
+        next_cursor = encode_cursor(filas[-1].creado_en, filas[-1].id)
+
+    return {"items": resultado, "next_cursor": next_cursor}
+
+def _exigir_operador(db: Session, token_data: Optional[dict]):
+    """401 sin token; 403 si el usuario no es un operador activo de la central"""
+    if token_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Se requiere autenticación",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    user = None if token_data.get("is_anonymous") else crud_user.get_user(db, token_data.get("sub"))
+    if user is None or not user.is_active or user.rol != RolUsuarioEnum.OPERADOR_CENTRAL.value:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo para operadores de la central")
+
+HISTORIAL_COLUMNAS = ["id", "estado", "fecha_creacion", "fecha_finalizacion", "victima_id", "profesional_id"]
+
+def _exportar_historial(formato: str, filtros: dict) -> StreamingResponse:
+    """Exportar el historial completo en NDJSON o CSV, fila por fila"""
+
+    def filas():
+        # Sesión propia: vive lo que dura la descarga, no la request
+        db = SessionLocal()
+        try:
+            for p in crud_peticion.iter_historial(db, **filtros):
+                yield {
+                    "id": str(p.id),
+                    "estado": p.estado_code,
+                    "fecha_creacion": p.creado_en.isoformat() if p.creado_en else None,
+                    "fecha_finalizacion": p.finalizado_en.isoformat() if p.finalizado_en else None,
+                    "victima_id": str(p.usuario_id),
+                    "profesional_id": str(p.profesional_id) if p.profesional_id else None
+                }
+        finally:
+            db.close()
+
+    if formato == "ndjson":
+        contenido = (json.dumps(fila, ensure_ascii=False) + "\n" for fila in filas())
+        return StreamingResponse(contenido, media_type="application/x-ndjson")
+
+    def csv_lineas():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=HISTORIAL_COLUMNAS)
+        writer.writeheader()
+        for fila in filas():
+            writer.writerow(fila)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    return StreamingResponse(
+        csv_lineas(),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=historial_emergencias.csv"}
+    )
+
+# ----------- Auditoría: línea de tiempo y tiempos de respuesta -----------
+@router.get("/{peticion_id}/timeline")
+def get_timeline_alerta(
+    peticion_id: str,
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Cambios de estado de una alerta, en orden, con los segundos desde su
+    creación. Se lee del registro de transiciones (puede demorar hasta
+    TRANSITION_LOG_FLUSH_SECONDS en incluir el último cambio).
+    """
+    try:
+        transiciones = crud_transicion.get_timeline(db, peticion_id=UUID(peticion_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID inválido")
+    if not transiciones:
+        raise HTTPException(status_code=404, detail="Sin historial para esta emergencia")
+
+    inicio = transiciones[0].registrado_en
+    primera = {}
+    for t in transiciones:
+        primera.setdefault(t.estado_code, t.registrado_en)
+
+    def segundos_hasta(estado: str) -> Optional[float]:
+        return (primera[estado] - inicio).total_seconds() if estado in primera else None
+
+    return {
+        "peticion_id": peticion_id,
+        "segundos_hasta_despacho": segundos_hasta(ESTADO_DESPACHADA),
+        "segundos_hasta_resolucion": segundos_hasta(ESTADO_RESUELTA),
+        "transiciones": [
+            {
+                "estado": t.estado_code,
+                "registrado_en": t.registrado_en,
+                "segundos": (t.registrado_en - inicio).total_seconds(),
+                "usuario_id": str(t.usuario_id) if t.usuario_id else None,
+                "profesional_id": str(t.profesional_id) if t.profesional_id else None
+            }
+            for t in transiciones
+        ]
+    }
+
+@router.get("/sla")
+def get_sla(
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Tiempos de respuesta (p50 / p90 / máximo, en segundos) hasta el despacho
+    y la resolución de las alertas creadas en el período. Por defecto, las
+    últimas 24 horas.
+    """
+    hasta = hasta or datetime.utcnow()
+    desde = desde or hasta - timedelta(days=1)
+    if desde >= hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+    return {"desde": desde, "hasta": hasta, **crud_transicion.get_sla(db, desde=desde, hasta=hasta)}
+
 # ----------- App Profesional: Consultar Misión Asignada -----------
+def _mision_de(profesional_id: str) -> Optional[dict]:
+    """Misión en curso del profesional (en memoria si es posible)"""
+    if alert_projection.ready:
+        return alert_projection.mission_for(profesional_id)
+
+    # Sesión propia y breve: la request puede quedar esperando sin retener conexión
+    db = SessionLocal()
+    try:
+        peticion = crud_peticion.get_mision_activa(db, profesional_id=profesional_id)
+        return record_from_peticion(peticion) if peticion else None
+    finally:
+        db.close()
+
 @router.get("/mision")
-def get_mision_actual(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_mision_actual(
+    espera: int = Query(0, ge=0, le=MISION_ESPERA_MAXIMA_SECONDS),
+    mision_id: Optional[str] = None,
+    token_data: dict = Depends(get_current_token)
 ):
     """
     El celular del profesional consulta si tiene alguna víctima asignada.
+
+    Long-poll: con `espera` > 0 la request queda abierta hasta `espera`
+    segundos mientras la misión siga siendo `mision_id` (la que ya conoce la
+    app; sin él, "ninguna"), y responde apenas el despacho o la resolución la
+    cambian. Esperar no consulta la BD: lo despierta mission_notifier.
     """
-    # Buscamos la primera petición despachada a este profesional
-    peticion = db.query(Peticion).options(joinedload(Peticion.ubicacion)).filter(
-        Peticion.profesional_id == str(current_user.id),
-        Peticion.estado_code == "despachada"
-    ).first()
+    if token_data.get("is_anonymous"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Se requiere usuario registrado")
+    profesional_id = token_data.get("sub")
 
-    if not peticion:
+    # Registrarse antes de leer: un despacho entre la lectura y la espera no se pierde
+    cambio = mission_notifier.register(profesional_id)
+    try:
+        record = await run_in_threadpool(_mision_de, profesional_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + espera
+        while (record["id"] if record else None) == mision_id:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(cambio.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            cambio.clear()
+            record = await run_in_threadpool(_mision_de, profesional_id)
+    finally:
+        mission_notifier.unregister(profesional_id, cambio)
+
+    if not record:
         return None # Devuelve null/None si está libre y patrullando
     
     # Si tiene misión, devolvemos las coordenadas de la víctima
-    lat = peticion.ubicacion.latitud if peticion.ubicacion else None
-    lng = peticion.ubicacion.longitud if peticion.ubicacion else None
-        
-    return {
-        "mision_id": str(peticion.id),
-        "victima_id": str(peticion.usuario_id),
-        "lat": lat,
-        "lng": lng,
-        "mensaje": peticion.mensaje or "Emergencia (Botón de Pánico)",
-        "estado": peticion.estado_code
-    }
+    return mision_profesional(record)
+
+# ----------- App Profesional: Informar Posición -----------
+@router.put("/profesional/ubicacion")
+async def actualizar_posicion_profesional(
+    payload: PosicionProfesionalRequest,
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    El celular del profesional informa su posición cada pocos segundos.
+
+    No toca la BD: actualiza la última posición en memoria (que también marca
+    al profesional como en línea) y, muestreada, la encola para el recorrido
+    que se escribe en lote.
+    """
+    if token_data.get("is_anonymous"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Se requiere usuario registrado")
+    profesional_id = token_data.get("sub")
+    registrado_en = (
+        datetime.utcfromtimestamp(payload.timestamp / 1000)
+        if payload.timestamp else datetime.utcnow()
+    )
+    professional_locator.update(profesional_id, payload.latitude, payload.longitude, registrado_en)
+    location_history.record(
+        profesional_id,
+        payload.latitude,
+        payload.longitude,
+        registrado_en,
+        precision_m=payload.accuracy
+    )
+    return {"status": "ok"}
+
+# ----------- Radar: Profesionales en línea -----------
+@router.get("/profesionales/en-linea")
+def get_profesionales_en_linea(token_data: dict = Depends(get_current_token)):
+    """Profesionales que informaron su posición dentro del último heartbeat"""
+    return [
+        {
+            "profesional_id": profesional_id,
+            "lat": lat,
+            "lng": lng,
+            "posicion_actualizada": actualizado_en
+        }
+        for profesional_id, lat, lng, actualizado_en in professional_locator.online()
+    ]
+
 @router.put("/{peticion_id}/resolver")
 def resolver_mision(
     peticion_id: str, 
     payload: FinalizarMisionRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
+):
+    """
+    Marca una emergencia como resuelta y guarda el informe en su tabla.
+    Solo la puede cerrar el profesional que tiene asignada la misión.
+    """
+    profesional_id = _profesional_registrado(token_data)
+    foto_path = None
+    if payload.foto_base64:
+        try:
+            foto_path = spool_base64(payload.foto_base64, suffix=".jpg")
+        except (ValueError, binascii.Error):
+            logger.warning(f"Foto inválida en el informe de {peticion_id}; se guarda sin foto")
+    return _resolver_con_foto(db, peticion_id, profesional_id, payload.informe, foto_path)
+
+# Variante multipart: la foto viaja como archivo, no como base64 dentro del JSON
+@router.put("/{peticion_id}/resolver/multipart")
+async def resolver_mision_multipart(
+    peticion_id: str,
+    request: Request,
+    informe: str = Form(...),
+    foto: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
+    token_data: dict = Depends(get_current_token)
 ):
-    """Marca una emergencia como resuelta y guarda el informe en su tabla."""
+    """
+    Igual que /resolver, con la foto como parte multipart/form-data. Se copia
+    a disco por partes (tope MAX_IMAGE_UPLOAD_BYTES) y se sube desde ahí.
+    """
+    profesional_id = _profesional_registrado(token_data)
+    _verificar_tamano(request, settings.MAX_IMAGE_UPLOAD_BYTES)
+    foto_path = None
+    if foto is not None:
+        foto_path = await _guardar_archivo(foto, settings.MAX_IMAGE_UPLOAD_BYTES)
+
+    return await run_in_threadpool(_resolver_con_foto, db, peticion_id, profesional_id, informe, foto_path)
+
+def _profesional_registrado(token_data: dict) -> str:
+    """ID del profesional que llama (los anónimos no resuelven misiones)"""
+    if token_data.get("is_anonymous"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Se requiere usuario registrado")
+    return token_data.get("sub")
+
+def _resolver_con_foto(
+    db: Session,
+    peticion_id: str,
+    profesional_id: str,
+    informe: str,
+    foto_path: Optional[str]
+) -> dict:
+    try:
+        _resolver(db, peticion_id, profesional_id, informe, foto_archivo=foto_path)
+    except Exception:
+        if foto_path:
+            discard(foto_path)
+        raise
+    if foto_path:
+        outbox_worker.wake()
+    return {"mensaje": "Misión finalizada con éxito y reporte guardado", "estado": "resuelta"}
+
+def _resolver(
+    db: Session,
+    peticion_id: str,
+    profesional_id: str,
+    informe: str,
+    *,
+    foto_archivo: Optional[str] = None
+) -> UUID:
+    """
+    Cerrar la petición y crear su informe. Con `foto_archivo`, el evento de
+    subida de la foto va al outbox en la misma transacción. Retorna el ID del
+    informe. 403 si la misión no está asignada a `profesional_id`.
+    """
     peticion = db.query(Peticion).filter(Peticion.id == peticion_id).first()
     
     if not peticion:
         raise HTTPException(status_code=404, detail="Misión no encontrada")
+    if peticion.profesional_id is None or str(peticion.profesional_id) != profesional_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="La misión no está asignada a este profesional")
         
-    foto_url = None
-    if payload.foto_base64:
-        try:
-            # Usamos la nueva función dedicada a imágenes
-            foto_url = storage_service.upload_base64_image(payload.foto_base64) 
-        except Exception as e:
-            print(f"Error subiendo foto a Cloudinary: {e}")
-
-    # 1. Crear el registro en la nueva tabla normalizada
+    # 1. Crear el registro en la nueva tabla normalizada.
+    # La foto se sube en segundo plano para no hacer esperar al profesional.
     nuevo_informe = InformeMision(
+        id=uuid.uuid4(),
         peticion_id=peticion.id,
-        detalle_resolucion=payload.informe,
-        foto_url=foto_url
+        detalle_resolucion=informe,
+        foto_estado=MEDIA_PENDIENTE if foto_archivo else None
     )
     db.add(nuevo_informe)
+    if foto_archivo:
+        crud_outbox.add(
+            db,
+            tipo=EVENTO_FOTO_INFORME,
+            payload={"informe_id": str(nuevo_informe.id), "archivo": foto_archivo}
+        )
 
     # 2. Actualizar el estado de la Petición
-    peticion.estado_code = "resuelta"
+    peticion.estado_code = ESTADO_RESUELTA
     peticion.finalizado_en = datetime.utcnow()
+    resuelta_id = str(peticion.id)
+    transicion = {
+        "central": peticion.contacto_id is None,
+        "profesional_id": peticion.profesional_id,
+        "registrado_en": peticion.finalizado_en
+    }
     
     db.commit()
-    
-    return {"mensaje": "Misión finalizada con éxito y reporte guardado", "estado": "resuelta"}
+
+    transition_log.record(resuelta_id, ESTADO_RESUELTA, **transicion)
+    alert_projection.apply_resolved(resuelta_id)
+    return nuevo_informe.id
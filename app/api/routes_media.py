@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+import os
+
+from app.api.deps import get_stream_token
+from app.core.config import settings
+from app.services.storage_service import LocalStorage, storage_service
+
+router = APIRouter()
+
+@router.get("/{tipo}/{nombre}")
+def get_media(tipo: str, nombre: str, token_data: dict = Depends(get_stream_token)):
+    """
+    Servir un audio o foto guardado con STORAGE_BACKEND=local.
+
+    Requiere token (cabecera o ?access_token=..., como el radar: un <audio>
+    no puede mandar cabeceras). Acepta el header Range (206 Partial
+    Content), así los reproductores piden solo la parte del audio que van a
+    reproducir. Es multimedia de emergencias: solo se cachea en el
+    navegador de quien la pidió, nunca en proxies compartidos.
+    """
+    backend = storage_service.backend
+    path = backend.path_for(tipo, nombre) if isinstance(backend, LocalStorage) else None
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Archivo no encontrado")
+
+    return FileResponse(
+        path,
+        headers={"Cache-Control": f"private, max-age={settings.LOCAL_MEDIA_CACHE_SECONDS}"}
+    )
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from app.core.metrics import metrics
+
+class CircuitBreaker:
+    """
+    Circuit breaker en memoria para un proveedor externo.
+
+    Cerrado: las llamadas pasan. Tras `failure_threshold` fallas seguidas se
+    abre y durante `reset_seconds` rechaza todo al instante (sin esperar el
+    timeout del proveedor). Pasado ese tiempo queda semiabierto: deja pasar
+    una sola llamada de prueba; si sale bien se cierra, si falla vuelve a
+    abrirse.
+
+    Uso:
+        if not breaker.allow():
+            ...  # fallar rápido
+        try:
+            llamar_al_proveedor()
+        except Exception:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CERRADO
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.ABIERTO and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = self.SEMIABIERTO
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """True si la llamada puede intentarse ahora"""
+        with self.lock:
+            state = self._current_state()
+            if state == self.CERRADO:
+                return True
+            if state == self.SEMIABIERTO and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+        metrics.incr(f"circuit.{self.name}.rechazadas")
+        return False
+
+    def record_success(self):
+        with self.lock:
+            if self._state != self.CERRADO:
+                metrics.set_gauge(f"circuit.{self.name}.abierto", 0)
+            self._state = self.CERRADO
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self._failures += 1
+            if self._state == self.SEMIABIERTO or self._failures >= self.failure_threshold:
+                if self._state != self.ABIERTO:
+                    metrics.incr(f"circuit.{self.name}.aperturas")
+                self._state = self.ABIERTO
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                metrics.set_gauge(f"circuit.{self.name}.abierto", 1)
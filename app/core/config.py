@@ -2,6 +2,7 @@ from pydantic import PostgresDsn, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional, Any
 import os
+import tempfile
 
 class Settings(BaseSettings):
     # Nombre del proyecto
@@ -45,11 +46,49 @@ class Settings(BaseSettings):
     TWILIO_ACCOUNT_SID: Optional[str] = os.getenv("TWILIO_ACCOUNT_SID")
     TWILIO_AUTH_TOKEN: Optional[str] = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_PHONE_NUMBER: Optional[str] = os.getenv("TWILIO_PHONE_NUMBER")
+    # Segunda cuenta/número de Twilio para el failover (SMS_PROVIDERS="twilio,twilio_secundario")
+    TWILIO_SECONDARY_ACCOUNT_SID: Optional[str] = os.getenv("TWILIO_SECONDARY_ACCOUNT_SID")
+    TWILIO_SECONDARY_AUTH_TOKEN: Optional[str] = os.getenv("TWILIO_SECONDARY_AUTH_TOKEN")
+    TWILIO_SECONDARY_PHONE_NUMBER: Optional[str] = os.getenv("TWILIO_SECONDARY_PHONE_NUMBER")
+    SMS_PROVIDERS: str = os.getenv("SMS_PROVIDERS", "twilio")  # En orden de preferencia: twilio, twilio_secundario, fake
+    SMS_FAILOVER_MAX_ERRORS: int = 3  # Fallas seguidas para dejar de usar un proveedor
+    SMS_FAILOVER_RESET_SECONDS: int = 60  # Cuánto se saltea antes de volver a probarlo
+    SMS_FAILOVER_LATENCY_BUDGET_SECONDS: float = 5  # Un envío más lento cuenta como falla
+    SMS_MAX_WORKERS: int = 8  # SMS de una alerta que salen en paralelo
+    SMS_MESSAGE_TIMEOUT_SECONDS: float = 10  # Por pedido HTTP a Twilio
+    SMS_TOTAL_TIMEOUT_SECONDS: float = 20  # Para todos los contactos de una alerta
     
     # Rate Limiting
     EMERGENCY_RATE_LIMIT_SECONDS: int = 60
     MAX_CONTACTS_PER_USER: int = 3
     
+    # Idempotencia de /emergency/report (caché de reintentos recientes)
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL_SECONDS: int = 3600
+    
+    # Radar en vivo: cambios que se recuerdan para consultas delta (?since=)
+    RADAR_CHANGELOG_SIZE: int = 1000
+    # Cada cuánto se compara la proyección de alertas activas contra la BD
+    PROJECTION_CHECK_SECONDS: int = 60
+    
+    # Recomendación de profesionales para despacho
+    LOCATOR_CELL_DEGREES: float = 0.05  # Celdas del índice espacial (~5 km)
+    DISPATCH_SEARCH_RADIUS_KM: float = 50
+    DISPATCH_AVG_SPEED_KMH: float = 40  # Para estimar el tiempo de llegada
+    
+    # Cola de triaje de alertas activas (pesos del puntaje, ver triage_queue)
+    TRIAGE_PESO_MINUTO: float = 1  # Por minuto de antigüedad
+    TRIAGE_PESO_REPETIDA: float = 5  # Por cada otra alerta activa del mismo usuario
+    TRIAGE_PESO_AUDIO: float = 3
+    TRIAGE_PESO_MENSAJE: float = 2
+    TRIAGE_PESO_KM: float = 0.5  # Se resta por km al profesional libre más cercano
+    TRIAGE_REFRESH_SECONDS: int = 15  # Recalcular distancias a los profesionales
+    
+    # Posición de los profesionales (pings del celular)
+    PROFESSIONAL_HEARTBEAT_TTL_SECONDS: int = 60  # Sin ping en este tiempo = fuera de línea
+    LOCATION_HISTORY_SAMPLE_SECONDS: int = 30  # Una posición guardada por profesional cada N s
+    LOCATION_HISTORY_FLUSH_SECONDS: int = 10  # Cada cuánto se escribe el lote en la BD
+    
     # CORS
     BACKEND_CORS_ORIGINS: list = [
         "http://localhost",
@@ -85,6 +124,54 @@ class Settings(BaseSettings):
     CLOUDINARY_CLOUD_NAME: str = os.getenv("CLOUDINARY_CLOUD_NAME", "")
     CLOUDINARY_API_KEY: str = os.getenv("CLOUDINARY_API_KEY", "")
     CLOUDINARY_API_SECRET: str = os.getenv("CLOUDINARY_API_SECRET", "")
+    # Dónde se guarda la multimedia: "cloudinary" o "local" (disco, por hash del contenido)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "cloudinary")
+    LOCAL_MEDIA_DIR: str = os.getenv("LOCAL_MEDIA_DIR", "media")
+    # Prefijo de las URLs de la multimedia local (vacío = URLs relativas al host de la API)
+    MEDIA_PUBLIC_BASE_URL: str = os.getenv("MEDIA_PUBLIC_BASE_URL", "")
+    # Cuánto puede guardar el navegador la multimedia local (caché privada: pide token)
+    LOCAL_MEDIA_CACHE_SECONDS: int = 3600
+    # Subidas multipart: los archivos se copian a disco por partes antes de subirlos.
+    # Los eventos del outbox guardan la ruta: con varios hosts tiene que ser un volumen compartido
+    MEDIA_SPOOL_DIR: str = os.getenv("MEDIA_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "acompaniar_media"))
+    MAX_AUDIO_UPLOAD_BYTES: int = 25 * 1024 * 1024
+    MAX_IMAGE_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    CLOUDINARY_CHUNK_BYTES: int = 6 * 1024 * 1024  # Cloudinary pide partes de al menos 5 MB
+    CLOUDINARY_TIMEOUT_SECONDS: int = 20  # Por cada request HTTP a Cloudinary
+    # Circuit breaker del almacenamiento: se abre tras N fallas seguidas
+    STORAGE_BREAKER_FAILURES: int = 5
+    STORAGE_BREAKER_RESET_SECONDS: int = 30
+    # Compactación de multimedia antes de subirla (pool de procesos)
+    MEDIA_PROCESSING_ENABLED: bool = True
+    MEDIA_PROCESS_WORKERS: int = 2
+    MEDIA_IMAGE_MAX_SIDE: int = 1600  # px del lado mayor
+    MEDIA_IMAGE_JPEG_QUALITY: int = 80
+    MEDIA_IMAGE_TIMEOUT_SECONDS: int = 20
+    MEDIA_AUDIO_MAX_SECONDS: int = 600  # Los audios más largos se suben sin compactar (nunca se recortan)
+    MEDIA_AUDIO_BITRATE: str = "48k"  # Mono AAC (requiere ffmpeg en el servidor)
+    MEDIA_AUDIO_TIMEOUT_SECONDS: int = 60
+    # Outbox transaccional (efectos secundarios del flujo de emergencia). Es
+    # también el único reintento de las subidas de multimedia: backoff
+    # exponencial hasta OUTBOX_MAX_ATTEMPTS (un breaker abierto no gasta intentos)
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_POLL_SECONDS: float = 2
+    OUTBOX_BATCH_SIZE: int = 10
+    OUTBOX_LEASE_SECONDS: int = 300  # Si el worker muere, el evento se retoma después de esto
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETENTION_SECONDS: int = 7 * 24 * 3600  # Se borran los eventos procesados más viejos
+    # Registro de transiciones de estado (se escribe en lote)
+    TRANSITION_LOG_FLUSH_SECONDS: float = 2
+    # Caché de la primera página de /emergency/history por usuario
+    HISTORY_CACHE_SIZE: int = 10000
+    HISTORY_CACHE_TTL_SECONDS: int = 30  # Los cambios de estado se ven como mucho con este atraso
+    # Archivo de peticiones cerradas (tabla particionada peticiones_archivo)
+    ARCHIVE_AFTER_DAYS: int = 30  # Se archivan las cerradas creadas hace más de esto (0 = no archivar)
+    ARCHIVE_BATCH_SIZE: int = 500  # Filas por transacción
+    ARCHIVE_CHECK_SECONDS: int = 3600
+    # Subida reanudable de audios por partes (/emergency/audio/subidas)
+    AUDIO_UPLOAD_CHUNK_BYTES: int = 256 * 1024
+    AUDIO_UPLOAD_TTL_SECONDS: int = 24 * 3600  # Se borran las subidas sin actividad
+    AUDIO_UPLOAD_FINALIZE_TIMEOUT_SECONDS: int = 300  # Un cierre interrumpido se puede reintentar pasado esto
     # --------------------
 
     model_config = SettingsConfigDict(
@@ -0,0 +1,51 @@
+from typing import Any, Dict
+import threading
+
+class Metrics:
+    """
+    Registro simple de métricas en memoria (contadores, gauges y tiempos).
+    Se expone en GET /metrics. En producción, exportar a Prometheus/StatsD.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1):
+        """Sumar al contador `name`"""
+        with self.lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Fijar el valor actual de `name`"""
+        with self.lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Registrar una duración en segundos"""
+        with self.lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia de todas las métricas para serializar"""
+        with self.lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {
+                    name: {
+                        "count": t["count"],
+                        "avg": t["total"] / t["count"] if t["count"] else 0.0,
+                        "max": t["max"]
+                    }
+                    for name, t in self._timings.items()
+                }
+            }
+
+# Instancia global de métricas
+metrics = Metrics()
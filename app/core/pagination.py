@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+import base64
+
+def encode_cursor(creado_en: datetime, id: UUID) -> str:
+    """
+    Cursor opaco para paginación por clave (keyset) sobre (creado_en, id).
+    El cliente lo devuelve tal cual para pedir la página siguiente.
+    """
+    raw = f"{creado_en.isoformat()}|{id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Decodificar un cursor generado por encode_cursor.
+
+    Raises:
+        ValueError: si el cursor no es válido
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        creado_en, _, id = raw.partition("|")
+        return datetime.fromisoformat(creado_en), UUID(id)
+    except Exception as e:
+        raise ValueError("Cursor inválido") from e
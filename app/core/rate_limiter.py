@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Iterable, Optional, Tuple
+import math
 import threading
 
 class RateLimiter:
@@ -46,6 +47,61 @@ class RateLimiter:
             self.requests[key].append(now)
             return True
     
+    def record(self, key: str, at: Optional[datetime] = None):
+        """
+        Registrar una solicitud ya aceptada, sin verificar el límite.
+        Si la clave no tiene estado (p. ej. tras reiniciar) no hace nada:
+        la próxima consulta la siembra desde la fuente persistente (`seed`).
+        """
+        with self.lock:
+            if key in self.requests:
+                self.requests[key].append(at or datetime.utcnow())
+
+    def seed(self, key: str, timestamps: Iterable[datetime]):
+        """Cargar el historial reciente de una clave (arranque en frío)"""
+        with self.lock:
+            window_start = datetime.utcnow() - timedelta(seconds=self.window_seconds)
+            self.requests[key] = sorted(t for t in timestamps if t > window_start)
+
+    def is_tracked(self, key: str) -> bool:
+        """Si la clave tiene estado en memoria"""
+        with self.lock:
+            return key in self.requests
+
+    def peek(self, key: str) -> Tuple[bool, int, int]:
+        """
+        Consultar sin registrar nada.
+
+        Returns:
+            (permitida, segundos de espera, solicitudes en la ventana)
+        """
+        with self.lock:
+            now = datetime.utcnow()
+            window_start = now - timedelta(seconds=self.window_seconds)
+            recent = sorted(t for t in self.requests.get(key, ()) if t > window_start)
+            if key in self.requests:
+                self.requests[key] = recent
+
+            if len(recent) < self.max_requests:
+                return True, 0, len(recent)
+            return False, self._wait_seconds(recent, now), len(recent)
+
+    def _wait_seconds(self, recent: list, now: datetime) -> int:
+        # Se libera un lugar cuando vence la solicitud que deja la ventana en
+        # max_requests - 1 (con max_requests = 1, la más reciente)
+        freeing = recent[len(recent) - self.max_requests]
+        next_allowed = freeing + timedelta(seconds=self.window_seconds)
+        return max(0, math.ceil((next_allowed - now).total_seconds()))
+
+    def prune(self) -> int:
+        """Olvidar las claves sin solicitudes en la ventana. Retorna cuántas se borraron."""
+        with self.lock:
+            window_start = datetime.utcnow() - timedelta(seconds=self.window_seconds)
+            stale = [key for key, times in self.requests.items() if not any(t > window_start for t in times)]
+            for key in stale:
+                del self.requests[key]
+            return len(stale)
+
     def reset(self, key: str):
         """Resetear el contador para una clave específica"""
         with self.lock:
@@ -60,11 +116,9 @@ class RateLimiter:
             Segundos de espera, 0 si puede hacer request ahora
         """
         with self.lock:
-            if key not in self.requests or not self.requests[key]:
+            now = datetime.utcnow()
+            window_start = now - timedelta(seconds=self.window_seconds)
+            recent = sorted(t for t in self.requests.get(key, ()) if t > window_start)
+            if len(recent) < self.max_requests:
                 return 0
-            
-            oldest_request = min(self.requests[key])
-            next_allowed = oldest_request + timedelta(seconds=self.window_seconds)
-            wait_time = (next_allowed - datetime.utcnow()).total_seconds()
-            
-            return max(0, int(wait_time))
\ No newline at end of file
+            return self._wait_seconds(recent, now)
\ No newline at end of file
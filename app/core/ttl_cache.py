@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import threading
+import time
+
+class TTLCache:
+    """
+    Caché en memoria acotada, con vencimiento por tiempo.
+    Cuando se llena descarta la entrada usada hace más tiempo (LRU).
+    En producción, usar Redis para compartirla entre procesos.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valor guardado para la clave, o None si no existe o venció"""
+        with self.lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Guardar un valor; reemplaza el anterior y renueva el vencimiento"""
+        with self.lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """Eliminar una clave si existe"""
+        with self.lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._data)
@@ -0,0 +1,102 @@
+from datetime import date, datetime
+from typing import Set
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from app.crud.crud_peticion import ESTADOS_CERRADOS
+from app.models.informe_mision import InformeMision
+from app.models.peticion import Peticion
+from app.models.peticion_archivada import PeticionArchivada
+
+# Columnas que pasan tal cual de peticiones al archivo
+COLUMNAS_PETICION = [
+    "id", "creado_en", "usuario_id", "contacto_id", "ubicacion_id", "operador_id",
+    "profesional_id", "estado_code", "finalizado_en", "mensaje", "audio",
+    "audio_estado", "idempotency_key"
+]
+
+def _primer_dia_del_mes(fecha: datetime) -> date:
+    return date(fecha.year, fecha.month, 1)
+
+def _mes_siguiente(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+class CRUDArchivo:
+
+    def __init__(self):
+        # Particiones que ya se sabe que existen (evita repetir el DDL)
+        self._particiones: Set[date] = set()
+
+    def ensure_partitions(self, db: Session, *, desde: datetime, hasta: datetime):
+        """
+        Crear las particiones mensuales de peticiones_archivo que cubren
+        [desde, hasta]. Cada partición se crea en su propia transacción.
+        """
+        mes = _primer_dia_del_mes(desde)
+        while mes <= hasta.date():
+            if mes not in self._particiones:
+                siguiente = _mes_siguiente(mes)
+                try:
+                    db.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS peticiones_archivo_{mes:%Y_%m} "
+                        f"PARTITION OF peticiones_archivo "
+                        f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{siguiente.isoformat()}')"
+                    ))
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                self._particiones.add(mes)
+            mes = _mes_siguiente(mes)
+
+    def archive_batch(self, db: Session, *, older_than: datetime, limit: int) -> int:
+        """
+        Mover al archivo hasta `limit` peticiones cerradas creadas antes de
+        `older_than`, con su informe de misión. Retorna cuántas se movieron.
+
+        Es una sola sentencia (DELETE ... RETURNING dentro de un WITH que
+        alimenta el INSERT): o se mueve el lote entero o nada. El borrado
+        arrastra el informe por la FK en cascada; el JOIN todavía lo ve
+        porque toda la sentencia lee la misma foto de la base. Las filas
+        bloqueadas por otra transacción (un despacho, otro archivador) se
+        saltean y quedan para la próxima vuelta.
+        """
+        oldest = db.query(func.min(Peticion.creado_en)).filter(
+            Peticion.estado_code.in_(ESTADOS_CERRADOS),
+            Peticion.creado_en < older_than
+        ).scalar()
+        if oldest is None:
+            return 0
+        self.ensure_partitions(db, desde=oldest, hasta=older_than)
+
+        candidatas = select(Peticion.id).where(
+            Peticion.estado_code.in_(ESTADOS_CERRADOS),
+            Peticion.creado_en < older_than
+        ).order_by(Peticion.creado_en).limit(limit).with_for_update(skip_locked=True)
+
+        movidas = delete(Peticion).where(
+            Peticion.id.in_(candidatas)
+        ).returning(*[Peticion.__table__.c[nombre] for nombre in COLUMNAS_PETICION]).cte("movidas")
+
+        filas = select(
+            *[movidas.c[nombre] for nombre in COLUMNAS_PETICION],
+            InformeMision.detalle_resolucion,
+            InformeMision.foto_url,
+            InformeMision.foto_estado,
+            InformeMision.creado_en
+        ).outerjoin(InformeMision, InformeMision.peticion_id == movidas.c.id)
+
+        try:
+            result = db.execute(
+                insert(PeticionArchivada).from_select(
+                    COLUMNAS_PETICION + ["detalle_resolucion", "foto_url", "foto_estado", "informe_creado_en"],
+                    filas
+                ).add_cte(movidas)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return result.rowcount
+
+crud_archivo = CRUDArchivo()
@@ -53,6 +53,36 @@ class CRUDContact:
         """Obtener un contacto por ID"""
         return db.query(Contact).filter(Contact.id == id).first()
     
+    def get_owned_ids(
+        self,
+        db: Session,
+        *,
+        user_id: UUID,
+        ids: List[str]
+    ) -> List[UUID]:
+        """
+        Filtrar en una sola consulta los IDs de contacto que pertenecen al usuario.
+        Los IDs con formato inválido se descartan silenciosamente.
+        """
+        valid_ids = []
+        for raw_id in ids:
+            try:
+                valid_ids.append(UUID(str(raw_id)))
+            except (ValueError, TypeError):
+                continue
+
+        if not valid_ids:
+            return []
+
+        rows = db.query(Contact.id).filter(
+            Contact.id.in_(valid_ids),
+            Contact.usuario_id == user_id
+        ).all()
+        owned = {row.id for row in rows}
+
+        # Conservar el orden enviado por la app (el primero es el primario)
+        return [contact_id for contact_id in valid_ids if contact_id in owned]
+    
     def get_by_user(
         self, 
         db: Session, 
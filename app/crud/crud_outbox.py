@@ -0,0 +1,113 @@
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.evento_outbox import EventoOutbox
+
+class CRUDOutbox:
+
+    def add(self, db: Session, *, tipo: str, payload: Dict[str, Any]):
+        """
+        Agregar un evento a la transacción en curso. No hace commit: el
+        evento se confirma (o se descarta) junto con los datos del llamador.
+        """
+        db.execute(insert(EventoOutbox).values(tipo=tipo, payload=payload))
+
+    def claim(self, db: Session, *, limit: int, lease_seconds: float) -> List[Any]:
+        """
+        Tomar hasta `limit` eventos disponibles. Las filas que otro worker
+        tiene bloqueadas se saltean (SKIP LOCKED), así varios workers drenan
+        la tabla en paralelo sin pisarse.
+
+        No se mantiene la transacción abierta mientras se procesan: se corre
+        `disponible_en` al fin de un lease y se confirma. Si el worker muere,
+        el evento vuelve a estar disponible al vencer el lease (al menos una vez).
+        Retorna filas (id, tipo, payload, intentos).
+        """
+        pendientes = select(EventoOutbox.id).where(
+            EventoOutbox.procesado_en.is_(None),
+            EventoOutbox.disponible_en <= func.now()
+        ).order_by(EventoOutbox.id).limit(limit).with_for_update(skip_locked=True)
+
+        try:
+            rows = db.execute(
+                update(EventoOutbox)
+                .where(EventoOutbox.id.in_(pendientes))
+                .values(
+                    disponible_en=func.now() + timedelta(seconds=lease_seconds),
+                    intentos=EventoOutbox.intentos + 1
+                )
+                .returning(EventoOutbox.id, EventoOutbox.tipo, EventoOutbox.payload, EventoOutbox.intentos)
+            ).all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return rows
+
+    def mark_done(self, db: Session, *, evento_id: int):
+        try:
+            db.execute(
+                update(EventoOutbox)
+                .where(EventoOutbox.id == evento_id)
+                .values(procesado_en=func.now(), ultimo_error=None)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def mark_failed(self, db: Session, *, evento_id: int, error: str, retry_seconds: Optional[float]):
+        """Registrar la falla. Con `retry_seconds` None no se reintenta más."""
+        values = {"ultimo_error": error[:2000]}
+        if retry_seconds is None:
+            values["procesado_en"] = func.now()
+        else:
+            values["disponible_en"] = func.now() + timedelta(seconds=retry_seconds)
+        try:
+            db.execute(update(EventoOutbox).where(EventoOutbox.id == evento_id).values(**values))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def postpone(self, db: Session, *, evento_id: int, error: str, retry_seconds: float):
+        """
+        Volver a intentar en `retry_seconds` sin gastar un intento (el
+        handler no pudo ni empezar, p. ej. el proveedor está caído).
+        """
+        try:
+            db.execute(
+                update(EventoOutbox)
+                .where(EventoOutbox.id == evento_id)
+                .values(
+                    ultimo_error=error[:2000],
+                    disponible_en=func.now() + timedelta(seconds=retry_seconds),
+                    intentos=EventoOutbox.intentos - 1
+                )
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def purge_processed(self, db: Session, *, older_than_seconds: float) -> int:
+        """Borrar los eventos procesados hace más de `older_than_seconds`"""
+        try:
+            result = db.execute(
+                delete(EventoOutbox).where(
+                    EventoOutbox.procesado_en.isnot(None),
+                    EventoOutbox.procesado_en < func.now() - timedelta(seconds=older_than_seconds)
+                )
+            )
+            db.commit()
+            return result.rowcount
+        except Exception:
+            db.rollback()
+            raise
+
+    def count_pending(self, db: Session) -> int:
+        return db.query(func.count(EventoOutbox.id)).filter(EventoOutbox.procesado_en.is_(None)).scalar()
+
+crud_outbox = CRUDOutbox()
@@ -1,12 +1,41 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import insert, select, tuple_, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, joinedload
 from uuid import UUID
 from datetime import datetime, timedelta
+import enum
+import uuid
 
-from app.models.peticion import Peticion
+from app.crud.crud_outbox import crud_outbox
+from app.models.evento_outbox import EVENTO_AUDIO_REPORTE
+from app.models.peticion import Peticion, MEDIA_PENDIENTE, MEDIA_LISTA, MEDIA_FALLIDA
+from app.models.peticion_archivada import PeticionArchivada
+from app.models.informe_mision import InformeMision
 from app.models.ubicacion import Ubicacion
 from app.models.contact import Contact
-from app.schemas.contact import UbicacionCreate, PeticionCreate
+from app.schemas.contact import UbicacionCreate, PeticionCreate, LocationReportData
+from app.services.transition_log import transition_log
+
+# Estados que hacen aparecer una alerta en el radar de la central
+ESTADOS_ACTIVOS = ("pendiente", "en_triaje")
+# Estado de una misión en curso (máximo 1 por profesional)
+ESTADO_DESPACHADA = "despachada"
+# Estado de cierre de una misión
+ESTADO_RESUELTA = "resuelta"
+# Estados finales: la petición ya no cambia y puede archivarse
+ESTADOS_CERRADOS = (ESTADO_RESUELTA, "atendida", "cancelada", "error")
+
+class DispatchResult(str, enum.Enum):
+    """Resultado de intentar despachar una alerta a un profesional"""
+    DESPACHADA = "despachada"
+    NO_ENCONTRADA = "no_encontrada"
+    NO_DESPACHABLE = "no_despachable"  # Ya despachada, resuelta, etc.
+    PROFESIONAL_OCUPADO = "profesional_ocupado"
+    PROFESIONAL_NO_ENCONTRADO = "profesional_no_encontrado"
+
+# Violación de clave foránea en PostgreSQL (SQLSTATE)
+FOREIGN_KEY_VIOLATION = "23503"
 
 class CRUDPeticion:
     
@@ -39,7 +68,6 @@ class CRUDPeticion:
         if not contact_ids:
             raise ValueError("No hay contactos configurados")
         
-        # Crear ubicación si se proporciona
         ubicacion = None
         if ubicacion_data:
             ubicacion = Ubicacion(
@@ -47,43 +75,562 @@ class CRUDPeticion:
                 latitud=ubicacion_data.latitud,
                 longitud=ubicacion_data.longitud
             )
-            db.add(ubicacion)
-            db.flush()  # Para obtener el ID
         
-        # Crear una petición por cada contacto
+        # Una petición por cada contacto, en una sola sentencia
+        return self._bulk_create(
+            db,
+            user_id=user_id,
+            contact_ids=contact_ids,
+            ubicacion=ubicacion,
+            estado_code='pendiente'  # Estado inicial
+        )
+    
+    def create_emergency_report(
+        self,
+        db: Session,
+        *,
+        user_id: UUID,
+        contact_ids: List[UUID],
+        location: Optional[LocationReportData] = None,
+        mensaje: Optional[str] = None,
+        audio_archivo: Optional[str] = None,
+        idempotency_key: Optional[str] = None
+    ) -> List[Peticion]:
+        """
+        Registrar un reporte de emergencia enviado desde la app móvil.
+
+        Crea la ubicación, una petición central para el radar de la central
+        operativa y una petición por cada contacto personal. La primera
+        petición de la lista devuelta es siempre la central.
+
+        El audio no se sube aquí: con `audio_archivo` (ya copiado a disco) se
+        marca como pendiente y se escribe un evento en el outbox en la misma
+        transacción que las peticiones. El MediaWorker lo sube y lo asocia
+        cuando el OutboxWorker toma el evento.
+
+        Con `idempotency_key`, un segundo reporte con la misma clave viola el
+        índice único de la petición central y lanza IntegrityError (ver
+        get_report_id_by_idempotency_key).
+        """
+        ubicacion = None
+        if location:
+            ubicacion = Ubicacion(
+                direccion=location.address or "Ubicación desde dispositivo",
+                latitud=location.latitude,
+                longitud=location.longitude
+            )
+
+        # La petición central (sin contacto) va al operador y va primero.
+        # El estado "en_triaje" es el que la hace aparecer en el radar.
+        peticiones = self._bulk_create(
+            db,
+            user_id=user_id,
+            contact_ids=[None, *contact_ids],
+            ubicacion=ubicacion,
+            estado_code="en_triaje",
+            mensaje=mensaje,
+            audio_estado=MEDIA_PENDIENTE if audio_archivo else None,
+            idempotency_key=idempotency_key,
+            commit=False
+        )
+        try:
+            if audio_archivo:
+                crud_outbox.add(
+                    db,
+                    tipo=EVENTO_AUDIO_REPORTE,
+                    payload={"peticion_ids": [str(p.id) for p in peticiones], "archivo": audio_archivo}
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        transition_log.record_created(peticiones)
+        return peticiones
+
+    def get_report_id_by_idempotency_key(
+        self,
+        db: Session,
+        *,
+        idempotency_key: str
+    ) -> Optional[UUID]:
+        """ID de la petición central ya registrada con esa clave de idempotencia"""
+        return db.query(Peticion.id).filter(
+            Peticion.idempotency_key == idempotency_key,
+            Peticion.contacto_id.is_(None)
+        ).scalar()
+
+    def _bulk_create(
+        self,
+        db: Session,
+        *,
+        user_id: UUID,
+        contact_ids: List[Optional[UUID]],
+        ubicacion: Optional[Ubicacion],
+        estado_code: str,
+        mensaje: Optional[str] = None,
+        audio_estado: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        commit: bool = True
+    ) -> List[Peticion]:
+        """
+        Insertar la ubicación y todas las peticiones en una única sentencia.
+
+        Los UUID se generan en el cliente, así que no hace falta flush ni
+        refresh: la ubicación va en un CTE (INSERT ... RETURNING) dentro del
+        mismo INSERT multi-fila de las peticiones. Son dos viajes a la BD en
+        total (la sentencia y el COMMIT), sin importar cuántos contactos haya.
+
+        Retorna objetos Peticion con los datos insertados, no asociados a la
+        sesión (no hace falta volver a leerlos). Con `commit=False` la
+        transacción queda abierta para que el llamador agregue más filas.
+        """
+        creado_en = datetime.utcnow()
+
+        stmt_ubicacion = None
+        if ubicacion is not None:
+            ubicacion.id = uuid.uuid4()
+            stmt_ubicacion = insert(Ubicacion).values(
+                id=ubicacion.id,
+                direccion=ubicacion.direccion,
+                latitud=ubicacion.latitud,
+                longitud=ubicacion.longitud
+            ).returning(Ubicacion.id).cte("nueva_ubicacion")
+
         peticiones = []
         for contact_id in contact_ids:
             peticion = Peticion(
+                id=uuid.uuid4(),
                 usuario_id=user_id,
                 contacto_id=contact_id,
-                ubicacion_id=ubicacion.id if ubicacion else None,
-                estado_code='pendiente'  # Estado inicial
+                ubicacion_id=ubicacion.id if ubicacion is not None else None,
+                estado_code=estado_code,
+                creado_en=creado_en,
+                mensaje=mensaje,
+                audio_estado=audio_estado,
+                idempotency_key=idempotency_key
             )
-            db.add(peticion)
+            peticion.ubicacion = ubicacion
             peticiones.append(peticion)
-        
-        db.commit()
-        
-        # Refrescar objetos
-        for peticion in peticiones:
-            db.refresh(peticion)
-        
+
+        stmt = insert(Peticion).values([
+            {
+                "id": p.id,
+                "usuario_id": p.usuario_id,
+                "contacto_id": p.contacto_id,
+                "ubicacion_id": p.ubicacion_id,
+                "estado_code": p.estado_code,
+                "creado_en": p.creado_en,
+                "mensaje": p.mensaje,
+                "audio_estado": p.audio_estado,
+                "idempotency_key": p.idempotency_key
+            }
+            for p in peticiones
+        ]).returning(Peticion.id)
+        if stmt_ubicacion is not None:
+            stmt = stmt.add_cte(stmt_ubicacion)
+
+        try:
+            inserted_ids = db.execute(stmt).scalars().all()
+            if commit:
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        if len(inserted_ids) != len(peticiones):
+            raise RuntimeError("No se insertaron todas las peticiones del reporte")
+
+        if commit:
+            transition_log.record_created(peticiones)
         return peticiones
-    
-    def get_user_peticiones(
+
+    def get_report_peticion_ids(
+        self,
+        db: Session,
+        *,
+        report_id: UUID,
+        user_id: UUID
+    ) -> List[UUID]:
+        """
+        IDs de todas las peticiones de un reporte del usuario: la central
+        (report_id) y las de sus contactos, que se crearon en la misma
+        sentencia (misma ubicación y creado_en). Vacío si no es del usuario.
+        """
+        central = db.query(Peticion).filter(
+            Peticion.id == report_id,
+            Peticion.usuario_id == user_id,
+            Peticion.contacto_id.is_(None)
+        ).first()
+        if central is None:
+            return []
+
+        contactos = db.query(Peticion.id).filter(
+            Peticion.usuario_id == user_id,
+            Peticion.contacto_id.isnot(None),
+            Peticion.creado_en == central.creado_en,
+            Peticion.ubicacion_id == central.ubicacion_id
+        ).all()
+        return [central.id, *(peticion_id for (peticion_id,) in contactos)]
+
+    def enqueue_audio(self, db: Session, *, peticion_ids: List[UUID], audio_archivo: str) -> int:
+        """
+        Marcar el audio como pendiente y escribir el evento de subida en el
+        outbox, en una transacción (audio subido después del reporte).
+        """
+        try:
+            updated_count = db.query(Peticion).filter(
+                Peticion.id.in_(peticion_ids)
+            ).update({"audio_estado": MEDIA_PENDIENTE}, synchronize_session=False)
+            crud_outbox.add(
+                db,
+                tipo=EVENTO_AUDIO_REPORTE,
+                payload={"peticion_ids": [str(peticion_id) for peticion_id in peticion_ids], "archivo": audio_archivo}
+            )
+            db.commit()
+            return updated_count
+        except Exception as e:
+            db.rollback()
+            raise e
+
+    def audio_pendiente(self, db: Session, *, peticion_ids: List[UUID]) -> bool:
+        """True si alguna de las peticiones todavía espera su audio"""
+        return db.query(
+            db.query(Peticion.id).filter(
+                Peticion.id.in_(peticion_ids),
+                Peticion.audio_estado == MEDIA_PENDIENTE
+            ).exists()
+        ).scalar()
+
+    def foto_pendiente(self, db: Session, *, informe_id: UUID) -> bool:
+        """True si el informe todavía espera su foto"""
+        return db.query(
+            db.query(InformeMision.id).filter(
+                InformeMision.id == informe_id,
+                InformeMision.foto_estado == MEDIA_PENDIENTE
+            ).exists()
+        ).scalar()
+
+    def attach_audio(
+        self,
+        db: Session,
+        *,
+        peticion_ids: List[UUID],
+        audio_url: Optional[str]
+    ) -> int:
+        """
+        Asociar la URL del audio subido a las peticiones de un reporte.
+        Si la URL es None la subida falló y el audio queda marcado como fallido.
+        """
+        try:
+            updated_count = db.query(Peticion).filter(
+                Peticion.id.in_(peticion_ids)
+            ).update(
+                {
+                    "audio": audio_url,
+                    "audio_estado": MEDIA_LISTA if audio_url else MEDIA_FALLIDA
+                },
+                synchronize_session=False
+            )
+            db.commit()
+            return updated_count
+        except Exception as e:
+            db.rollback()
+            raise e
+
+    def attach_informe_foto(
+        self,
+        db: Session,
+        *,
+        informe_id: UUID,
+        foto_url: Optional[str]
+    ) -> int:
+        """Asociar la foto subida al informe de misión (o marcarla como fallida)"""
+        try:
+            updated_count = db.query(InformeMision).filter(
+                InformeMision.id == informe_id
+            ).update(
+                {
+                    "foto_url": foto_url,
+                    "foto_estado": MEDIA_LISTA if foto_url else MEDIA_FALLIDA
+                },
+                synchronize_session=False
+            )
+            db.commit()
+            return updated_count
+        except Exception as e:
+            db.rollback()
+            raise e
+
+    def dispatch(
+        self,
+        db: Session,
+        *,
+        peticion_id: UUID,
+        profesional_id: UUID,
+        operador_id: Optional[str] = None
+    ) -> Tuple[DispatchResult, Optional[Peticion]]:
+        """
+        Despachar una alerta de forma atómica.
+
+        Un único UPDATE condicional asigna el profesional solo si la alerta
+        sigue activa y el profesional no tiene otra misión despachada. El
+        índice único parcial uq_peticiones_mision_activa cubre la carrera
+        entre dos despachos simultáneos de alertas distintas al mismo
+        profesional. No hay lectura previa ni bloqueo mantenido entre sentencias.
+
+        Retorna el resultado y, si se despachó, la petición actualizada
+        (con la ubicación ya cargada).
+        """
+        mision = aliased(Peticion)
+        mision_existente = db.query(mision.id).filter(
+            mision.profesional_id == profesional_id,
+            mision.estado_code == ESTADO_DESPACHADA
+        ).exists()
+
+        stmt = update(Peticion).where(
+            Peticion.id == peticion_id,
+            Peticion.estado_code.in_(ESTADOS_ACTIVOS),
+            ~mision_existente
+        ).values(
+            estado_code=ESTADO_DESPACHADA,
+            profesional_id=profesional_id,
+            operador_id=operador_id
+        ).returning(Peticion)
+
+        try:
+            peticion = db.execute(
+                stmt,
+                execution_options={"synchronize_session": False}
+            ).scalars().first()
+            if peticion is not None:
+                # Cargar la ubicación y separar los objetos de la sesión para
+                # que el commit no los expire (se usan sin volver a consultar)
+                if peticion.ubicacion is not None:
+                    db.expunge(peticion.ubicacion)
+                db.expunge(peticion)
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            diag = getattr(e.orig, "diag", None)
+            if getattr(diag, "constraint_name", None) == "uq_peticiones_mision_activa":
+                # Otro despacho concurrente le asignó una misión a este profesional
+                return DispatchResult.PROFESIONAL_OCUPADO, None
+            if getattr(e.orig, "pgcode", None) == FOREIGN_KEY_VIOLATION:
+                # profesional_id no corresponde a ningún usuario
+                return DispatchResult.PROFESIONAL_NO_ENCONTRADO, None
+            raise
+        except Exception:
+            db.rollback()
+            raise
+
+        if peticion is not None:
+            transition_log.record(
+                peticion.id,
+                ESTADO_DESPACHADA,
+                central=peticion.contacto_id is None,
+                usuario_id=operador_id,
+                profesional_id=profesional_id
+            )
+            return DispatchResult.DESPACHADA, peticion
+
+        # No se actualizó nada: averiguar por qué (solo en el camino de error)
+        estado = db.query(Peticion.estado_code).filter(Peticion.id == peticion_id).scalar()
+        db.rollback()
+        if estado is None:
+            return DispatchResult.NO_ENCONTRADA, None
+        if estado not in ESTADOS_ACTIVOS:
+            return DispatchResult.NO_DESPACHABLE, None
+        return DispatchResult.PROFESIONAL_OCUPADO, None
+
+    def get_alertas_activas(self, db: Session) -> List[Peticion]:
+        """Peticiones que necesitan atención en la central (pendiente o en triaje)"""
+        # joinedload trae la ubicación en la misma consulta
+        return db.query(Peticion).options(
+            joinedload(Peticion.ubicacion)
+        ).filter(
+            Peticion.estado_code.in_(ESTADOS_ACTIVOS)
+        ).all()
+
+    def get_misiones_activas(self, db: Session) -> List[Peticion]:
+        """Peticiones despachadas a un profesional (misiones en curso)"""
+        return db.query(Peticion).options(
+            joinedload(Peticion.ubicacion)
+        ).filter(
+            Peticion.estado_code == ESTADO_DESPACHADA,
+            Peticion.profesional_id.isnot(None)
+        ).all()
+
+    def get_mision_activa(self, db: Session, *, profesional_id: str) -> Optional[Peticion]:
+        """Misión despachada al profesional, si tiene una"""
+        return db.query(Peticion).options(
+            joinedload(Peticion.ubicacion)
+        ).filter(
+            Peticion.profesional_id == profesional_id,
+            Peticion.estado_code == ESTADO_DESPACHADA
+        ).first()
+
+    def get_by_ids(self, db: Session, *, ids: List[UUID]) -> List[Peticion]:
+        """Obtener varias peticiones (con su ubicación) por clave primaria"""
+        if not ids:
+            return []
+        return db.query(Peticion).options(
+            joinedload(Peticion.ubicacion)
+        ).filter(
+            Peticion.id.in_(ids)
+        ).all()
+
+    def _historial_select(
+        self,
+        model,
+        *,
+        estado: Optional[str] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        profesional_id: Optional[UUID] = None,
+        after: Optional[Tuple[datetime, UUID]] = None
+    ):
+        """Historial de una tabla (peticiones o su archivo): solo las columnas necesarias"""
+        query = select(
+            model.id,
+            model.estado_code,
+            model.creado_en,
+            model.finalizado_en,
+            model.usuario_id,
+            model.profesional_id
+        )
+        if estado:
+            query = query.where(model.estado_code == estado)
+        if desde:
+            query = query.where(model.creado_en >= desde)
+        if hasta:
+            query = query.where(model.creado_en < hasta)
+        if profesional_id:
+            query = query.where(model.profesional_id == profesional_id)
+        if after:
+            query = query.where(tuple_(model.creado_en, model.id) < after)
+        return query
+
+    def _historial_query(self, *, limit: Optional[int] = None, **filtros):
+        """
+        Historial completo: peticiones calientes más las archivadas, más
+        reciente primero. Con `desde` posterior al corte del archivador no
+        se toca el archivo; si no, Postgres solo recorre las particiones
+        mensuales que caen en el rango.
+        """
+        ramas = []
+        for model in (Peticion, PeticionArchivada):
+            rama = self._historial_select(model, **filtros)
+            if limit is not None:
+                # Cada rama aporta a lo sumo `limit` filas (índice creado_en, id)
+                rama = rama.order_by(model.creado_en.desc(), model.id.desc()).limit(limit)
+            ramas.append(rama)
+        historial = union_all(*ramas).subquery()
+
+        # Orden total y estable para paginar por clave
+        query = select(historial).order_by(historial.c.creado_en.desc(), historial.c.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    def get_historial_page(
+        self,
+        db: Session,
+        *,
+        after: Optional[Tuple[datetime, UUID]] = None,
+        limit: int = 50,
+        **filtros
+    ) -> List:
+        """
+        Una página del historial, paginada por clave sobre (creado_en, id).
+        `after` es la última fila de la página anterior.
+        """
+        return db.execute(self._historial_query(after=after, limit=limit, **filtros)).all()
+
+    def iter_historial(
+        self,
+        db: Session,
+        *,
+        batch_size: int = 1000,
+        **filtros
+    ) -> Iterator:
+        """
+        Recorrer todo el historial con memoria constante.
+        yield_per usa un cursor del lado del servidor y trae las filas por lotes.
+        """
+        return db.execute(
+            self._historial_query(**filtros),
+            execution_options={"yield_per": batch_size}
+        )
+
+    def _historial_usuario_select(
+        self,
+        model,
+        *,
+        user_id: UUID,
+        after: Optional[Tuple[datetime, UUID]],
+        limit: int
+    ):
+        """Últimas peticiones del usuario en una tabla, con contacto y ubicación en la misma fila"""
+        query = select(
+            model.id,
+            model.estado_code,
+            model.creado_en,
+            Contact.nombre.label("contacto_nombre"),
+            Ubicacion.direccion,
+            Ubicacion.latitud,
+            Ubicacion.longitud
+        ).outerjoin(
+            Contact, Contact.id == model.contacto_id
+        ).outerjoin(
+            Ubicacion, Ubicacion.id == model.ubicacion_id
+        ).where(
+            model.usuario_id == user_id
+        )
+        if after:
+            query = query.where(tuple_(model.creado_en, model.id) < after)
+        return query.order_by(model.creado_en.desc(), model.id.desc()).limit(limit)
+
+    def get_user_history(
         self,
         db: Session,
         *,
         user_id: UUID,
+        after: Optional[Tuple[datetime, UUID]] = None,
         limit: int = 10
-    ) -> List[Peticion]:
-        """Obtener las últimas peticiones de un usuario"""
-        return db.query(Peticion).filter(
-            Peticion.usuario_id == user_id
-        ).order_by(
-            Peticion.creado_en.desc()
-        ).limit(limit).all()
+    ) -> List:
+        """
+        Una página del historial de un usuario (calientes y archivadas), de
+        la más reciente a la más antigua, paginada por clave sobre
+        (creado_en, id). Una sola consulta sea cual sea `limit`: solo las
+        columnas que muestra la app, con el contacto y la ubicación por JOIN.
+        """
+        ramas = [
+            self._historial_usuario_select(model, user_id=user_id, after=after, limit=limit)
+            for model in (Peticion, PeticionArchivada)
+        ]
+        historial = union_all(*ramas).subquery()
+        return db.execute(
+            select(historial).order_by(
+                historial.c.creado_en.desc(), historial.c.id.desc()
+            ).limit(limit)
+        ).all()
     
+    def get_recent_report_times(
+        self,
+        db: Session,
+        *,
+        user_id: UUID,
+        seconds: int = 60
+    ) -> List[datetime]:
+        """Fecha de los reportes recientes del usuario (solo la petición central)"""
+        time_threshold = datetime.utcnow() - timedelta(seconds=seconds)
+        rows = db.query(Peticion.creado_en).filter(
+            Peticion.usuario_id == user_id,
+            Peticion.contacto_id.is_(None),
+            Peticion.creado_en >= time_threshold
+        ).all()
+        return [creado_en for (creado_en,) in rows]
+
     def get_recent_peticion_count(
         self,
         db: Session,
@@ -130,6 +677,12 @@ class CRUDPeticion:
             peticion.estado_code = estado_code
             db.commit()
             db.refresh(peticion)
+            transition_log.record(
+                peticion.id,
+                estado_code,
+                central=peticion.contacto_id is None,
+                profesional_id=peticion.profesional_id
+            )
         
         return peticion
     
@@ -158,14 +711,18 @@ class CRUDPeticion:
         Marcar peticiones como enviadas exitosamente
         """
         try:
-            updated_count = db.query(Peticion).filter(
-                Peticion.id.in_(peticion_ids)
-            ).update(
-            {"estado_code": "atendida"},  # ← CAMBIO: usar "atendida" en lugar de "SENT"
-            synchronize_session=False
-            )
+            actualizadas = db.execute(
+                update(Peticion).where(
+                    Peticion.id.in_(peticion_ids)
+                ).values(
+                    estado_code="atendida"  # ← CAMBIO: usar "atendida" en lugar de "SENT"
+                ).returning(Peticion.id, Peticion.contacto_id),
+                execution_options={"synchronize_session": False}
+            ).all()
             db.commit()
-            return updated_count
+            for peticion_id, contacto_id in actualizadas:
+                transition_log.record(peticion_id, "atendida", central=contacto_id is None)
+            return len(actualizadas)
         except Exception as e:
             db.rollback()  # ← AGREGAR: rollback en caso de error
             raise e
@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import Any, Dict, List
+from uuid import UUID
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.crud.crud_peticion import ESTADO_DESPACHADA, ESTADO_RESUELTA, ESTADOS_ACTIVOS
+from app.models.transicion_peticion import TransicionPeticion
+
+class CRUDTransicion:
+
+    def get_timeline(self, db: Session, *, peticion_id: UUID) -> List[TransicionPeticion]:
+        """Cambios de estado de una petición, del más viejo al más nuevo"""
+        return db.query(TransicionPeticion).filter(
+            TransicionPeticion.peticion_id == peticion_id
+        ).order_by(TransicionPeticion.registrado_en, TransicionPeticion.id).all()
+
+    def get_sla(self, db: Session, *, desde: datetime, hasta: datetime) -> Dict[str, Any]:
+        """
+        Tiempos de respuesta de las alertas centrales creadas entre `desde` y
+        `hasta`, calculados sobre el registro de transiciones (no toca la
+        tabla peticiones). La creación es la transición a un estado activo
+        (pendiente / en triaje); el despacho y la resolución, la primera a
+        cada estado.
+        """
+        t = TransicionPeticion
+        creada = func.min(t.registrado_en).filter(t.estado_code.in_(ESTADOS_ACTIVOS))
+        por_alerta = db.query(
+            t.peticion_id,
+            creada.label("creada"),
+            func.min(t.registrado_en).filter(t.estado_code == ESTADO_DESPACHADA).label("despachada"),
+            func.min(t.registrado_en).filter(t.estado_code == ESTADO_RESUELTA).label("resuelta")
+        ).filter(
+            t.central.is_(True),
+            # Las transiciones de una alerta son posteriores a su creación; las
+            # creadas antes de `desde` quedan sin `creada` y el HAVING las saca
+            t.registrado_en >= desde
+        ).group_by(t.peticion_id).having(creada < hasta).subquery()
+
+        despacho = func.extract("epoch", por_alerta.c.despachada - por_alerta.c.creada)
+        resolucion = func.extract("epoch", por_alerta.c.resuelta - por_alerta.c.creada)
+        row = db.query(
+            func.count(),
+            func.count(por_alerta.c.despachada),
+            func.count(por_alerta.c.resuelta),
+            func.percentile_cont(0.5).within_group(despacho),
+            func.percentile_cont(0.9).within_group(despacho),
+            func.max(despacho),
+            func.percentile_cont(0.5).within_group(resolucion),
+            func.percentile_cont(0.9).within_group(resolucion),
+            func.max(resolucion)
+        ).one()
+
+        return {
+            "alertas": row[0],
+            "despachadas": row[1],
+            "resueltas": row[2],
+            "segundos_hasta_despacho": {"p50": row[3], "p90": row[4], "max": row[5]},
+            "segundos_hasta_resolucion": {"p50": row[6], "p90": row[7], "max": row[8]}
+        }
+
+crud_transicion = CRUDTransicion()
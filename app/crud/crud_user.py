@@ -5,7 +5,7 @@ from app.schemas.user import UserCreate, UserUpdate
 from app.schemas.auth import AnonymousLoginRequest
 from app.core.security import get_password_hash
 from uuid import uuid4
-from typing import Optional
+from typing import Dict, List, Optional
 import secrets
 
 # -------- Obtener usuarios --------
@@ -18,6 +18,13 @@ def get_user(db: Session, user_id: str) -> Optional[User]:
 def get_users(db: Session, skip: int = 0, limit: int = 10):
     return db.query(User).offset(skip).limit(limit).all()
 
+def get_full_names(db: Session, user_ids: List[str]) -> Dict[str, str]:
+    """Nombres de varios usuarios en una sola consulta (id -> nombre)"""
+    if not user_ids:
+        return {}
+    rows = db.query(User.id, User.full_name).filter(User.id.in_(user_ids)).all()
+    return {str(user_id): full_name for user_id, full_name in rows}
+
 # -------- Crear usuario regular --------
 def create_user(db: Session, user: UserCreate, ip_address: Optional[str] = None) -> User:
     # Validaciones
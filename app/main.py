@@ -2,6 +2,22 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api.api import api_router
+from app.api.routes_emergency import limitador_alertas
+from app.core.metrics import metrics
+from app.services.alert_projection import alert_projection
+from app.services.media_worker import media_worker
+from app.services.location_history import location_history
+from app.services.transition_log import transition_log
+from app.services.professional_locator import professional_locator
+from app.services.triage_queue import triage_queue
+from app.services.chunked_upload import chunked_uploads
+from app.services.outbox_worker import outbox_worker
+from app.crud.crud_outbox import crud_outbox
+from app.crud.crud_archivo import crud_archivo
+from app.db.session import SessionLocal
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+import asyncio
 import logging
 
 # Configurar logging
@@ -48,6 +64,103 @@ def health_check():
         "version": settings.VERSION
     }
 
+# Métricas internas (proyección de alertas, workers, etc.)
+@app.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
+
+# Tareas en segundo plano del proceso
+background_tasks = []
+
+async def projection_check_loop():
+    """Comparar periódicamente la proyección de alertas contra la BD"""
+    while True:
+        await asyncio.sleep(settings.PROJECTION_CHECK_SECONDS)
+        try:
+            await run_in_threadpool(alert_projection.check_consistency)
+        except Exception as e:
+            logging.error(f"Error verificando la proyección de alertas: {e}")
+
+async def presence_expiry_loop():
+    """Sacar del índice a los profesionales que dejaron de enviar su posición"""
+    while True:
+        await asyncio.sleep(settings.PROFESSIONAL_HEARTBEAT_TTL_SECONDS)
+        try:
+            professional_locator.expire()
+            metrics.set_gauge("locator.online", len(professional_locator))
+        except Exception as e:
+            logging.error(f"Error expirando profesionales sin posición: {e}")
+
+async def triage_refresh_loop():
+    """Actualizar en la cola de triaje la distancia al profesional libre más cercano"""
+    while True:
+        await asyncio.sleep(settings.TRIAGE_REFRESH_SECONDS)
+        try:
+            triage_queue.refresh_distances(alert_projection.busy_professionals())
+        except Exception as e:
+            logging.error(f"Error actualizando la cola de triaje: {e}")
+
+async def rate_limit_prune_loop():
+    """Olvidar usuarios sin alertas recientes (mantiene acotado el limitador)"""
+    while True:
+        await asyncio.sleep(settings.EMERGENCY_RATE_LIMIT_SECONDS * 10)
+        try:
+            limitador_alertas.prune()
+        except Exception as e:
+            logging.error(f"Error podando el limitador de alertas: {e}")
+
+async def upload_purge_loop():
+    """Borrar del disco las subidas de audio por partes abandonadas"""
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            await run_in_threadpool(chunked_uploads.purge_expired, settings.AUDIO_UPLOAD_TTL_SECONDS)
+        except Exception as e:
+            logging.error(f"Error borrando subidas de audio vencidas: {e}")
+
+def _purge_outbox():
+    db = SessionLocal()
+    try:
+        crud_outbox.purge_processed(db, older_than_seconds=settings.OUTBOX_RETENTION_SECONDS)
+        metrics.set_gauge("outbox.pendientes", crud_outbox.count_pending(db))
+    finally:
+        db.close()
+
+async def outbox_purge_loop():
+    """Borrar los eventos del outbox ya procesados (y medir los pendientes)"""
+    while True:
+        await asyncio.sleep(3600)
+        try:
+            await run_in_threadpool(_purge_outbox)
+        except Exception as e:
+            logging.error(f"Error limpiando el outbox: {e}")
+
+def _archive_closed() -> int:
+    """Mover al archivo, por lotes, las peticiones cerradas más viejas que el corte"""
+    older_than = datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    archivadas = 0
+    db = SessionLocal()
+    try:
+        while True:
+            movidas = crud_archivo.archive_batch(db, older_than=older_than, limit=settings.ARCHIVE_BATCH_SIZE)
+            archivadas += movidas
+            if movidas < settings.ARCHIVE_BATCH_SIZE:
+                return archivadas
+    finally:
+        db.close()
+        metrics.incr("archivo.peticiones", archivadas)
+
+async def archive_loop():
+    """Sacar de la tabla caliente las peticiones cerradas viejas"""
+    if settings.ARCHIVE_AFTER_DAYS <= 0:
+        return
+    while True:
+        try:
+            await run_in_threadpool(_archive_closed)
+        except Exception as e:
+            logging.error(f"Error archivando peticiones: {e}")
+        await asyncio.sleep(settings.ARCHIVE_CHECK_SECONDS)
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
@@ -55,7 +168,33 @@ async def startup_event():
     logging.info(f"Database: {settings.POSTGRES_DB}")
     logging.info(f"SMS Service: {'Enabled' if settings.TWILIO_ACCOUNT_SID else 'Disabled'}")
 
+    # Cargar alertas activas y misiones en memoria. Si la BD no responde,
+    # los endpoints consultan la BD hasta que el chequeo periódico la cargue.
+    try:
+        await run_in_threadpool(alert_projection.rebuild)
+    except Exception as e:
+        logging.error(f"No se pudo cargar la proyección de alertas: {e}")
+    background_tasks.append(asyncio.create_task(projection_check_loop()))
+    background_tasks.append(asyncio.create_task(presence_expiry_loop()))
+    background_tasks.append(asyncio.create_task(rate_limit_prune_loop()))
+    background_tasks.append(asyncio.create_task(triage_refresh_loop()))
+    background_tasks.append(asyncio.create_task(upload_purge_loop()))
+    background_tasks.append(asyncio.create_task(outbox_purge_loop()))
+    background_tasks.append(asyncio.create_task(archive_loop()))
+    # Efectos secundarios del flujo de emergencia (subidas de multimedia)
+    outbox_worker.start()
+
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
-    logging.info(f"Shutting down {settings.PROJECT_NAME}")
\ No newline at end of file
+    logging.info(f"Shutting down {settings.PROJECT_NAME}")
+    for task in background_tasks:
+        task.cancel()
+    # Terminar los eventos del outbox en curso (lo no tomado queda en la BD)
+    await run_in_threadpool(outbox_worker.stop)
+    # Apagar el pool de compactación de multimedia
+    media_worker.shutdown(wait=True)
+    # Escribir el recorrido de los profesionales que quedó en memoria
+    location_history.shutdown()
+    # Y las transiciones de estado pendientes
+    transition_log.shutdown()
\ No newline at end of file
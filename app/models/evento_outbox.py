@@ -0,0 +1,34 @@
+from sqlalchemy import Column, BigInteger, DateTime, Integer, Index, String, Text, func, text
+from sqlalchemy.dialects.postgresql import JSONB
+from app.db.base import Base
+
+# Tipos de evento del outbox
+# "archivo" es una referencia, no el contenido: una ruta en MEDIA_SPOOL_DIR
+# (volumen compartido entre los workers) que se borra al guardar la URL
+EVENTO_AUDIO_REPORTE = "audio_reporte"  # {"peticion_ids": [...], "archivo": ruta en MEDIA_SPOOL_DIR}
+EVENTO_FOTO_INFORME = "foto_informe"    # {"informe_id": ..., "archivo": ruta en MEDIA_SPOOL_DIR}
+
+class EventoOutbox(Base):
+    """
+    Efectos secundarios pendientes (subidas, notificaciones) que se escriben
+    en la misma transacción que los datos que los originan. Si la
+    transacción se confirma, el evento existe; si no, tampoco el evento.
+    """
+    __tablename__ = "outbox_eventos"
+    __table_args__ = (
+        # Solo los pendientes: es lo único que consulta el worker
+        Index(
+            "ix_outbox_eventos_pendientes",
+            "disponible_en",
+            postgresql_where=text("procesado_en IS NULL")
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tipo = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    creado_en = Column(DateTime, server_default=func.now(), nullable=False)
+    disponible_en = Column(DateTime, server_default=func.now(), nullable=False)  # Próximo intento (o fin del lease)
+    intentos = Column(Integer, server_default=text("0"), nullable=False)
+    ultimo_error = Column(Text, nullable=True)
+    procesado_en = Column(DateTime, nullable=True)  # Hecho, o abandonado tras el último intento
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, DateTime, Text, text, func
+from sqlalchemy import Column, ForeignKey, DateTime, String, Text, text, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -10,6 +10,7 @@ class InformeMision(Base):
     peticion_id = Column(UUID(as_uuid=True), ForeignKey("peticiones.id", ondelete="CASCADE"), unique=True, nullable=False)
     detalle_resolucion = Column(Text, nullable=False)
     foto_url = Column(Text, nullable=True)
+    foto_estado = Column(String(20), nullable=True) # pendiente / lista / fallida (None si no hay foto)
     creado_en = Column(DateTime, server_default=func.now(), nullable=False)
 
     # Relación inversa
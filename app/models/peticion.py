@@ -1,11 +1,36 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime,Text, text, func
+from sqlalchemy import Column, String, ForeignKey, DateTime,Text, Index, text, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.db.base import Base
 from app.models.informe_mision import InformeMision
 
+# Estados de la multimedia que se sube en segundo plano (audio_estado / foto_estado)
+MEDIA_PENDIENTE = "pendiente"
+MEDIA_LISTA = "lista"
+MEDIA_FALLIDA = "fallida"
+
 class Peticion(Base):
     __tablename__ = "peticiones"
+    __table_args__ = (
+        # Paginación por clave del historial (ORDER BY creado_en DESC, id DESC)
+        Index("ix_peticiones_creado_en_id", "creado_en", "id"),
+        # Historial de un usuario y conteos del rate limit
+        Index("ix_peticiones_usuario_creado_en_id", "usuario_id", "creado_en", "id"),
+        # Un reintento del mismo reporte no puede crear otra petición central
+        Index(
+            "uq_peticiones_idempotency_key",
+            "idempotency_key",
+            unique=True,
+            postgresql_where=text("contacto_id IS NULL AND idempotency_key IS NOT NULL")
+        ),
+        # Máximo una misión despachada por profesional
+        Index(
+            "uq_peticiones_mision_activa",
+            "profesional_id",
+            unique=True,
+            postgresql_where=text("estado_code = 'despachada'")
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v4()"))
     usuario_id = Column(UUID(as_uuid=True), ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
@@ -18,6 +43,8 @@ class Peticion(Base):
     finalizado_en = Column(DateTime, nullable=True)
     mensaje = Column(Text, nullable=True) # Mensaje de texto opcional
     audio = Column(Text, nullable=True)   # URL o Base64 del audio
+    audio_estado = Column(String(20), nullable=True) # pendiente / lista / fallida (None si no hay audio)
+    idempotency_key = Column(String(64), nullable=True) # SHA-256 de usuario + clave del cliente
 
     # Relaciones
     usuario = relationship("User", foreign_keys=[usuario_id], back_populates="peticiones_creadas")
@@ -0,0 +1,57 @@
+from sqlalchemy import Column, String, DateTime, Text, Index, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import relationship
+from app.db.base import Base
+
+class PeticionArchivada(Base):
+    """
+    Peticiones cerradas que el archivador sacó de la tabla `peticiones`.
+
+    La tabla está particionada por mes de `creado_en` (una partición por
+    mes, la crea el archivador antes de mover filas de ese mes), así la
+    tabla caliente solo guarda lo abierto y lo reciente y sus consultas no
+    crecen con los años de historia. El informe de la misión se guarda en
+    la misma fila. Sin FKs: los usuarios, contactos y ubicaciones pueden
+    borrarse después sin tocar el archivo.
+    """
+    __tablename__ = "peticiones_archivo"
+    __table_args__ = (
+        # Historial de un usuario (más reciente primero)
+        Index("ix_peticiones_archivo_usuario_creado_en_id", "usuario_id", "creado_en", "id"),
+        # Paginación por clave del historial (ORDER BY creado_en DESC, id DESC)
+        Index("ix_peticiones_archivo_creado_en_id", "creado_en", "id"),
+        {"postgresql_partition_by": "RANGE (creado_en)"},
+    )
+
+    # La clave de partición tiene que ser parte de la clave primaria
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    creado_en = Column(DateTime, primary_key=True)
+    usuario_id = Column(UUID(as_uuid=True), nullable=False)
+    contacto_id = Column(UUID(as_uuid=True), nullable=True)
+    ubicacion_id = Column(UUID(as_uuid=True), nullable=True)
+    operador_id = Column(UUID(as_uuid=True), nullable=True)
+    profesional_id = Column(UUID(as_uuid=True), nullable=True)
+    estado_code = Column(String(20), nullable=False)
+    finalizado_en = Column(DateTime, nullable=True)
+    mensaje = Column(Text, nullable=True)
+    audio = Column(Text, nullable=True)
+    audio_estado = Column(String(20), nullable=True)
+    idempotency_key = Column(String(64), nullable=True)
+    # Informe de la misión (None si no tenía)
+    detalle_resolucion = Column(Text, nullable=True)
+    foto_url = Column(Text, nullable=True)
+    foto_estado = Column(String(20), nullable=True)
+    informe_creado_en = Column(DateTime, nullable=True)
+    archivado_en = Column(DateTime, server_default=func.now(), nullable=False)
+
+    # Solo lectura: mismas relaciones que Peticion para el historial del usuario
+    contacto = relationship(
+        "Contact",
+        primaryjoin="foreign(PeticionArchivada.contacto_id) == Contact.id",
+        viewonly=True
+    )
+    ubicacion = relationship(
+        "Ubicacion",
+        primaryjoin="foreign(PeticionArchivada.ubicacion_id) == Ubicacion.id",
+        viewonly=True
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, BigInteger, DateTime, Float, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from app.db.base import Base
+
+class PosicionProfesional(Base):
+    """Recorrido de los profesionales de terreno (muestreado, se escribe en lote)"""
+    __tablename__ = "posiciones_profesionales"
+    __table_args__ = (
+        Index("ix_posiciones_profesional_registrado", "profesional_id", "registrado_en"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    profesional_id = Column(UUID(as_uuid=True), ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
+    latitud = Column(Float, nullable=False)
+    longitud = Column(Float, nullable=False)
+    precision_m = Column(Float, nullable=True)
+    registrado_en = Column(DateTime, nullable=False)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, BigInteger, Boolean, DateTime, Index, String
+from sqlalchemy.dialects.postgresql import UUID
+from app.db.base import Base
+
+class TransicionPeticion(Base):
+    """
+    Registro de solo inserción con cada cambio de estado de una petición:
+    cuándo pasó, a qué estado y quién lo hizo. No tiene FK a peticiones
+    para que el historial sobreviva aunque la petición se archive.
+    """
+    __tablename__ = "transiciones_peticiones"
+    __table_args__ = (
+        # Línea de tiempo de una alerta
+        Index("ix_transiciones_peticion_registrado", "peticion_id", "registrado_en"),
+        # Consultas de SLA por período
+        Index("ix_transiciones_registrado", "registrado_en"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    peticion_id = Column(UUID(as_uuid=True), nullable=False)
+    estado_code = Column(String(20), nullable=False)  # Estado al que pasó
+    central = Column(Boolean, nullable=True)  # Petición central (sin contacto); None si no se sabe
+    usuario_id = Column(UUID(as_uuid=True), nullable=True)  # Quién hizo el cambio (operador, usuario)
+    profesional_id = Column(UUID(as_uuid=True), nullable=True)
+    registrado_en = Column(DateTime, nullable=False)
@@ -0,0 +1,324 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import threading
+import time
+
+from app.core.metrics import metrics
+from app.crud.crud_peticion import crud_peticion, ESTADOS_ACTIVOS
+from app.db.session import SessionLocal
+from app.models.peticion import Peticion
+from app.services.mission_notifier import mission_notifier
+from app.services.triage_queue import triage_queue
+from app.services.radar_feed import (
+    radar_feed,
+    EVENTO_CREADA,
+    EVENTO_ESTADO,
+    EVENTO_RESUELTA,
+    EVENTO_AUDIO
+)
+
+logger = logging.getLogger(__name__)
+
+def record_from_peticion(p: Peticion) -> Dict[str, Any]:
+    """Datos de una petición que necesitan el radar y la app del profesional"""
+    return {
+        "id": str(p.id),
+        "usuario_id": str(p.usuario_id),
+        "contacto_id": str(p.contacto_id) if p.contacto_id else None,
+        "profesional_id": str(p.profesional_id) if p.profesional_id else None,
+        "estado": p.estado_code,
+        # Numeric llega como Decimal: se guarda como float para serializar
+        "lat": float(p.ubicacion.latitud) if p.ubicacion else None,
+        "lng": float(p.ubicacion.longitud) if p.ubicacion else None,
+        "mensaje": p.mensaje,
+        "audio": p.audio,
+        "audio_estado": p.audio_estado,
+        "creado_en": p.creado_en
+    }
+
+def alerta_radar(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Representación de una alerta en el radar web"""
+    return {
+        "id": record["id"],
+        "usuario_id": record["usuario_id"],
+        "estado": record["estado"],
+        "lat": record["lat"],
+        "lng": record["lng"],
+        "audio": record["audio"],
+        "audio_estado": record["audio_estado"],
+        "fecha": record["creado_en"].isoformat() if record["creado_en"] else None
+    }
+
+def mision_profesional(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Representación de la misión asignada en la app del profesional"""
+    return {
+        "mision_id": record["id"],
+        "victima_id": record["usuario_id"],
+        "lat": record["lat"],
+        "lng": record["lng"],
+        "mensaje": record["mensaje"] or "Emergencia (Botón de Pánico)",
+        "audio": record["audio"],
+        "audio_estado": record["audio_estado"],
+        "estado": record["estado"]
+    }
+
+class ActiveAlertProjection:
+    """
+    Proyección en memoria del conjunto de trabajo en vivo.
+
+    Mantiene las alertas activas (pendiente / en triaje) indexadas por id y el
+    mapa profesional -> misión despachada. Los endpoints de escritura la
+    actualizan después de cada commit y ella publica el evento para el radar,
+    así /activas, /mision y el chequeo de despacho responden desde memoria.
+
+    Se reconstruye desde la BD al iniciar. Mientras no esté lista (`ready`)
+    los endpoints consultan la BD como antes. Un chequeo periódico compara
+    contra la BD, registra la deriva en métricas y se corrige solo; con varios
+    workers cada proceso solo ve sus propias escrituras hasta ese chequeo.
+    """
+
+    def __init__(self):
+        self._alerts: Dict[str, Dict[str, Any]] = {}
+        self._missions: Dict[str, Dict[str, Any]] = {}  # profesional_id -> record
+        self._mission_owner: Dict[str, str] = {}  # peticion_id -> profesional_id
+        self._version = 0
+        self.ready = False
+        self.lock = threading.RLock()
+
+    # ----------- Lecturas -----------
+
+    def active_alerts(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self._alerts.values())
+
+    def get_alert(self, peticion_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self._alerts.get(peticion_id)
+
+    def mission_for(self, profesional_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self._missions.get(profesional_id)
+
+    def is_busy(self, profesional_id: str) -> bool:
+        with self.lock:
+            return profesional_id in self._missions
+
+    def busy_professionals(self) -> List[str]:
+        """Profesionales con una misión despachada"""
+        with self.lock:
+            return list(self._missions)
+
+    # ----------- Escrituras (después del commit) -----------
+
+    def apply_created(self, records: List[Dict[str, Any]]):
+        """Alertas nuevas de un reporte"""
+        with self.lock:
+            for record in records:
+                if record["estado"] in ESTADOS_ACTIVOS:
+                    self._alerts[record["id"]] = record
+                    triage_queue.add(record, busy=self._missions)
+            self._touch()
+
+        for record in records:
+            radar_feed.publish(EVENTO_CREADA, alerta_radar(record))
+
+    def apply_dispatched(self, record: Dict[str, Any]):
+        """Una alerta pasó a ser la misión en curso de un profesional"""
+        with self.lock:
+            self._alerts.pop(record["id"], None)
+            triage_queue.remove(record["id"])
+            self._set_mission(record)
+            self._touch()
+
+        mission_notifier.notify(record["profesional_id"])
+
+        radar_feed.publish(EVENTO_ESTADO, {
+            "id": record["id"],
+            "estado": record["estado"],
+            "profesional_id": record["profesional_id"]
+        })
+
+    def apply_resolved(self, peticion_id: str):
+        """La alerta / misión fue resuelta"""
+        with self.lock:
+            self._alerts.pop(peticion_id, None)
+            triage_queue.remove(peticion_id)
+            owner = self._clear_mission(peticion_id)
+            self._touch()
+
+        if owner is not None:
+            mission_notifier.notify(owner)
+
+        radar_feed.publish(EVENTO_RESUELTA, {"id": peticion_id, "estado": "resuelta"})
+
+    def apply_audio(self, peticion_ids: List[str], audio_url: Optional[str], audio_estado: str):
+        """Terminó (o falló) la subida diferida del audio"""
+        with self.lock:
+            for peticion_id in peticion_ids:
+                record = self._alerts.get(peticion_id)
+                owner = self._mission_owner.get(peticion_id)
+                if record is None and owner is not None:
+                    record = self._missions.get(owner)
+                if record is not None:
+                    record["audio"] = audio_url
+                    record["audio_estado"] = audio_estado
+                    triage_queue.update(peticion_id)
+            self._touch()
+
+        for peticion_id in peticion_ids:
+            radar_feed.publish(EVENTO_AUDIO, {
+                "id": peticion_id,
+                "audio": audio_url,
+                "audio_estado": audio_estado
+            })
+
+    def _set_mission(self, record: Dict[str, Any]):
+        previous = self._missions.get(record["profesional_id"])
+        if previous is not None:
+            self._mission_owner.pop(previous["id"], None)
+        self._missions[record["profesional_id"]] = record
+        self._mission_owner[record["id"]] = record["profesional_id"]
+
+    def _clear_mission(self, peticion_id: str) -> Optional[str]:
+        owner = self._mission_owner.pop(peticion_id, None)
+        if owner is not None:
+            self._missions.pop(owner, None)
+        return owner
+
+    # ----------- Reconstrucción y consistencia -----------
+
+    def _load(self, db) -> Dict[str, Any]:
+        alerts = {}
+        for p in crud_peticion.get_alertas_activas(db):
+            alerts[str(p.id)] = record_from_peticion(p)
+
+        missions = {}
+        for p in crud_peticion.get_misiones_activas(db):
+            record = record_from_peticion(p)
+            missions[record["profesional_id"]] = record
+        return {"alerts": alerts, "missions": missions}
+
+    def _replace(self, state: Dict[str, Any]):
+        self._alerts = state["alerts"]
+        self._missions = {}
+        self._mission_owner = {}
+        for record in state["missions"].values():
+            self._set_mission(record)
+        triage_queue.replace(self._alerts.values(), busy=self._missions)
+        self._touch()
+
+    def rebuild(self, db=None):
+        """Cargar el conjunto de trabajo desde la BD (al iniciar la app)"""
+        owns_session = db is None
+        db = db or SessionLocal()
+        started = time.perf_counter()
+        try:
+            state = self._load(db)
+        finally:
+            if owns_session:
+                db.close()
+
+        with self.lock:
+            self._replace(state)
+            self.ready = True
+
+        metrics.observe("projection.rebuild_seconds", time.perf_counter() - started)
+        logger.info(
+            f"Proyección de alertas cargada: {len(state['alerts'])} activas, "
+            f"{len(state['missions'])} misiones en curso"
+        )
+
+    def check_consistency(self, db=None) -> Optional[int]:
+        """
+        Comparar contra la BD y corregir diferencias.
+
+        Retorna la cantidad de alertas/misiones que no coincidían, o None si
+        hubo escrituras durante la lectura (se reintenta en el próximo ciclo).
+        Las correcciones se publican en el radar como cualquier otro cambio,
+        así los clientes que piden deltas por cursor también las reciben.
+        """
+        with self.lock:
+            version = self._version
+
+        owns_session = db is None
+        db = db or SessionLocal()
+        try:
+            state = self._load(db)
+        finally:
+            if owns_session:
+                db.close()
+
+        with self.lock:
+            if self._version != version:
+                return None
+
+            changed_missions = self._diff(self._missions, state["missions"], "id")
+            drift = len(self._diff(self._alerts, state["alerts"], "estado")) + len(changed_missions)
+            events = []
+            if drift:
+                logger.warning(f"Proyección de alertas con {drift} diferencias contra la BD; se corrige")
+                events = self._radar_events(
+                    self._by_peticion(self._alerts, self._missions),
+                    self._by_peticion(state["alerts"], state["missions"])
+                )
+                self._replace(state)
+            self.ready = True
+
+        # Misiones corregidas (p. ej. despachadas desde otro worker)
+        for profesional_id in changed_missions:
+            mission_notifier.notify(profesional_id)
+        for tipo, data in events:
+            radar_feed.publish(tipo, data)
+
+        metrics.incr("projection.checks")
+        metrics.incr("projection.drift_total", drift)
+        metrics.set_gauge("projection.drift_last", drift)
+        return drift
+
+    @staticmethod
+    def _by_peticion(alerts: Dict[str, Dict[str, Any]], missions: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Alertas y misiones juntas, por ID de petición"""
+        records = dict(alerts)
+        records.update((record["id"], record) for record in missions.values())
+        return records
+
+    @staticmethod
+    def _radar_events(
+        current: Dict[str, Dict[str, Any]],
+        expected: Dict[str, Dict[str, Any]]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Eventos del radar que llevan de `current` a `expected` (los mismos que las escrituras)"""
+        events = []
+        for peticion_id, record in expected.items():
+            before = current.get(peticion_id)
+            if before is None:
+                events.append((EVENTO_CREADA, alerta_radar(record)))
+            elif (before["estado"], before.get("profesional_id")) != (record["estado"], record.get("profesional_id")):
+                events.append((EVENTO_ESTADO, {
+                    "id": peticion_id,
+                    "estado": record["estado"],
+                    "profesional_id": record.get("profesional_id")
+                }))
+        for peticion_id in current.keys() - expected.keys():
+            events.append((EVENTO_RESUELTA, {"id": peticion_id, "estado": "resuelta"}))
+        return events
+
+    @staticmethod
+    def _diff(current: Dict[str, Dict[str, Any]], expected: Dict[str, Dict[str, Any]], field: str) -> List[str]:
+        keys = set(current) | set(expected)
+        return [
+            key for key in keys
+            if key not in current or key not in expected or current[key][field] != expected[key][field]
+        ]
+
+    def _touch(self):
+        # Marca una escritura: invalida un chequeo de consistencia en curso
+        self._version += 1
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.set_gauge("projection.active_alerts", len(self._alerts))
+        metrics.set_gauge("projection.active_missions", len(self._missions))
+
+# Instancia singleton de la proyección
+alert_projection = ActiveAlertProjection()
@@ -0,0 +1,151 @@
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Tuple
+import logging
+import threading
+
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def _is_transient(error: Exception) -> bool:
+    """True si la falla es de la BD (caída, conexión, pool) y no de las filas"""
+    if isinstance(error, (OperationalError, InterfaceError, DisconnectionError, PoolTimeout)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+class BatchWriter:
+    """
+    Acumula filas en memoria y las escribe en lote desde un hilo propio.
+
+    Los endpoints llaman a `add` (no toca la BD) y cada `interval_seconds`,
+    o antes si se juntan `max_batch` filas, el hilo llama a `flush_fn` con
+    todo lo acumulado: una sola transacción en lugar de una por fila.
+
+    Si la BD no responde las filas se conservan para el siguiente intento,
+    hasta `max_pending`; pasado ese límite se descartan las más viejas y se
+    cuentan en la métrica `<name>.dropped`. Si el lote falla por sus datos
+    (una fila que viola una restricción) se divide en mitades hasta aislar
+    las filas que fallan solas: esas se descartan (se loguean y se cuentan
+    en `<name>.dead_letter`) y el resto se escribe. `flush_fn` tiene que
+    escribir cada lote en una sola transacción.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Any]], None],
+        *,
+        interval_seconds: float = 5,
+        max_batch: int = 1000,
+        max_pending: int = 100000
+    ):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.interval_seconds = interval_seconds
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._pending: Deque[Any] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, item: Any):
+        """Encolar una fila para la próxima escritura"""
+        with self._lock:
+            self._ensure_started()
+            self._pending.append(item)
+            dropped = len(self._pending) - self.max_pending
+            for _ in range(max(0, dropped)):
+                self._pending.popleft()
+            full = len(self._pending) >= self.max_batch
+
+        if dropped > 0:
+            metrics.incr(f"{self.name}.dropped", dropped)
+        if full:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_started(self):
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """Escribir ya lo pendiente (en lotes de `max_batch`). Retorna las filas escritas."""
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not batch:
+                return written
+
+            try:
+                self.flush_fn(batch)
+                batch_written, retry = len(batch), []
+            except Exception as e:
+                logger.error(f"Error escribiendo lote de {self.name} ({len(batch)} filas): {e}")
+                metrics.incr(f"{self.name}.flush_errors")
+                if _is_transient(e):
+                    batch_written, retry = 0, batch
+                else:
+                    batch_written, retry = self._bisect(batch)
+
+            written += batch_written
+            metrics.incr(f"{self.name}.written", batch_written)
+            if retry:
+                with self._lock:
+                    # Devolver lo no escrito al frente para reintentar en el próximo ciclo
+                    self._pending.extendleft(reversed(retry))
+                return written
+            metrics.set_gauge(f"{self.name}.pending", self.pending())
+
+    def _bisect(self, batch: List[Any]) -> Tuple[int, List[Any]]:
+        """
+        Escribir por mitades un lote que falló por sus datos. Retorna las
+        filas escritas y las que quedan para reintentar (si la BD se cayó a
+        mitad de camino); las filas que fallan solas se descartan.
+        """
+        if len(batch) == 1:
+            logger.error(f"Fila descartada de {self.name}: {batch[0]!r}")
+            metrics.incr(f"{self.name}.dead_letter")
+            return 0, []
+
+        mid = len(batch) // 2
+        written = 0
+        for start, half in ((0, batch[:mid]), (mid, batch[mid:])):
+            try:
+                self.flush_fn(half)
+            except Exception as e:
+                if _is_transient(e):
+                    return written, batch[start:]
+                half_written, retry = self._bisect(half)
+                written += half_written
+                if retry:
+                    return written, retry + batch[start + len(half):]
+            else:
+                written += len(half)
+        return written, []
+
+    def shutdown(self, flush: bool = True):
+        """Detener el hilo; por defecto escribe lo que quedó pendiente"""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None:
+            thread.join()
+        if flush:
+            self.flush()
@@ -0,0 +1,224 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from app.core.config import settings
+from app.services.media_spool import CHUNK_BYTES
+
+class IncompleteUpload(Exception):
+    """Faltan partes (o alguna tiene un tamaño distinto al esperado)"""
+
+class ChunkedUploadStore:
+    """
+    Subidas de audio reanudables, guardadas en disco.
+
+    Cada subida es un directorio en `base_dir` con un manifest.json y un
+    archivo por parte (chunk_00000, ...). Las partes se escriben a un
+    temporal y se renombran al completarse, así que una parte cortada a la
+    mitad no cuenta como recibida: el celular pregunta cuáles faltan y
+    reenvía solo esas. Nada queda en memoria entre requests, de modo que la
+    subida sobrevive a un reinicio del proceso.
+
+    El cierre se toma con un marcador `finalizando`; confirmar una parte y
+    tomar el cierre se hacen bajo un flock del directorio, así ninguna parte
+    cambia mientras se unen. Si el proceso muere a mitad del cierre, el
+    marcador vence a los `finalize_timeout` segundos y el cliente puede
+    volver a finalizar (un evento de subida repetido no hace daño: el
+    handler del outbox solo sube si el audio sigue pendiente).
+    """
+
+    def __init__(self, base_dir: str, finalize_timeout: float):
+        self.base_dir = base_dir
+        self.finalize_timeout = finalize_timeout
+
+    def _dir(self, upload_id: str) -> str:
+        # upload_id viene de la URL: solo se aceptan UUID (sin rutas relativas)
+        return os.path.join(self.base_dir, UUID(upload_id).hex)
+
+    def _chunk_path(self, upload_id: str, index: int) -> str:
+        return os.path.join(self._dir(upload_id), f"chunk_{index:05d}")
+
+    def _marker_path(self, manifest: Dict[str, Any]) -> str:
+        return os.path.join(self._dir(manifest["upload_id"]), "finalizando")
+
+    @contextmanager
+    def _locked(self, manifest: Dict[str, Any]):
+        """flock exclusivo sobre la subida (vale entre procesos del mismo host)"""
+        fd = os.open(os.path.join(self._dir(manifest["upload_id"]), "lock"), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _closed(self, manifest: Dict[str, Any]) -> bool:
+        """True si la subida ya terminó o alguien tiene el cierre (leído del disco)"""
+        current = self.get(manifest["upload_id"])
+        return (current is None or current["finalizada"]) or self.is_finalizing(manifest)
+
+    # ----------- Manifest -----------
+
+    def create(
+        self,
+        *,
+        report_id: str,
+        usuario_id: str,
+        peticion_ids: List[str],
+        total_bytes: int,
+        chunk_bytes: int,
+        filename: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Iniciar una subida. Retorna su manifest."""
+        upload_id = uuid.uuid4().hex
+        manifest = {
+            "upload_id": upload_id,
+            "report_id": report_id,
+            "usuario_id": usuario_id,
+            "peticion_ids": peticion_ids,
+            "total_bytes": total_bytes,
+            "chunk_bytes": chunk_bytes,
+            "total_chunks": max(1, -(-total_bytes // chunk_bytes)),
+            "suffix": os.path.splitext(filename or "")[1][:10],
+            "finalizada": False,
+            "creada_en": datetime.utcnow().isoformat()
+        }
+        os.makedirs(self._dir(upload_id))
+        self._write_manifest(manifest)
+        return manifest
+
+    def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Manifest de la subida, o None si no existe (o el ID no es válido)"""
+        try:
+            with open(os.path.join(self._dir(upload_id), "manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        directory = self._dir(manifest["upload_id"])
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(directory, "manifest.json"))
+
+    # ----------- Partes -----------
+
+    def expected_size(self, manifest: Dict[str, Any], index: int) -> int:
+        """Tamaño que debe tener la parte `index`"""
+        if index < manifest["total_chunks"] - 1:
+            return manifest["chunk_bytes"]
+        return manifest["total_bytes"] - manifest["chunk_bytes"] * (manifest["total_chunks"] - 1)
+
+    def received(self, manifest: Dict[str, Any]) -> List[int]:
+        """Partes completas ya guardadas"""
+        directory = self._dir(manifest["upload_id"])
+        indexes = []
+        for name in os.listdir(directory):
+            if name.startswith("chunk_"):
+                index = int(name[len("chunk_"):])
+                if os.path.getsize(os.path.join(directory, name)) == self.expected_size(manifest, index):
+                    indexes.append(index)
+        return sorted(indexes)
+
+    def open_chunk(self, manifest: Dict[str, Any]):
+        """Archivo temporal para escribir una parte; se confirma con `commit_chunk`"""
+        fd, tmp = tempfile.mkstemp(dir=self._dir(manifest["upload_id"]), suffix=".part")
+        return os.fdopen(fd, "wb"), tmp
+
+    def commit_chunk(self, manifest: Dict[str, Any], index: int, tmp: str) -> bool:
+        """Confirmar una parte. False si la subida ya se está finalizando (el temporal queda)."""
+        with self._locked(manifest):
+            if self._closed(manifest):
+                return False
+            os.replace(tmp, self._chunk_path(manifest["upload_id"], index))
+            return True
+
+    # ----------- Cierre -----------
+
+    def claim_finalize(self, manifest: Dict[str, Any]) -> bool:
+        """
+        Tomar el cierre de la subida; False si otra request ya lo está
+        haciendo (o la subida ya terminó). Un marcador vencido se reemplaza.
+        """
+        with self._locked(manifest):
+            if self._closed(manifest):
+                return False
+            with open(self._marker_path(manifest), "w"):
+                pass
+            os.utime(self._marker_path(manifest))
+            return True
+
+    def is_finalizing(self, manifest: Dict[str, Any]) -> bool:
+        """True si otra request tomó el cierre hace menos de `finalize_timeout`"""
+        try:
+            claimed_at = os.path.getmtime(self._marker_path(manifest))
+        except FileNotFoundError:
+            return False
+        return time.time() - claimed_at < self.finalize_timeout
+
+    def release_finalize(self, manifest: Dict[str, Any]):
+        try:
+            os.remove(self._marker_path(manifest))
+        except FileNotFoundError:
+            pass
+
+    def assemble(self, manifest: Dict[str, Any]) -> str:
+        """
+        Unir las partes en un solo archivo en MEDIA_SPOOL_DIR, copiando de a
+        bloques (sin cargar el audio en memoria). Retorna su ruta.
+
+        Raises:
+            IncompleteUpload: si falta alguna parte
+        """
+        missing = sorted(set(range(manifest["total_chunks"])) - set(self.received(manifest)))
+        if missing:
+            raise IncompleteUpload(missing)
+
+        os.makedirs(settings.MEDIA_SPOOL_DIR, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=settings.MEDIA_SPOOL_DIR, suffix=manifest["suffix"])
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for index in range(manifest["total_chunks"]):
+                    with open(self._chunk_path(manifest["upload_id"], index), "rb") as chunk:
+                        shutil.copyfileobj(chunk, out, CHUNK_BYTES)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def mark_finalized(self, manifest: Dict[str, Any]):
+        """Registrar que la subida terminó y borrar sus partes (quedan el manifest y el lock)"""
+        with self._locked(manifest):
+            manifest["finalizada"] = True
+            self._write_manifest(manifest)
+            directory = self._dir(manifest["upload_id"])
+            for name in os.listdir(directory):
+                if name not in ("manifest.json", "lock"):
+                    os.remove(os.path.join(directory, name))
+
+    def purge_expired(self, ttl_seconds: float) -> int:
+        """Borrar las subidas sin actividad en `ttl_seconds`. Retorna cuántas."""
+        if not os.path.isdir(self.base_dir):
+            return 0
+        limit = time.time() - ttl_seconds
+        purged = 0
+        for name in os.listdir(self.base_dir):
+            directory = os.path.join(self.base_dir, name)
+            if os.path.isdir(directory) and os.path.getmtime(directory) < limit:
+                shutil.rmtree(directory, ignore_errors=True)
+                purged += 1
+        return purged
+
+# Instancia singleton del almacén de subidas
+chunked_uploads = ChunkedUploadStore(
+    os.path.join(settings.MEDIA_SPOOL_DIR, "subidas"),
+    finalize_timeout=settings.AUDIO_UPLOAD_FINALIZE_TIMEOUT_SECONDS
+)
@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import threading
+import time
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.posicion_profesional import PosicionProfesional
+from app.services.batch_writer import BatchWriter
+
+def _write_positions(rows: List[Dict[str, Any]]):
+    """Insertar un lote de posiciones en una sola transacción"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(PosicionProfesional), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class LocationHistory:
+    """
+    Recorrido de los profesionales, muestreado y escrito en lote.
+
+    El celular manda un ping cada pocos segundos; aquí se guarda como máximo
+    una posición por profesional cada `sample_seconds` y el BatchWriter las
+    inserta juntas cada `flush_seconds`. La posición en vivo no depende de
+    esto: la sirve professional_locator desde memoria.
+    """
+
+    def __init__(self, sample_seconds: float = 30, flush_seconds: float = 10):
+        self.sample_seconds = sample_seconds
+        self._last_sample: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.writer = BatchWriter(
+            "location_history",
+            _write_positions,
+            interval_seconds=flush_seconds
+        )
+
+    def record(
+        self,
+        profesional_id: str,
+        lat: float,
+        lng: float,
+        registrado_en: datetime,
+        precision_m: Optional[float] = None
+    ) -> bool:
+        """Encolar la posición si toca muestrearla. Retorna si se guardará."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_sample.get(profesional_id)
+            if last is not None and now - last < self.sample_seconds:
+                return False
+            self._last_sample[profesional_id] = now
+
+        self.writer.add({
+            "profesional_id": profesional_id,
+            "latitud": lat,
+            "longitud": lng,
+            "precision_m": precision_m,
+            "registrado_en": registrado_en
+        })
+        return True
+
+    def shutdown(self):
+        self.writer.shutdown(flush=True)
+
+# Instancia singleton del recorrido
+location_history = LocationHistory(
+    sample_seconds=settings.LOCATION_HISTORY_SAMPLE_SECONDS,
+    flush_seconds=settings.LOCATION_HISTORY_FLUSH_SECONDS
+)
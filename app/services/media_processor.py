@@ -0,0 +1,219 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él las fotos se suben tal cual
+    Image = None
+    ImageOps = None
+
+# ----------- Trabajos (corren en los procesos del pool) -----------
+# Son funciones de módulo para que se puedan enviar a otro proceso. Reciben
+# y devuelven rutas: nunca se pasan los bytes del archivo entre procesos.
+
+def _output_path(path: str, suffix: str) -> str:
+    fd, out = tempfile.mkstemp(dir=os.path.dirname(path), suffix=suffix)
+    os.close(fd)
+    return out
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class SkipCompaction(Exception):
+    """El archivo no se compacta a propósito (se sube el original); el motivo va en args[0]"""
+
+def _audio_seconds(path: str, timeout: float) -> Optional[float]:
+    """Duración del audio según ffprobe, o None si no se pudo averiguar"""
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+    try:
+        result = subprocess.run(
+            [
+                ffprobe, "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                path
+            ],
+            check=True,
+            timeout=timeout,
+            capture_output=True,
+            text=True
+        )
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, ValueError):
+        return None
+
+def compact_image(path: str, max_side: int, quality: int) -> Optional[str]:
+    """
+    Reducir la foto a `max_side` px en su lado mayor y recomprimirla en JPEG.
+    Retorna la ruta del archivo nuevo, o None si no se pudo o no achicaba.
+    """
+    if Image is None:
+        return None
+    out = _output_path(path, ".jpg")
+    keep = False
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_side, max_side))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+        keep = os.path.getsize(out) < os.path.getsize(path)
+    finally:
+        # Cualquier salida que no sea la ruta nueva borra el temporal
+        if not keep:
+            _discard(out)
+    return out if keep else None
+
+def compact_audio(path: str, max_seconds: int, bitrate: str, timeout: float) -> Optional[str]:
+    """
+    Normalizar el volumen y pasar a mono AAC con `bitrate` (ffmpeg). El
+    audio nunca se recorta: si dura más de `max_seconds` se sube el original.
+    Retorna la ruta nueva, o None si no hay ffmpeg o el resultado no achicaba.
+
+    Raises:
+        SkipCompaction: si el audio supera `max_seconds`
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    seconds = _audio_seconds(path, timeout)
+    if seconds is not None and seconds > max_seconds:
+        raise SkipCompaction(f"el audio dura {seconds:.0f}s (máximo {max_seconds}s)")
+    out = _output_path(path, ".m4a")
+    keep = False
+    try:
+        subprocess.run(
+            [
+                ffmpeg, "-nostdin", "-y", "-loglevel", "error",
+                "-i", path,
+                "-af", "loudnorm",
+                "-ac", "1", "-c:a", "aac", "-b:a", bitrate,
+                out
+            ],
+            check=True,
+            timeout=timeout,  # ffmpeg se corta solo: no queda ocupando el proceso
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        keep = os.path.getsize(out) < os.path.getsize(path)
+    finally:
+        if not keep:
+            _discard(out)
+    return out if keep else None
+
+def _discard_late_result(future):
+    """Borrar lo que produjo un trabajo que terminó después de su timeout"""
+    if not future.cancelled() and future.exception() is None and future.result():
+        _discard(future.result())
+
+# ----------- Orquestación (desde los hilos del MediaWorker) -----------
+
+# Margen sobre el timeout de ffmpeg al esperar el resultado: ffmpeg se corta
+# solo y el trabajo tiene que poder informar eso antes de que se lo abandone
+AUDIO_WAIT_MARGIN_SECONDS = 5
+
+class MediaProcessor:
+    """
+    Compacta fotos y audios antes de subirlos, en un ProcessPoolExecutor
+    acotado: el trabajo pesado de CPU no compite por el GIL con las requests.
+
+    Cada trabajo tiene timeout. Si falla, vence o no achica el archivo, se
+    sube el original (la multimedia de una emergencia nunca se pierde por
+    esto). El original nunca se borra aquí: la versión compactada es un
+    archivo nuevo y quien llama borra cada uno cuando ya no lo necesita.
+    Los procesos se crean con "spawn": no heredan los hilos, locks ni
+    conexiones del proceso de la app. Métricas: media.<tipo>.bytes_in /
+    bytes_out / bytes_saved, media.<tipo>.seconds, media.<tipo>.timeouts,
+    media.<tipo>.skipped y media.<tipo>.errors.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def process_image(self, path: str) -> str:
+        """Ruta a subir para la foto: la compactada (archivo nuevo), o la original si no se pudo"""
+        return self._run(
+            "image", path, settings.MEDIA_IMAGE_TIMEOUT_SECONDS,
+            compact_image, path, settings.MEDIA_IMAGE_MAX_SIDE, settings.MEDIA_IMAGE_JPEG_QUALITY
+        )
+
+    def process_audio(self, path: str) -> str:
+        """Ruta a subir para el audio: el compactado (archivo nuevo), o el original si no se pudo"""
+        timeout = settings.MEDIA_AUDIO_TIMEOUT_SECONDS
+        return self._run(
+            "audio", path, timeout + AUDIO_WAIT_MARGIN_SECONDS,
+            compact_audio, path, settings.MEDIA_AUDIO_MAX_SECONDS, settings.MEDIA_AUDIO_BITRATE, timeout
+        )
+
+    def _run(self, kind: str, path: str, timeout: float, fn, *args) -> str:
+        if not settings.MEDIA_PROCESSING_ENABLED:
+            return path
+
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+            out = future.result(timeout=timeout)
+        except FutureTimeout:
+            # Si todavía no empezó no corre; si ya está corriendo, lo que
+            # produzca al terminar se borra
+            if not future.cancel():
+                future.add_done_callback(_discard_late_result)
+            logger.warning(f"Compactación de {kind} vencida ({timeout}s); se sube el original")
+            metrics.incr(f"media.{kind}.timeouts")
+            return path
+        except SkipCompaction as e:
+            logger.info(f"No se compacta {kind}: {e.args[0]}; se sube el original")
+            metrics.incr(f"media.{kind}.skipped")
+            return path
+        except Exception as e:
+            logger.warning(f"No se pudo compactar {kind}: {e}; se sube el original")
+            metrics.incr(f"media.{kind}.errors")
+            return path
+        finally:
+            metrics.observe(f"media.{kind}.seconds", time.perf_counter() - started)
+
+        bytes_in = os.path.getsize(path)
+        bytes_out = os.path.getsize(out) if out else bytes_in
+        metrics.incr(f"media.{kind}.bytes_in", bytes_in)
+        metrics.incr(f"media.{kind}.bytes_out", bytes_out)
+        metrics.incr(f"media.{kind}.bytes_saved", bytes_in - bytes_out)
+        return out or path
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+# Instancia singleton del procesador
+media_processor = MediaProcessor(max_workers=settings.MEDIA_PROCESS_WORKERS)
@@ -0,0 +1,63 @@
+from typing import BinaryIO
+import base64
+import os
+import tempfile
+
+from app.core.config import settings
+
+# Tamaño de cada lectura al copiar un archivo subido
+CHUNK_BYTES = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    """El archivo subido supera el tamaño máximo permitido"""
+
+def spool_to_disk(source: BinaryIO, *, max_bytes: int, suffix: str = "") -> str:
+    """
+    Copiar un archivo subido a MEDIA_SPOOL_DIR de a CHUNK_BYTES, sin tenerlo
+    entero en memoria. Retorna la ruta del archivo; quien lo use lo borra
+    con `discard` al terminar.
+
+    Raises:
+        UploadTooLarge: si supera `max_bytes` (no queda ningún archivo)
+    """
+    os.makedirs(settings.MEDIA_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.MEDIA_SPOOL_DIR, suffix=suffix)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera {max_bytes} bytes")
+                out.write(chunk)
+    except BaseException:
+        discard(path)
+        raise
+    return path
+
+def spool_base64(data: str, *, suffix: str = "") -> str:
+    """
+    Decodificar un archivo en base64 (con o sin prefijo data URI) a
+    MEDIA_SPOOL_DIR. Retorna la ruta; se borra con `discard`.
+    """
+    if data.startswith("data:"):
+        data = data.split(",", 1)[1]
+    os.makedirs(settings.MEDIA_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.MEDIA_SPOOL_DIR, suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(base64.b64decode(data))
+    except BaseException:
+        discard(path)
+        raise
+    return path
+
+def discard(path: str):
+    """Borrar un archivo temporal (si ya no existe, no hace nada)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,161 @@
+from typing import Any, Callable, List, Optional
+from uuid import UUID
+import logging
+import os
+
+from app.core.config import settings
+from app.crud.crud_peticion import crud_peticion
+from app.db.session import SessionLocal
+from app.models.evento_outbox import EVENTO_AUDIO_REPORTE, EVENTO_FOTO_INFORME
+from app.models.peticion import MEDIA_LISTA, MEDIA_FALLIDA
+from app.services.alert_projection import alert_projection
+from app.services.media_processor import media_processor
+from app.services.media_spool import discard
+from app.services.outbox_worker import RetryLater, outbox_worker
+from app.services.storage_service import AUDIO, IMAGEN, storage_service
+
+logger = logging.getLogger(__name__)
+
+class MediaWorker:
+    """
+    Sube la multimedia de emergencias en segundo plano.
+
+    Los endpoints guardan el reporte con el audio/foto en estado "pendiente"
+    y responden de inmediato; la subida llega aquí por el outbox (eventos
+    audio_reporte / foto_informe). El worker abre su propia sesión de BD y
+    guarda la URL, de modo que la latencia del operador no depende de
+    Cloudinary. El outbox es el único camino de reintento: su backoff
+    reemplaza a la antigua cola de reintentos en disco.
+
+    Si un evento ya se procesó se decide por la BD (el audio/foto dejó de
+    estar pendiente), no por el archivo en disco. El evento guarda la ruta
+    del archivo en MEDIA_SPOOL_DIR (volumen compartido), no su contenido.
+    Si la subida o el guardado de la URL fallan, el handler lanza y el
+    outbox reintenta; el archivo se borra recién cuando la URL quedó
+    confirmada. En el último intento el audio/foto se marca como fallido.
+    """
+
+    def _finish_audio(self, peticion_ids: List[UUID], audio_url: Optional[str]):
+        """Guardar la URL del audio (o marcarlo fallido). Lanza si la BD falla."""
+        if not audio_url:
+            logger.error(f"No se pudo subir el audio de las peticiones {peticion_ids}")
+
+        db = SessionLocal()
+        try:
+            crud_peticion.attach_audio(db, peticion_ids=peticion_ids, audio_url=audio_url)
+        finally:
+            db.close()
+
+        # Avisar al radar para que muestre el audio listo (o fallido)
+        alert_projection.apply_audio(
+            [str(peticion_id) for peticion_id in peticion_ids],
+            audio_url,
+            MEDIA_LISTA if audio_url else MEDIA_FALLIDA
+        )
+        return audio_url
+
+    def _finish_image(self, informe_id: UUID, foto_url: Optional[str]):
+        """Guardar la URL de la foto (o marcarla fallida). Lanza si la BD falla."""
+        if not foto_url:
+            logger.error(f"No se pudo subir la foto del informe {informe_id}")
+
+        db = SessionLocal()
+        try:
+            crud_peticion.attach_informe_foto(db, informe_id=informe_id, foto_url=foto_url)
+        finally:
+            db.close()
+        return foto_url
+
+    # ----------- Eventos del outbox -----------
+    # Corren en los hilos del OutboxWorker: la subida se hace ahí mismo y el
+    # evento se da por hecho solo si el handler termina sin lanzar.
+
+    def handle_audio_event(self, evento):
+        """Subir el audio de un reporte ya confirmado en la BD"""
+        peticion_ids = [UUID(peticion_id) for peticion_id in evento.payload["peticion_ids"]]
+        path = evento.payload["archivo"]
+        db = SessionLocal()
+        try:
+            pendiente = crud_peticion.audio_pendiente(db, peticion_ids=peticion_ids)
+        finally:
+            db.close()
+
+        if not pendiente:
+            # Un intento anterior ya guardó el resultado
+            discard(path)
+            return None
+        if not os.path.exists(path):
+            logger.error(f"El audio de {peticion_ids} ya no está en {path}")
+            return self._finish_audio(peticion_ids, None)
+        return self._handle_upload(
+            evento, path,
+            media_processor.process_audio,
+            AUDIO,
+            lambda url: self._finish_audio(peticion_ids, url)
+        )
+
+    def handle_image_event(self, evento):
+        """Subir la foto de un informe ya confirmado en la BD"""
+        informe_id = UUID(evento.payload["informe_id"])
+        path = evento.payload["archivo"]
+        db = SessionLocal()
+        try:
+            pendiente = crud_peticion.foto_pendiente(db, informe_id=informe_id)
+        finally:
+            db.close()
+
+        if not pendiente:
+            discard(path)
+            return None
+        if not os.path.exists(path):
+            logger.error(f"La foto del informe {informe_id} ya no está en {path}")
+            return self._finish_image(informe_id, None)
+        return self._handle_upload(
+            evento, path,
+            media_processor.process_image,
+            IMAGEN,
+            lambda url: self._finish_image(informe_id, url)
+        )
+
+    @staticmethod
+    def _handle_upload(
+        evento,
+        path: str,
+        process: Callable[[str], str],
+        kind: str,
+        finish: Callable[[Optional[str]], Any]
+    ):
+        """
+        Compactar, subir y guardar la URL. Si el almacenamiento está caído o
+        el circuit breaker rechaza la subida (abierto, o semiabierto con la
+        prueba ya en curso) se pospone el evento sin gastar un intento y sin
+        marcar nada como fallido; si la subida falla se lanza
+        para que el outbox reintente, salvo en el último intento, en el que
+        se guarda como fallida. El original se borra recién cuando la URL
+        quedó guardada: hasta entonces es la única copia.
+        """
+        if not storage_service.available:
+            raise RetryLater(settings.STORAGE_BREAKER_RESET_SECONDS, "Almacenamiento no disponible")
+
+        upload_path = process(path)
+        try:
+            attempted, url = storage_service.try_save(upload_path, kind)
+        finally:
+            if upload_path != path:
+                discard(upload_path)  # La versión compactada se regenera si hace falta
+        if not attempted:
+            raise RetryLater(settings.STORAGE_BREAKER_RESET_SECONDS, "Subida rechazada por el circuit breaker")
+        if url is None and evento.intentos < outbox_worker.max_attempts:
+            raise RuntimeError("La subida falló")
+        result = finish(url)
+        discard(path)
+        return result
+
+    def shutdown(self, wait: bool = True):
+        """Apagar el pool de compactación (llamar al apagar la app, después del outbox)"""
+        media_processor.shutdown(wait=wait)
+
+# Instancia singleton del worker
+media_worker = MediaWorker()
+outbox_worker.register(EVENTO_AUDIO_REPORTE, media_worker.handle_audio_event)
+outbox_worker.register(EVENTO_FOTO_INFORME, media_worker.handle_image_event)
@@ -0,0 +1,52 @@
+from typing import Dict, List, Tuple
+import asyncio
+import threading
+
+class MissionNotifier:
+    """
+    Registro en memoria de las apps de profesionales esperando novedades de
+    su misión (long-poll de GET /emergency/mision).
+
+    La request se registra y duerme sin consultar la BD; cuando la proyección
+    de alertas despacha o resuelve una misión avisa aquí y la request se
+    despierta al instante. `notify` se puede llamar desde cualquier hilo.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, profesional_id: str) -> asyncio.Event:
+        """Anotar una espera del profesional (llamar desde el event loop)"""
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.setdefault(profesional_id, []).append((asyncio.get_running_loop(), event))
+        return event
+
+    def unregister(self, profesional_id: str, event: asyncio.Event):
+        with self._lock:
+            waiters = self._waiters.get(profesional_id)
+            if waiters is None:
+                return
+            waiters[:] = [(loop, e) for loop, e in waiters if e is not event]
+            if not waiters:
+                del self._waiters[profesional_id]
+
+    def notify(self, profesional_id: str):
+        """Despertar las esperas del profesional: su misión cambió"""
+        with self._lock:
+            waiters = list(self._waiters.get(profesional_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # El event loop ya se cerró (apagado del worker)
+                pass
+
+    def waiting(self) -> int:
+        """Cantidad de esperas abiertas"""
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+# Instancia singleton del registro
+mission_notifier = MissionNotifier()
@@ -0,0 +1,139 @@
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import threading
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.crud.crud_outbox import crud_outbox
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+class RetryLater(Exception):
+    """
+    Lanzada por un handler que no pudo ni empezar (p. ej. el proveedor
+    está caído): el evento se pospone `seconds` sin gastar un intento.
+    """
+
+    def __init__(self, seconds: float, reason: str = ""):
+        super().__init__(reason or f"Pospuesto {seconds}s")
+        self.seconds = seconds
+
+class OutboxWorker:
+    """
+    Consume la tabla outbox_eventos con un pool de hilos.
+
+    Cada hilo toma lotes con SELECT ... FOR UPDATE SKIP LOCKED (ver
+    crud_outbox.claim), así que se pueden correr varios hilos y varios
+    procesos de la API a la vez: cada evento lo toma uno solo. Los handlers
+    se registran por tipo de evento, reciben la fila (id, tipo, payload,
+    intentos) y deben tolerar ejecutarse más de una vez (la entrega es al
+    menos una vez).
+
+    Si un handler lanza, el evento se reintenta con backoff exponencial
+    hasta `max_attempts`; después queda registrado con su último error.
+    Las requests llaman a `wake` después del commit para que el evento se
+    procese de inmediato en vez de esperar al próximo sondeo.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        poll_seconds: float = 2,
+        batch_size: int = 10,
+        lease_seconds: float = 300,
+        max_attempts: int = 10
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._handlers: Dict[str, Callable[[Any], Any]] = {}
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def register(self, tipo: str, handler: Callable[[Any], Any]):
+        """Asociar el handler de un tipo de evento"""
+        self._handlers[tipo] = handler
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        """Avisar que hay eventos nuevos (llamar después del commit)"""
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Terminar los hilos (cada uno termina el lote que tiene en curso)"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.drain_once()
+            except Exception as e:
+                logger.error(f"Error leyendo el outbox: {e}")
+                processed = 0
+            if processed == 0:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Tomar y procesar un lote. Retorna cuántos eventos se tomaron."""
+        db = SessionLocal()
+        try:
+            eventos = crud_outbox.claim(db, limit=self.batch_size, lease_seconds=self.lease_seconds)
+            for evento in eventos:
+                self._handle(db, evento)
+            return len(eventos)
+        finally:
+            db.close()
+
+    def _handle(self, db, evento):
+        handler = self._handlers.get(evento.tipo)
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"Sin handler para eventos '{evento.tipo}'")
+            handler(evento)
+        except RetryLater as e:
+            metrics.incr("outbox.pospuestos")
+            crud_outbox.postpone(db, evento_id=evento.id, error=str(e), retry_seconds=e.seconds)
+            return
+        except Exception as e:
+            retry_seconds = None
+            if evento.intentos < self.max_attempts:
+                retry_seconds = min(self.lease_seconds, 2 ** evento.intentos)
+                metrics.incr("outbox.fallidos")
+            else:
+                metrics.incr("outbox.abandonados")
+            logger.error(f"Evento {evento.id} ({evento.tipo}) falló en el intento {evento.intentos}: {e}")
+            crud_outbox.mark_failed(db, evento_id=evento.id, error=str(e), retry_seconds=retry_seconds)
+            return
+        finally:
+            metrics.observe(f"outbox.{evento.tipo}.seconds", time.perf_counter() - started)
+
+        crud_outbox.mark_done(db, evento_id=evento.id)
+        metrics.incr("outbox.procesados")
+
+# Instancia singleton del worker
+outbox_worker = OutboxWorker(
+    workers=settings.OUTBOX_WORKERS,
+    poll_seconds=settings.OUTBOX_POLL_SECONDS,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+)
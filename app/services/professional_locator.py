@@ -0,0 +1,182 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import math
+import threading
+import time
+
+from app.core.config import settings
+
+# Radio medio de la Tierra en km (el mismo que usa la búsqueda de centros)
+RADIO_TIERRA_KM = 6371
+# Kilómetros por grado de latitud
+KM_POR_GRADO = 111.32
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distancia en línea recta entre dos puntos, en km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class ProfessionalLocator:
+    """
+    Índice espacial en memoria con la última posición de cada profesional.
+
+    Divide el mapa en una grilla de celdas de `cell_degrees` grados; cada
+    celda guarda los profesionales que están dentro. La búsqueda de los más
+    cercanos recorre anillos de celdas alrededor del punto y corta apenas
+    ninguna celda sin revisar puede tener a alguien más cerca, así que con
+    cientos de profesionales responde en microsegundos sin tocar la BD.
+
+    Cada posición vence a los `heartbeat_ttl` segundos sin un nuevo ping:
+    es también la señal de en línea / fuera de línea del profesional.
+    """
+
+    def __init__(self, cell_degrees: float = 0.05, heartbeat_ttl: float = 60):
+        self.cell_degrees = cell_degrees
+        self.heartbeat_ttl = heartbeat_ttl
+        # profesional_id -> (lat, lng, actualizado_en, celda, visto (monotonic))
+        self._positions: Dict[str, Tuple[float, float, datetime, Tuple[int, int], float]] = {}
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self.lock = threading.Lock()
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    # ----------- Escrituras -----------
+
+    def update(self, profesional_id: str, lat: float, lng: float, actualizado_en: Optional[datetime] = None):
+        """Registrar la última posición conocida de un profesional"""
+        cell = self._cell(lat, lng)
+        with self.lock:
+            previous = self._positions.get(profesional_id)
+            if previous is not None and previous[3] != cell:
+                self._discard_from_cell(profesional_id, previous[3])
+            self._positions[profesional_id] = (
+                lat, lng, actualizado_en or datetime.utcnow(), cell, time.monotonic()
+            )
+            self._cells.setdefault(cell, set()).add(profesional_id)
+
+    def remove(self, profesional_id: str):
+        """Sacar a un profesional del índice (fuera de servicio)"""
+        with self.lock:
+            previous = self._positions.pop(profesional_id, None)
+            if previous is not None:
+                self._discard_from_cell(profesional_id, previous[3])
+
+    def expire(self) -> int:
+        """Sacar a los que dejaron de informar posición. Retorna cuántos salieron."""
+        limit = time.monotonic() - self.heartbeat_ttl
+        with self.lock:
+            expired = [pid for pid, entry in self._positions.items() if entry[4] < limit]
+            for profesional_id in expired:
+                previous = self._positions.pop(profesional_id)
+                self._discard_from_cell(profesional_id, previous[3])
+        return len(expired)
+
+    def _discard_from_cell(self, profesional_id: str, cell: Tuple[int, int]):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(profesional_id)
+            if not members:
+                del self._cells[cell]
+
+    # ----------- Lecturas -----------
+
+    def position(self, profesional_id: str) -> Optional[Tuple[float, float, datetime]]:
+        """Última posición del profesional, o None si está fuera de línea"""
+        with self.lock:
+            previous = self._positions.get(profesional_id)
+            if previous is None or not self._alive(previous):
+                return None
+            return previous[:3]
+
+    def is_online(self, profesional_id: str) -> bool:
+        return self.position(profesional_id) is not None
+
+    def online(self) -> List[Tuple[str, float, float, datetime]]:
+        """Profesionales en línea con su posición: (id, lat, lng, actualizado_en)"""
+        with self.lock:
+            return [
+                (profesional_id, entry[0], entry[1], entry[2])
+                for profesional_id, entry in self._positions.items()
+                if self._alive(entry)
+            ]
+
+    def _alive(self, entry, now: Optional[float] = None) -> bool:
+        return entry[4] >= (now or time.monotonic()) - self.heartbeat_ttl
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        *,
+        limit: int = 10,
+        max_km: float = 50,
+        exclude: Iterable[str] = ()
+    ) -> List[Tuple[str, float, datetime]]:
+        """
+        Los `limit` profesionales más cercanos a (lat, lng) dentro de `max_km`,
+        sin los de `exclude` ni los fuera de línea. Retorna (profesional_id,
+        distancia_km, actualizado_en) ordenados por distancia.
+        """
+        excluded = set(exclude)
+        # Ancho mínimo de una celda a esta latitud: todo lo que queda fuera del
+        # anillo k está al menos a k * cell_km del punto
+        cell_km = self.cell_degrees * KM_POR_GRADO * min(1.0, max(math.cos(math.radians(lat)), 0.01))
+        max_ring = math.ceil(max_km / cell_km) + 1
+        cx, cy = self._cell(lat, lng)
+
+        found: List[Tuple[float, str, datetime]] = []
+        now = time.monotonic()
+        with self.lock:
+            pending = len(self._positions)
+            ring = 0
+            while ring <= max_ring and pending > 0:
+                for cell in self._ring(cx, cy, ring):
+                    for profesional_id in self._cells.get(cell, ()):
+                        pending -= 1
+                        entry = self._positions[profesional_id]
+                        if profesional_id in excluded or not self._alive(entry, now):
+                            continue
+                        p_lat, p_lng, actualizado_en = entry[:3]
+                        distance = haversine_km(lat, lng, p_lat, p_lng)
+                        if distance <= max_km:
+                            found.append((distance, profesional_id, actualizado_en))
+
+                if len(found) >= limit:
+                    found.sort()
+                    if found[limit - 1][0] <= ring * cell_km:
+                        break
+                ring += 1
+
+        found.sort()
+        return [(profesional_id, distance, actualizado_en) for distance, profesional_id, actualizado_en in found[:limit]]
+
+    @staticmethod
+    def _ring(cx: int, cy: int, ring: int) -> Iterable[Tuple[int, int]]:
+        """Celdas en el borde del cuadrado de radio `ring` alrededor de (cx, cy)"""
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._positions)
+
+def eta_minutos(distancia_km: float) -> int:
+    """Tiempo estimado de llegada con la velocidad media configurada"""
+    return math.ceil(distancia_km / settings.DISPATCH_AVG_SPEED_KMH * 60)
+
+# Instancia singleton del índice
+professional_locator = ProfessionalLocator(
+    cell_degrees=settings.LOCATOR_CELL_DEGREES,
+    heartbeat_ttl=settings.PROFESSIONAL_HEARTBEAT_TTL_SECONDS
+)
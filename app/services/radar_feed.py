@@ -0,0 +1,150 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import secrets
+import threading
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento que recibe el radar de la central
+EVENTO_CREADA = "alerta_creada"
+EVENTO_ESTADO = "alerta_estado"
+EVENTO_RESUELTA = "alerta_resuelta"
+EVENTO_AUDIO = "alerta_audio"
+# Se envía a un suscriptor que no consume a tiempo: debe reconectarse
+EVENTO_REINICIO = "reinicio"
+
+class RadarSubscription:
+    """Cola de eventos de una consola de operador conectada"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def _deliver(self, event: Dict[str, Any]):
+        # Corre dentro del event loop del suscriptor
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Consumidor demasiado lento: se le pide que vuelva a pedir el snapshot
+            self.overflowed = True
+
+    async def next_event(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Esperar el próximo evento; None si pasó el timeout sin novedades"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class RadarFeed:
+    """
+    Bus de eventos en memoria para el radar de la central operativa.
+
+    Los endpoints de escritura (/report, /despachar, /resolver) publican un
+    evento por cada cambio y cada consola conectada por SSE lo recibe sin
+    volver a consultar la BD. `publish` se puede llamar desde cualquier hilo
+    (los endpoints síncronos corren en el threadpool).
+
+    Cada evento recibe un número de secuencia creciente y se guarda en un
+    registro acotado de cambios, que permite a los clientes sin socket pedir
+    solo lo ocurrido desde su último cursor (ver `changes_since`). El cursor
+    incluye una época aleatoria por proceso: tras un reinicio los cursores
+    viejos dejan de ser válidos y el cliente recibe el estado completo.
+
+    Cada proceso solo ve las escrituras que pasan por él: con varios workers
+    de uvicorn hace falta un bus compartido (Redis, LISTEN/NOTIFY).
+    """
+
+    def __init__(self, max_pending: int = 500, changelog_size: int = 1000):
+        self.max_pending = max_pending
+        self._subscribers: List[RadarSubscription] = []
+        self._changelog: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=changelog_size)
+        self._epoch = secrets.token_hex(4)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> RadarSubscription:
+        """Registrar una consola (llamar desde el event loop)"""
+        subscription = RadarSubscription(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: RadarSubscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, tipo: str, data: Dict[str, Any]):
+        """Registrar un cambio y enviarlo a todas las consolas conectadas"""
+        with self._lock:
+            self._seq += 1
+            event = {"tipo": tipo, "data": data, "cursor": self._format_cursor(self._seq)}
+            self._changelog.append((self._seq, event))
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.unsubscribe(subscription)
+
+    def current_cursor(self) -> str:
+        """Cursor que identifica el último cambio publicado"""
+        with self._lock:
+            return self._format_cursor(self._seq)
+
+    def changes_since(self, cursor: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Eventos publicados después del cursor dado, en orden.
+
+        Retorna None si el cursor no se puede resolver (otro proceso, reinicio
+        o tan viejo que salió del registro): el cliente debe pedir todo.
+        """
+        seq = self._parse_cursor(cursor)
+        if seq is None:
+            return None
+
+        with self._lock:
+            if seq > self._seq:
+                return None
+            if seq == self._seq:
+                return []
+            # El registro debe contener el evento seq + 1, si no hay un hueco
+            if not self._changelog or self._changelog[0][0] > seq + 1:
+                return None
+            return [event for event_seq, event in self._changelog if event_seq > seq]
+
+    def _format_cursor(self, seq: int) -> str:
+        return f"{self._epoch}-{seq}"
+
+    def _parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        if not cursor:
+            return None
+        epoch, _, seq = cursor.strip().strip('"').rpartition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+def format_sse(tipo: str, data: Any, cursor: Optional[str] = None) -> str:
+    """Serializar un evento en formato text/event-stream"""
+    payload = json.dumps(data, default=str, ensure_ascii=False)
+    # El id permite retomar con Last-Event-ID o pasar a consultas delta
+    event_id = f"id: {cursor}\n" if cursor else ""
+    return f"{event_id}event: {tipo}\ndata: {payload}\n\n"
+
+# Instancia singleton del feed
+radar_feed = RadarFeed(changelog_size=settings.RADAR_CHANGELOG_SIZE)
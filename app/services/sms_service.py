@@ -1,29 +1,272 @@
-from typing import List, Dict, Optional
+from abc import ABC, abstractmethod
+from typing import Any, List, Dict, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
-import os
+from twilio.http.http_client import TwilioHttpClient
 from datetime import datetime
 import logging
+import random
+import threading
+import time
+
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.config import settings
+from app.core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-class SMSService:
-    def __init__(self):
-        # Configuración de Twilio desde variables de entorno
-        self.account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-        self.auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-        self.from_number = os.getenv("TWILIO_PHONE_NUMBER")
-        
-        # Inicializar cliente si hay credenciales
-        self.client = None
-        if self.account_sid and self.auth_token:
+class SMSError(Exception):
+    """
+    Falla al enviar un SMS. `permanent` indica que el destino no sirve
+    (número inválido, no verificado): otro proveedor tampoco lo enviaría.
+    """
+
+    def __init__(self, message: str, code: Optional[int] = None, permanent: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.permanent = permanent
+
+class SMSProvider(ABC):
+    """
+    Proveedor de SMS. `send` retorna el sid y el estado del mensaje o lanza
+    SMSError (u otra excepción si el proveedor no responde).
+    """
+
+    name = "base"
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    @abstractmethod
+    def send(self, to_number: str, body: str) -> Dict[str, Any]:
+        ...
+
+    def lookup(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Validar un número con el proveedor. None si el proveedor no valida números."""
+        return None
+
+class TwilioProvider(SMSProvider):
+    """
+    Adaptador de Twilio. El cliente se crea en el primer envío, no al
+    importar el módulo, y cada pedido HTTP corta a los `timeout` segundos.
+    """
+
+    # Errores de Twilio que dependen del número de destino
+    ERRORES_PERMANENTES = {
+        21211: "Número de teléfono inválido",
+        21608: "Número no verificado en cuenta trial de Twilio"
+    }
+
+    def __init__(
+        self,
+        account_sid: Optional[str],
+        auth_token: Optional[str],
+        from_number: Optional[str],
+        *,
+        name: str = "twilio",
+        timeout: float = 10
+    ):
+        self.name = name
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.account_sid and self.auth_token)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = Client(
+                        self.account_sid,
+                        self.auth_token,
+                        http_client=TwilioHttpClient(timeout=self.timeout)
+                    )
+                    logger.info(f"Cliente SMS {self.name} inicializado")
+        return self._client
+
+    def send(self, to_number: str, body: str) -> Dict[str, Any]:
+        try:
+            message_instance = self.client.messages.create(
+                body=body,
+                from_=self.from_number,
+                to=to_number
+            )
+        except TwilioRestException as e:
+            if e.code in self.ERRORES_PERMANENTES:
+                raise SMSError(self.ERRORES_PERMANENTES[e.code], code=e.code, permanent=True)
+            raise SMSError(str(e), code=e.code)
+        return {"sid": message_instance.sid, "status": message_instance.status}
+
+    def lookup(self, phone: str) -> Optional[Dict[str, Any]]:
+        # Usar Twilio Lookup API
+        phone_info = self.client.lookups.v2.phone_numbers(phone).fetch()
+        return {
+            "valid": phone_info.valid,
+            "formatted": phone_info.phone_number,
+            "country_code": phone_info.country_code,
+            "carrier": phone_info.carrier.get('name') if phone_info.carrier else None
+        }
+
+class FakeProvider(SMSProvider):
+    """
+    Proveedor en memoria para pruebas y benchmarks: no envía nada, guarda
+    los mensajes en `sent` y simula `latency` segundos por envío. Falla con
+    probabilidad `failure_rate`, o siempre mientras `down` es True.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = 0, failure_rate: float = 0):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.down = False
+        self.sent: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def send(self, to_number: str, body: str) -> Dict[str, Any]:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.down or random.random() < self.failure_rate:
+            raise SMSError(f"Falla simulada en {self.name}")
+        with self._lock:
+            sid = f"SM{self.name}{len(self.sent):06d}"
+            self.sent.append({"sid": sid, "to": to_number, "body": body})
+        return {"sid": sid, "status": "queued"}
+
+class FailoverProvider(SMSProvider):
+    """
+    Envía por el primer proveedor sano de la lista y pasa al siguiente si
+    falla. Cada proveedor tiene un circuit breaker: tras `max_errors`
+    fallas seguidas se saltea durante `reset_seconds` (y después se le
+    prueba con un mensaje). Un envío que sale bien pero tarda más que
+    `latency_budget` cuenta como falla: un proveedor lento también se deja
+    de usar. Las fallas permanentes (número inválido) no se reintentan en
+    otro proveedor ni abren el breaker. Si todos los breakers están
+    abiertos no se falla al instante: se prueba el proveedor cuya última
+    falla es la más vieja (una alerta sin SMS es peor que un envío lento).
+    """
+
+    def __init__(
+        self,
+        providers: Iterable[SMSProvider],
+        *,
+        max_errors: int = 3,
+        reset_seconds: float = 60,
+        latency_budget: float = 5
+    ):
+        self.providers = list(providers)
+        self.name = "+".join(provider.name for provider in self.providers)
+        self.latency_budget = latency_budget
+        self.breakers = {
+            provider.name: CircuitBreaker(
+                f"sms.{provider.name}",
+                failure_threshold=max_errors,
+                reset_seconds=reset_seconds
+            )
+            for provider in self.providers
+        }
+        # Momento (monotonic) de la última falla de cada proveedor
+        self._failed_at: Dict[str, float] = {}
+
+    @property
+    def configured(self) -> bool:
+        return any(provider.configured for provider in self.providers)
+
+    def send(self, to_number: str, body: str) -> Dict[str, Any]:
+        last_error: Optional[Exception] = None
+        for provider in self.providers:
+            if not provider.configured or not self.breakers[provider.name].allow():
+                continue
             try:
-                self.client = Client(self.account_sid, self.auth_token)
-                logger.info("Servicio SMS Twilio inicializado correctamente")
+                return self._send_with(provider, to_number, body)
+            except SMSError as e:
+                if e.permanent:
+                    raise
+                last_error = e
             except Exception as e:
-                logger.error(f"Error inicializando Twilio: {e}")
+                last_error = e
+
+        if last_error is not None:
+            raise last_error
+        # Todos los breakers abiertos: último recurso con el que falló hace más tiempo
+        provider = self._least_recently_failed()
+        if provider is None:
+            raise SMSError("Ningún proveedor de SMS configurado")
+        metrics.incr("sms.failover.ultimo_recurso")
+        logger.warning(f"Todos los proveedores de SMS en falla, se prueba {provider.name}")
+        return self._send_with(provider, to_number, body)
+
+    def _send_with(self, provider: SMSProvider, to_number: str, body: str) -> Dict[str, Any]:
+        """Enviar por un proveedor y anotar el resultado en su breaker"""
+        breaker = self.breakers[provider.name]
+        started = time.perf_counter()
+        try:
+            result = provider.send(to_number, body)
+        except SMSError as e:
+            if e.permanent:
+                breaker.record_success()  # El proveedor respondió
+                raise
+            self._record_failure(provider, e)
+            raise
+        except Exception as e:
+            self._record_failure(provider, e)
+            raise
         else:
-            logger.warning("Credenciales de Twilio no configuradas - SMS deshabilitado")
+            if time.perf_counter() - started > self.latency_budget:
+                metrics.incr(f"sms.{provider.name}.lentos")
+                self._failed_at[provider.name] = time.monotonic()
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return {**result, "provider": provider.name}
+        finally:
+            metrics.observe(f"sms.{provider.name}.seconds", time.perf_counter() - started)
+
+    def _record_failure(self, provider: SMSProvider, error: Exception):
+        logger.warning(f"SMS por {provider.name} falló, se prueba el siguiente: {error}")
+        metrics.incr(f"sms.{provider.name}.errores")
+        self._failed_at[provider.name] = time.monotonic()
+        self.breakers[provider.name].record_failure()
+
+    def _least_recently_failed(self) -> Optional[SMSProvider]:
+        configurados = [provider for provider in self.providers if provider.configured]
+        if not configurados:
+            return None
+        return min(configurados, key=lambda provider: self._failed_at.get(provider.name, 0.0))
+
+    def lookup(self, phone: str) -> Optional[Dict[str, Any]]:
+        for provider in self.providers:
+            if provider.configured and self.breakers[provider.name].state != CircuitBreaker.ABIERTO:
+                info = provider.lookup(phone)
+                if info is not None:
+                    return info
+        return None
+
+class SMSService:
+    """
+    Envío de SMS de emergencia a través de un SMSProvider (SMS_PROVIDERS).
+
+    Los SMS de una alerta salen en paralelo desde un pool de `max_workers`
+    hilos: el último contacto no espera los envíos de los anteriores. Cada
+    pedido al proveedor tiene su propio timeout y el envío completo corta a
+    los `total_timeout` segundos; lo que no respondió para entonces se
+    informa como fallido (puede llegar igual, pero sin confirmación).
+    """
+
+    def __init__(self, provider: SMSProvider, max_workers: int = 8, total_timeout: float = 20):
+        self.provider = provider
+        self.total_timeout = total_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sms")
+        if not provider.configured:
+            logger.warning("Proveedor de SMS no configurado - SMS deshabilitado")
     
     def send_emergency_sms(
         self,
@@ -44,7 +287,7 @@ class SMSService:
         Returns:
             Dict con resultados del envío
         """
-        if not self.client:
+        if not self.provider.configured:
             logger.warning("Intentando enviar SMS sin servicio configurado")
             return {
                 "success": False,
@@ -65,39 +308,71 @@ class SMSService:
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        # Enviar a cada contacto
-        for contact in contacts:
-            try:
-                # Formatear número para Argentina
-                phone = self._format_phone_number(contact['telefono'])
-                
-                result = self._send_single_sms(
-                    to_number=phone,
-                    message=message,
-                    contact_name=contact['nombre']
-                )
-                
-                if result['success']:
-                    results['sent'] += 1
-                    logger.info(f"SMS enviado exitosamente a {contact['nombre']}")
-                else:
-                    results['failed'] += 1
-                    logger.error(f"Fallo envío SMS a {contact['nombre']}: {result.get('error')}")
-                
-                results['details'].append(result)
-                
-            except Exception as e:
-                logger.error(f"Error enviando SMS a {contact['nombre']}: {str(e)}")
-                results['failed'] += 1
-                results['details'].append({
+        # Enviar a todos los contactos a la vez; los resultados se anotan a
+        # medida que llegan
+        futures = {
+            self.executor.submit(self._send_to_contact, contact, message): contact
+            for contact in contacts
+        }
+        sin_anotar = dict(futures)
+        try:
+            for future in as_completed(futures, timeout=self.total_timeout):
+                contact = sin_anotar.pop(future)
+                self._record_result(results, self._contact_result(future, contact))
+        except TimeoutError:
+            for future, contact in sin_anotar.items():
+                if future.done():
+                    # Terminó justo al vencer el plazo: su resultado vale
+                    self._record_result(results, self._contact_result(future, contact))
+                    continue
+                # Los que no respondieron a tiempo se dan por fallidos
+                future.cancel()
+                self._record_result(results, {
                     "contact": contact['nombre'],
                     "success": False,
-                    "error": str(e)
+                    "error": f"Sin respuesta en {self.total_timeout}s"
                 })
         
         results['success'] = results['failed'] == 0
         return results
     
+    def _send_to_contact(self, contact: Dict, message: str) -> Dict:
+        """Enviar el SMS a un contacto (corre en el pool)"""
+        # Formatear número para Argentina
+        phone = self._format_phone_number(contact['telefono'])
+        return self._send_single_sms(
+            to_number=phone,
+            message=message,
+            contact_name=contact['nombre']
+        )
+
+    @staticmethod
+    def _contact_result(future, contact: Dict) -> Dict:
+        """Resultado de un envío terminado (o el error que lanzó)"""
+        try:
+            return future.result()
+        except Exception as e:
+            logger.error(f"Error enviando SMS a {contact['nombre']}: {str(e)}")
+            return {
+                "contact": contact['nombre'],
+                "success": False,
+                "error": str(e)
+            }
+
+    @staticmethod
+    def _record_result(results: Dict, result: Dict):
+        if result['success']:
+            results['sent'] += 1
+            logger.info(f"SMS enviado exitosamente a {result['contact']}")
+        else:
+            results['failed'] += 1
+            logger.error(f"Fallo envío SMS a {result['contact']}: {result.get('error')}")
+        results['details'].append(result)
+
+    def shutdown(self):
+        """Descartar los envíos que no empezaron (los que están en curso terminan)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
     def _format_phone_number(self, phone: str) -> str:
         """
         Formatear número de teléfono para Argentina
@@ -136,35 +411,24 @@ class SMSService:
     ) -> Dict:
         """Enviar un SMS individual"""
         try:
-            # Enviar mensaje
-            message_instance = self.client.messages.create(
-                body=message,
-                from_=self.from_number,
-                to=to_number
-            )
-            
-            return {
-                "contact": contact_name,
-                "phone": to_number,
-                "success": True,
-                "sid": message_instance.sid,
-                "status": message_instance.status
-            }
-            
-        except TwilioRestException as e:
-            error_msg = str(e)
-            if e.code == 21211:  # Número inválido
-                error_msg = "Número de teléfono inválido"
-            elif e.code == 21608:  # Número no verificado en trial
-                error_msg = "Número no verificado en cuenta trial de Twilio"
-            
+            result = self.provider.send(to_number, message)
+        except SMSError as e:
             return {
                 "contact": contact_name,
                 "phone": to_number,
                 "success": False,
-                "error": error_msg,
-                "code": e.code if hasattr(e, 'code') else None
+                "error": str(e),
+                "code": e.code
             }
+
+        return {
+            "contact": contact_name,
+            "phone": to_number,
+            "success": True,
+            "sid": result["sid"],
+            "status": result["status"],
+            "provider": result.get("provider", self.provider.name)
+        }
     
     def _build_emergency_message(
         self,
@@ -206,7 +470,7 @@ class SMSService:
     
     def send_test_sms(self, phone_number: str) -> Dict:
         """Enviar SMS de prueba para verificar configuración"""
-        if not self.client:
+        if not self.provider.configured:
             return {
                 "success": False,
                 "message": "Servicio SMS no configurado"
@@ -228,35 +492,67 @@ class SMSService:
         )
     
     def validate_phone_number(self, phone_number: str) -> Dict:
-        """Validar si un número de teléfono es válido usando Twilio Lookup"""
-        if not self.client:
-            # Sin servicio, asumir válido si cumple formato básico
-            phone = self._format_phone_number(phone_number)
-            is_valid = len(phone) >= 10 and len(phone) <= 15
-            return {
-                "valid": is_valid,
-                "formatted": phone if is_valid else None,
-                "message": "Formato válido" if is_valid else "Formato inválido"
-            }
-        
+        """Validar si un número de teléfono es válido con el proveedor (Twilio Lookup)"""
+        phone = self._format_phone_number(phone_number)
         try:
-            phone = self._format_phone_number(phone_number)
-            
-            # Usar Twilio Lookup API
-            phone_info = self.client.lookups.v2.phone_numbers(phone).fetch()
-            
-            return {
-                "valid": phone_info.valid,
-                "formatted": phone_info.phone_number,
-                "country_code": phone_info.country_code,
-                "carrier": phone_info.carrier.get('name') if phone_info.carrier else None
-            }
+            info = self.provider.lookup(phone) if self.provider.configured else None
         except Exception as e:
             logger.error(f"Error validando número: {e}")
             return {
                 "valid": False,
                 "error": str(e)
             }
+        if info is not None:
+            return info
+
+        # Sin servicio que valide, asumir válido si cumple formato básico
+        is_valid = len(phone) >= 10 and len(phone) <= 15
+        return {
+            "valid": is_valid,
+            "formatted": phone if is_valid else None,
+            "message": "Formato válido" if is_valid else "Formato inválido"
+        }
+
+def build_provider(names: str) -> SMSProvider:
+    """
+    Proveedor según SMS_PROVIDERS: nombres separados por coma, en orden de
+    preferencia. Con más de uno, se envuelven en un FailoverProvider.
+    """
+    disponibles = {
+        "twilio": lambda: TwilioProvider(
+            settings.TWILIO_ACCOUNT_SID,
+            settings.TWILIO_AUTH_TOKEN,
+            settings.TWILIO_PHONE_NUMBER,
+            timeout=settings.SMS_MESSAGE_TIMEOUT_SECONDS
+        ),
+        "twilio_secundario": lambda: TwilioProvider(
+            settings.TWILIO_SECONDARY_ACCOUNT_SID,
+            settings.TWILIO_SECONDARY_AUTH_TOKEN,
+            settings.TWILIO_SECONDARY_PHONE_NUMBER,
+            name="twilio_secundario",
+            timeout=settings.SMS_MESSAGE_TIMEOUT_SECONDS
+        ),
+        "fake": lambda: FakeProvider()
+    }
+    providers = []
+    for name in (name.strip() for name in names.split(",") if name.strip()):
+        if name not in disponibles:
+            raise ValueError(f"SMS_PROVIDERS desconocido: {name}")
+        providers.append(disponibles[name]())
+    if not providers:
+        raise ValueError("SMS_PROVIDERS está vacío")
+    if len(providers) == 1:
+        return providers[0]
+    return FailoverProvider(
+        providers,
+        max_errors=settings.SMS_FAILOVER_MAX_ERRORS,
+        reset_seconds=settings.SMS_FAILOVER_RESET_SECONDS,
+        latency_budget=settings.SMS_FAILOVER_LATENCY_BUDGET_SECONDS
+    )
 
 # Instancia singleton del servicio
-sms_service = SMSService()
\ No newline at end of file
+sms_service = SMSService(
+    build_provider(settings.SMS_PROVIDERS),
+    max_workers=settings.SMS_MAX_WORKERS,
+    total_timeout=settings.SMS_TOTAL_TIMEOUT_SECONDS
+)
\ No newline at end of file
@@ -1,8 +1,21 @@
+from abc import ABC, abstractmethod
 import cloudinary
 import cloudinary.uploader
+from app.core.circuit_breaker import CircuitBreaker
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.media_spool import CHUNK_BYTES, discard, spool_base64
+from typing import Optional, Tuple
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
 # Configuración inicial
 if settings.CLOUDINARY_CLOUD_NAME:
     cloudinary.config(
@@ -12,70 +25,206 @@ if settings.CLOUDINARY_CLOUD_NAME:
         secure=True
     )
 
-class StorageService:
+# Tipos de multimedia que se guardan
+AUDIO = "audio"
+IMAGEN = "imagen"
+
+class StorageBackend(ABC):
+    """
+    Dónde se guarda la multimedia. Cada backend recibe un archivo local y
+    retorna la URL pública con la que queda en la BD; si falla, lanza la
+    excepción (StorageService la registra y guarda None).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def save_file(self, path: str, kind: str) -> str:
+        ...
+
+class CloudinaryStorage(StorageBackend):
+    """Sube a Cloudinary por partes (upload_large), sin cargar el archivo en memoria"""
+
+    name = "cloudinary"
+
+    # tipo -> (prefijo del public_id, resource_type, carpeta)
+    DESTINOS = {
+        AUDIO: ("alert_audio", "video", "acompanar_alertas"),  # "video" se usa para audios también
+        IMAGEN: ("reporte_foto", "image", "acompanar_fotos")
+    }
+
+    def save_file(self, path: str, kind: str) -> str:
+        prefix, resource_type, folder = self.DESTINOS[kind]
+        response = cloudinary.uploader.upload_large(
+            path,
+            public_id=f"{prefix}_{uuid.uuid4()}",
+            resource_type=resource_type,
+            folder=folder,
+            chunk_size=settings.CLOUDINARY_CHUNK_BYTES,
+            # Tope por request HTTP: sin esto el SDK espera indefinidamente
+            timeout=settings.CLOUDINARY_TIMEOUT_SECONDS
+        )
+        return response.get("secure_url")
+
+class LocalStorage(StorageBackend):
+    """
+    Guarda en disco, con el SHA-256 del contenido como nombre:
+    `base_dir/<tipo>/<2 primeros hex>/<hash><ext>`.
+
+    Un mismo audio que el celular reintenta subir queda una sola vez (la
+    segunda subida solo calcula el hash). Cada archivo se escribe a un
+    temporal en el mismo directorio y se renombra al terminar, así que nunca
+    se sirve un archivo a medio copiar. Se sirve con GET /media/<tipo>/<nombre>
+    (con token), que acepta lecturas por rangos (Range) para reproducir audios.
+    """
+
+    name = "local"
+
+    NOMBRE_VALIDO = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,5}$")
+    EXTENSION_POR_DEFECTO = {AUDIO: ".m4a", IMAGEN: ".jpg"}
+
+    def __init__(self, base_dir: str, base_url: str):
+        self.base_dir = base_dir
+        self.base_url = base_url
+
+    def save_file(self, path: str, kind: str) -> str:
+        digest = self._sha256(path)
+        extension = os.path.splitext(path)[1].lower()
+        if not re.fullmatch(r"\.[a-z0-9]{1,5}", extension):
+            extension = self.EXTENSION_POR_DEFECTO[kind]
+        name = f"{digest}{extension}"
+
+        target = self.path_for(kind, name)
+        if os.path.exists(target):
+            metrics.incr("storage.local.deduplicados")
+        else:
+            self._write_atomic(path, target)
+        return f"{self.base_url}/{kind}/{name}"
+
+    def path_for(self, kind: str, name: str) -> Optional[str]:
+        """Ruta en disco de un archivo guardado, o None si el tipo/nombre no es válido"""
+        if kind not in self.EXTENSION_POR_DEFECTO or not self.NOMBRE_VALIDO.match(name):
+            return None
+        return os.path.join(self.base_dir, kind, name[:2], name)
+
     @staticmethod
-    def upload_base64_audio(base64_string: str) -> str:
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _write_atomic(path: str, target: str):
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, open(path, "rb") as source:
+                for chunk in iter(lambda: source.read(CHUNK_BYTES), b""):
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            # Si dos subidas iguales llegan juntas, las dos escriben el mismo
+            # contenido y el último rename gana: el resultado es el mismo
+            os.replace(tmp, target)
+        except BaseException:
+            discard(tmp)
+            raise
+
+class StorageService:
+    """
+    Punto de entrada para guardar la multimedia de emergencias. Delega en el
+    backend configurado (STORAGE_BACKEND) y nunca lanza: si falla, retorna
+    None y quien llama decide (el MediaWorker lo deja para reintentar).
+
+    Un circuit breaker por backend corta las llamadas mientras el proveedor
+    está caído: se responde None al instante en vez de esperar su timeout.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.breaker = CircuitBreaker(
+            f"storage.{backend.name}",
+            failure_threshold=settings.STORAGE_BREAKER_FAILURES,
+            reset_seconds=settings.STORAGE_BREAKER_RESET_SECONDS
+        )
+
+    @property
+    def available(self) -> bool:
+        """False mientras el circuit breaker del backend está abierto"""
+        return self.breaker.state != CircuitBreaker.ABIERTO
+
+    def _save(self, path: str, kind: str) -> Optional[str]:
+        return self.try_save(path, kind)[1]
+
+    def try_save(self, path: str, kind: str) -> Tuple[bool, Optional[str]]:
         """
-        Sube un audio en Base64 a Cloudinary y retorna la URL segura.
-        Retorna None si falla o si el input es vacío.
+        Guardar un archivo distinguiendo el rechazo del circuit breaker:
+        (False, None) si no se intentó; (True, URL o None) si se intentó.
         """
-        if not base64_string:
-            return None
-            
+        if not self.breaker.allow():
+            return False, None
+
+        started = time.perf_counter()
         try:
-            # Generar un nombre único para el archivo
-            file_id = f"alert_audio_{uuid.uuid4()}"
-            
-            # Preparar el string Base64 si no tiene el prefijo data URI
-            # Cloudinary maneja bien los raw base64 si le indicamos el recurso
-            upload_data = base64_string
-            if not base64_string.startswith("data:"):
-                # Asumimos formato m4a/mp4 que viene de Android
-                upload_data = f"data:audio/mp4;base64,{base64_string}"
-
-            # Subir a Cloudinary (resource_type="video" se usa para audios también)
-            response = cloudinary.uploader.upload(
-                upload_data, 
-                public_id=file_id,
-                resource_type="video", 
-                folder="acompanar_alertas"
-            )
-            
-            # Retornar la URL pública (https)
-            return response.get("secure_url")
-            
+            url = self.backend.save_file(path, kind)
         except Exception as e:
-            print(f"Error subiendo audio a Cloudinary: {str(e)}")
-            return None # Fallback: guardará None en la BD en vez de explotar
-    @staticmethod
-    def upload_base64_image(base64_string: str) -> str:
-        """
-        Sube una imagen (foto del reporte) en Base64 a Cloudinary y retorna la URL segura.
-        Retorna None si falla o si el input es vacío.
-        """
+            logger.exception(f"Error guardando {kind} en {self.backend.name}: {e}")
+            metrics.incr(f"storage.{self.backend.name}.errores")
+            self.breaker.record_failure()
+            return True, None
+        finally:
+            metrics.observe(f"storage.{self.backend.name}.seconds", time.perf_counter() - started)
+        self.breaker.record_success()
+        return True, url
+
+    def _save_base64(self, base64_string: str, kind: str, suffix: str) -> Optional[str]:
         if not base64_string:
             return None
-            
         try:
-            # Generar un nombre único para la foto
-            file_id = f"reporte_foto_{uuid.uuid4()}"
-            
-            # En Android ya le agregamos el prefijo "data:image/jpeg;base64,"
-            upload_data = base64_string
-
-            # Subir a Cloudinary indicando que es una imagen (resource_type="image")
-            response = cloudinary.uploader.upload(
-                upload_data, 
-                public_id=file_id,
-                resource_type="image", 
-                folder="acompanar_fotos" # Carpeta separada para mantener orden
-            )
-            
-            # Retornar la URL pública (https)
-            return response.get("secure_url")
-            
+            path = spool_base64(base64_string, suffix=suffix)
         except Exception as e:
-            print(f"Error subiendo imagen a Cloudinary: {e}")
+            logger.error(f"Error decodificando {kind} en base64: {e}")
             return None
+        try:
+            return self._save(path, kind)
+        finally:
+            discard(path)
+
+    def upload_base64_audio(self, base64_string: str) -> Optional[str]:
+        """
+        Guarda un audio en Base64 y retorna la URL segura.
+        Retorna None si falla o si el input es vacío.
+        """
+        return self._save_base64(base64_string, AUDIO, ".m4a")
+
+    def upload_base64_image(self, base64_string: str) -> Optional[str]:
+        """
+        Guarda una imagen (foto del reporte) en Base64 y retorna la URL segura.
+        Retorna None si falla o si el input es vacío.
+        """
+        return self._save_base64(base64_string, IMAGEN, ".jpg")
+
+    def upload_audio_file(self, path: str) -> Optional[str]:
+        """Guarda un audio desde un archivo local. Retorna None si falla."""
+        return self._save(path, AUDIO)
+
+    def upload_image_file(self, path: str) -> Optional[str]:
+        """Guarda una foto desde un archivo local. Retorna None si falla."""
+        return self._save(path, IMAGEN)
+
+def build_backend(name: str) -> StorageBackend:
+    """Backend según su nombre en STORAGE_BACKEND"""
+    if name == LocalStorage.name:
+        return LocalStorage(
+            settings.LOCAL_MEDIA_DIR,
+            f"{settings.MEDIA_PUBLIC_BASE_URL}{settings.API_V1_STR}/media"
+        )
+    if name == CloudinaryStorage.name:
+        return CloudinaryStorage()
+    raise ValueError(f"STORAGE_BACKEND desconocido: {name}")
 
-storage_service = StorageService()
\ No newline at end of file
+# Instancia singleton del servicio
+storage_service = StorageService(build_backend(settings.STORAGE_BACKEND))
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.transicion_peticion import TransicionPeticion
+from app.services.batch_writer import BatchWriter
+
+def _write_transitions(rows: List[Dict[str, Any]]):
+    """Insertar un lote de transiciones en una sola transacción"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(TransicionPeticion), rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class TransitionLog:
+    """
+    Línea de tiempo de los cambios de estado de las peticiones.
+
+    Cada cambio de estado (en CRUDPeticion y en las rutas) llama a `record`
+    después de su commit; la fila no se escribe en esa transacción sino que
+    el BatchWriter la inserta en lote cada `flush_seconds`. La línea de
+    tiempo puede demorar esos segundos en verse, a cambio de no sumar una
+    escritura a cada despacho o resolución.
+    """
+
+    def __init__(self, flush_seconds: float = 2):
+        self.writer = BatchWriter(
+            "transition_log",
+            _write_transitions,
+            interval_seconds=flush_seconds
+        )
+
+    def record(
+        self,
+        peticion_id: Any,
+        estado_code: str,
+        *,
+        central: Optional[bool] = None,
+        usuario_id: Optional[Any] = None,
+        profesional_id: Optional[Any] = None,
+        registrado_en: Optional[datetime] = None
+    ):
+        """Encolar el paso de una petición a `estado_code`"""
+        self.writer.add({
+            "peticion_id": _uuid(peticion_id),
+            "estado_code": estado_code,
+            "central": central,
+            "usuario_id": _uuid(usuario_id),
+            "profesional_id": _uuid(profesional_id),
+            "registrado_en": registrado_en or datetime.utcnow()
+        })
+
+    def record_created(self, peticiones: Iterable[Any]):
+        """Encolar la creación de las peticiones de un reporte"""
+        for peticion in peticiones:
+            self.record(
+                peticion.id,
+                peticion.estado_code,
+                central=peticion.contacto_id is None,
+                usuario_id=peticion.usuario_id,
+                registrado_en=peticion.creado_en
+            )
+
+    def shutdown(self):
+        self.writer.shutdown(flush=True)
+
+def _uuid(value: Any) -> Optional[UUID]:
+    if value is None or isinstance(value, UUID):
+        return value
+    return UUID(str(value))
+
+# Instancia singleton del registro
+transition_log = TransitionLog(flush_seconds=settings.TRANSITION_LOG_FLUSH_SECONDS)
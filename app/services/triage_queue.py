@@ -0,0 +1,192 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import threading
+
+from app.core.config import settings
+from app.services.professional_locator import professional_locator
+
+class TriageQueue:
+    """
+    Cola de prioridad de las alertas activas para los operadores.
+
+    Puntaje de una alerta (más alto = atender antes):
+
+        antigüedad en minutos * TRIAGE_PESO_MINUTO
+        + (alertas activas del mismo usuario - 1) * TRIAGE_PESO_REPETIDA
+        + TRIAGE_PESO_AUDIO si tiene audio, + TRIAGE_PESO_MENSAJE si tiene mensaje
+        - distancia al profesional libre más cercano (km) * TRIAGE_PESO_KM
+
+    La antigüedad suma lo mismo a todas las alertas por cada minuto que pasa,
+    así que no cambia el orden relativo: la clave de orden es fija
+    (bonus - peso * minuto de creación) y la lista se mantiene ordenada con
+    bisect a medida que llegan, cambian o se cierran alertas, sin reordenar
+    en cada request. La distancia depende de la posición de los profesionales
+    y se recalcula en `refresh_distances` (periódico).
+
+    Solo entran las peticiones centrales (contacto_id nulo): las de los
+    contactos son copias del mismo reporte.
+    """
+
+    def __init__(self):
+        self._order: List[Tuple[float, str]] = []  # (clave, peticion_id), ascendente = más urgente
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+    # ----------- Escrituras -----------
+
+    def add(self, record: Dict[str, Any], busy: Iterable[str] = ()):
+        """Encolar una alerta activa (o actualizarla si ya estaba)"""
+        if record["contacto_id"] is not None:
+            return
+        distance = self._distance_to_free(record, busy)
+        with self.lock:
+            self._remove(record["id"])
+            entry = {"record": record, "distancia_km": distance}
+            self._entries[record["id"]] = entry
+            siblings = self._by_user.setdefault(record["usuario_id"], [])
+            siblings.append(record["id"])
+            # Una alerta más del usuario sube la prioridad de todas las suyas
+            for peticion_id in siblings:
+                self._reposition(peticion_id)
+
+    def update(self, peticion_id: str):
+        """Recalcular una alerta cuyo record cambió (p. ej. llegó el audio)"""
+        with self.lock:
+            if peticion_id in self._entries:
+                self._reposition(peticion_id)
+
+    def remove(self, peticion_id: str):
+        """Sacar una alerta despachada o resuelta"""
+        with self.lock:
+            entry = self._remove(peticion_id)
+            if entry is not None:
+                for sibling in self._by_user.get(entry["record"]["usuario_id"], ()):
+                    self._reposition(sibling)
+
+    def replace(self, records: Iterable[Dict[str, Any]], busy: Iterable[str] = ()):
+        """Reconstruir la cola completa (al cargar o corregir la proyección)"""
+        busy = list(busy)
+        central = [r for r in records if r["contacto_id"] is None]
+        distances = {r["id"]: self._distance_to_free(r, busy) for r in central}
+        with self.lock:
+            self._order = []
+            self._entries = {}
+            self._by_user = {}
+            for record in central:
+                self._entries[record["id"]] = {"record": record, "distancia_km": distances[record["id"]]}
+                self._by_user.setdefault(record["usuario_id"], []).append(record["id"])
+            for peticion_id in self._entries:
+                self._reposition(peticion_id)
+
+    def refresh_distances(self, busy: Iterable[str] = ()) -> int:
+        """
+        Recalcular la distancia al profesional libre más cercano de cada
+        alerta. Retorna cuántas cambiaron de posición en la cola.
+        """
+        busy = list(busy)
+        with self.lock:
+            records = [entry["record"] for entry in self._entries.values()]
+        distances = {r["id"]: self._distance_to_free(r, busy) for r in records}
+
+        moved = 0
+        with self.lock:
+            for peticion_id, distance in distances.items():
+                entry = self._entries.get(peticion_id)
+                if entry is not None and entry["distancia_km"] != distance:
+                    entry["distancia_km"] = distance
+                    self._reposition(peticion_id)
+                    moved += 1
+        return moved
+
+    def _remove(self, peticion_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.pop(peticion_id, None)
+        if entry is None:
+            return None
+        self._discard_key(peticion_id, entry.get("clave"))
+        siblings = self._by_user.get(entry["record"]["usuario_id"])
+        if siblings is not None:
+            siblings.remove(peticion_id)
+            if not siblings:
+                del self._by_user[entry["record"]["usuario_id"]]
+        return entry
+
+    def _reposition(self, peticion_id: str):
+        entry = self._entries[peticion_id]
+        self._discard_key(peticion_id, entry.get("clave"))
+        entry["bonus"] = self._bonus(entry)
+        entry["clave"] = -(entry["bonus"] - settings.TRIAGE_PESO_MINUTO * self._minute(entry["record"]))
+        insort(self._order, (entry["clave"], peticion_id))
+
+    def _discard_key(self, peticion_id: str, clave: Optional[float]):
+        if clave is None:
+            return
+        index = bisect_left(self._order, (clave, peticion_id))
+        if index < len(self._order) and self._order[index] == (clave, peticion_id):
+            del self._order[index]
+
+    # ----------- Puntaje -----------
+
+    def _bonus(self, entry: Dict[str, Any]) -> float:
+        record = entry["record"]
+        bonus = (len(self._by_user.get(record["usuario_id"], ())) - 1) * settings.TRIAGE_PESO_REPETIDA
+        if record["audio"] or record["audio_estado"]:
+            bonus += settings.TRIAGE_PESO_AUDIO
+        if record["mensaje"]:
+            bonus += settings.TRIAGE_PESO_MENSAJE
+        if entry["distancia_km"] is not None:
+            bonus -= entry["distancia_km"] * settings.TRIAGE_PESO_KM
+        else:
+            # Sin profesionales libres cerca: como si estuviera en el borde del radio
+            bonus -= settings.DISPATCH_SEARCH_RADIUS_KM * settings.TRIAGE_PESO_KM
+        return bonus
+
+    @staticmethod
+    def _minute(record: Dict[str, Any]) -> float:
+        creado_en = record["creado_en"] or datetime.utcnow()
+        return creado_en.timestamp() / 60
+
+    @staticmethod
+    def _distance_to_free(record: Dict[str, Any], busy: Iterable[str]) -> Optional[float]:
+        if record["lat"] is None or record["lng"] is None:
+            return None
+        nearest = professional_locator.nearest(
+            record["lat"],
+            record["lng"],
+            limit=1,
+            max_km=settings.DISPATCH_SEARCH_RADIUS_KM,
+            exclude=busy
+        )
+        return round(nearest[0][1], 2) if nearest else None
+
+    # ----------- Lecturas -----------
+
+    def page(self, offset: int = 0, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Las alertas en orden de atención, desde `offset`.
+        Retorna (alertas con su puntaje, total en cola).
+        """
+        now_minute = datetime.utcnow().timestamp() / 60
+        with self.lock:
+            total = len(self._order)
+            items = []
+            for _, peticion_id in self._order[offset:offset + limit]:
+                entry = self._entries[peticion_id]
+                record = entry["record"]
+                items.append({
+                    "record": record,
+                    "puntaje": round(
+                        entry["bonus"] + settings.TRIAGE_PESO_MINUTO * (now_minute - self._minute(record)), 2
+                    ),
+                    "alertas_del_usuario": len(self._by_user.get(record["usuario_id"], ())),
+                    "distancia_profesional_km": entry["distancia_km"]
+                })
+        return items, total
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._order)
+
+# Instancia singleton de la cola
+triage_queue = TriageQueue()
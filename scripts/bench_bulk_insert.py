@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la inserción de un reporte de emergencia: flujo anterior
+(add + flush + commit + refresh por fila) contra el INSERT único con CTE.
+
+Cuenta los viajes a la BD (sentencias + COMMIT) y mide la latencia por
+reporte. Necesita una base PostgreSQL con el esquema de la app (DATABASE_URL
+o las variables POSTGRES_*). Crea un usuario temporal y lo borra al final.
+
+Uso:
+    python scripts/bench_bulk_insert.py --reports 200 --contacts 3
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+from app.crud.crud_peticion import crud_peticion
+from app.db.session import SessionLocal, engine
+from app.models.peticion import Peticion
+from app.models.ubicacion import Ubicacion
+from app.schemas.contact import LocationReportData
+
+
+class RoundTripCounter:
+    """Cuenta sentencias y commits enviados por el engine"""
+
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def _on_commit(self, *args, **kwargs):
+        self.count += 1
+
+
+def legacy_create(db, *, user_id, contact_ids, location, mensaje):
+    """Reproduce el flujo anterior del endpoint /report"""
+    ubicacion = Ubicacion(
+        direccion=location.address or "Ubicación desde dispositivo",
+        latitud=location.latitude,
+        longitud=location.longitude
+    )
+    db.add(ubicacion)
+    db.flush()
+
+    peticiones = []
+    for contact_id in [None, *contact_ids]:
+        peticion = Peticion(
+            usuario_id=user_id,
+            contacto_id=contact_id,
+            ubicacion_id=ubicacion.id,
+            estado_code="en_triaje",
+            creado_en=datetime.utcnow(),
+            mensaje=mensaje
+        )
+        db.add(peticion)
+        peticiones.append(peticion)
+
+    db.commit()
+    for peticion in peticiones:
+        db.refresh(peticion)
+    return peticiones
+
+
+def bulk_create(db, *, user_id, contact_ids, location, mensaje):
+    return crud_peticion.create_emergency_report(
+        db, user_id=user_id, contact_ids=contact_ids, location=location, mensaje=mensaje
+    )
+
+
+def setup_user(db, contacts: int):
+    user_id = db.execute(text("""
+        INSERT INTO usuarios (full_name, email, is_anonymous, is_active, genero, rol, created_at)
+        VALUES ('Benchmark', :email, false, true, 'Otro', 'Victima', now())
+        RETURNING id
+    """), {"email": f"bench-{time.time_ns()}@acompaniar.invalid"}).scalar()
+
+    contact_ids = [
+        db.execute(text("""
+            INSERT INTO contactos (usuario_id, nombre, telefono)
+            VALUES (:user_id, :nombre, '3815550000') RETURNING id
+        """), {"user_id": user_id, "nombre": f"Contacto {i}"}).scalar()
+        for i in range(contacts)
+    ]
+    db.commit()
+    return user_id, contact_ids
+
+
+def cleanup(db, user_id):
+    ubicacion_ids = [
+        row[0] for row in db.execute(
+            text("SELECT DISTINCT ubicacion_id FROM peticiones WHERE usuario_id = :u AND ubicacion_id IS NOT NULL"),
+            {"u": user_id}
+        )
+    ]
+    db.execute(text("DELETE FROM peticiones WHERE usuario_id = :u"), {"u": user_id})
+    db.execute(text("DELETE FROM contactos WHERE usuario_id = :u"), {"u": user_id})
+    db.execute(text("DELETE FROM usuarios WHERE id = :u"), {"u": user_id})
+    if ubicacion_ids:
+        db.execute(text("DELETE FROM ubicaciones WHERE id = ANY(:ids)"), {"ids": ubicacion_ids})
+    db.commit()
+
+
+def run(create, reports, user_id, contact_ids, counter):
+    location = LocationReportData(latitude=-26.8241, longitude=-65.2226, address="Benchmark")
+    latencies = []
+    round_trips = []
+    for _ in range(reports):
+        db = SessionLocal()
+        try:
+            before = counter.count
+            started = time.perf_counter()
+            create(db, user_id=user_id, contact_ids=contact_ids, location=location, mensaje="bench")
+            latencies.append(time.perf_counter() - started)
+            round_trips.append(counter.count - before)
+        finally:
+            db.close()
+    return latencies, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--contacts", type=int, default=3)
+    args = parser.parse_args()
+
+    counter = RoundTripCounter()
+    db = SessionLocal()
+    user_id, contact_ids = setup_user(db, args.contacts)
+    try:
+        print(f"{args.reports} reportes con {args.contacts} contactos\n")
+        print(f"{'flujo':<10}{'viajes/reporte':>16}{'p50':>10}{'p99':>10}")
+        for name, create in (("anterior", legacy_create), ("bulk", bulk_create)):
+            latencies, round_trips = run(create, args.reports, user_id, contact_ids, counter)
+            latencies.sort()
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(
+                f"{name:<10}{statistics.mean(round_trips):>16.1f}"
+                f"{statistics.median(latencies) * 1000:>8.2f}ms{p99 * 1000:>8.2f}ms"
+            )
+    finally:
+        cleanup(db, user_id)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Verifica que /emergency/history no tiene consultas N+1.
+
+Crea un usuario temporal con N alertas (cada una con contacto y ubicación,
+como las de un reporte) y llama al endpoint con distintos `limit`, contando
+las sentencias SQL que ejecuta cada llamada. Al final verifica que:
+
+  - la cantidad de consultas es la misma para todos los `limit` (y es 1),
+  - la segunda página (con `cursor`) también es una sola consulta,
+  - la primera página repetida sale de la caché sin tocar la BD,
+  - al invalidar la entrada (como hace un reporte nuevo) se vuelve a consultar.
+
+Necesita una base PostgreSQL con el esquema de la app y las migraciones
+008 y 009 aplicadas (DATABASE_URL o las variables POSTGRES_*). Borra todo
+al terminar.
+
+Uso:
+    python scripts/check_history_queries.py --alerts 120
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+import app.main  # noqa: F401  (registra todos los modelos)
+from app.api.routes_emergency import get_emergency_history, historial_usuarios
+from app.db.session import SessionLocal, engine
+from app.models.user import User
+
+
+def setup(db, alerts: int) -> str:
+    user_id = db.execute(text("""
+        INSERT INTO usuarios (full_name, email, is_anonymous, is_active, genero, rol, created_at)
+        VALUES ('Historial', :email, false, true, 'Otro', 'Victima', now())
+        RETURNING id
+    """), {"email": f"history-{time.time_ns()}@acompaniar.invalid"}).scalar()
+    contacto_id = db.execute(text("""
+        INSERT INTO contactos (usuario_id, nombre, telefono)
+        VALUES (:u, 'Contacto', '+5400000000') RETURNING id
+    """), {"u": user_id}).scalar()
+    for i in range(alerts):
+        ubicacion_id = db.execute(text("""
+            INSERT INTO ubicaciones (direccion, latitud, longitud)
+            VALUES ('Historial', -26.8241, -65.2226) RETURNING id
+        """)).scalar()
+        db.execute(text("""
+            INSERT INTO peticiones (usuario_id, contacto_id, ubicacion_id, estado_code, creado_en, mensaje)
+            VALUES (:u, :c, :ub, 'atendida', now() - make_interval(secs => :i), 'history')
+        """), {"u": user_id, "c": contacto_id if i % 2 else None, "ub": ubicacion_id, "i": i})
+    db.commit()
+    return user_id
+
+
+def cleanup(db, user_id):
+    db.execute(text("""
+        DELETE FROM ubicaciones WHERE id IN (
+            SELECT ubicacion_id FROM peticiones WHERE usuario_id = :u
+        )
+    """), {"u": user_id})
+    db.execute(text("DELETE FROM peticiones WHERE usuario_id = :u"), {"u": user_id})
+    db.execute(text("DELETE FROM usuarios WHERE id = :u"), {"u": user_id})
+    db.commit()
+
+
+@contextmanager
+def count_queries():
+    """Contar las sentencias que llegan a la BD dentro del bloque"""
+    contador = {"consultas": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        contador["consultas"] += 1
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield contador
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=120)
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 10, 50, 100])
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user_id = setup(db, args.alerts)
+    try:
+        user = db.get(User, user_id)
+        errores = []
+
+        conteos = {}
+        for limit in args.limits:
+            historial_usuarios.clear()
+            with count_queries() as contador:
+                respuesta = get_emergency_history(db=db, current_user=user, limit=limit, cursor=None)
+            conteos[limit] = contador["consultas"]
+            print(f"  limit {limit:>4}: {respuesta['total']:>4} alertas, {contador['consultas']} consultas")
+        if len(set(conteos.values())) != 1 or max(conteos.values()) != 1:
+            errores.append(f"las consultas dependen de limit o no son 1: {conteos}")
+
+        with count_queries() as contador:
+            get_emergency_history(db=db, current_user=user, limit=args.limits[-1], cursor=respuesta["next_cursor"])
+        print(f"  segunda página: {contador['consultas']} consultas")
+        if respuesta["next_cursor"] and contador["consultas"] != 1:
+            errores.append(f"la segunda página hizo {contador['consultas']} consultas")
+
+        with count_queries() as contador:
+            get_emergency_history(db=db, current_user=user, limit=args.limits[-1], cursor=None)
+        print(f"  primera página repetida: {contador['consultas']} consultas")
+        if contador["consultas"] != 0:
+            errores.append("la primera página repetida no salió de la caché")
+
+        historial_usuarios.delete(str(user_id))  # Lo que hace un reporte nuevo
+        with count_queries() as contador:
+            get_emergency_history(db=db, current_user=user, limit=args.limits[-1], cursor=None)
+        if contador["consultas"] != 1:
+            errores.append("la caché no se invalidó")
+
+        if errores:
+            print("\nFALLA:")
+            for error in errores:
+                print(f"  - {error}")
+            sys.exit(1)
+        print("\nOK: una consulta por página, sin importar limit")
+    finally:
+        cleanup(db, user_id)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
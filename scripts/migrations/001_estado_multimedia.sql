@@ -0,0 +1,4 @@
+-- Estado de la subida diferida de multimedia (audio de alertas y foto de informes).
+-- Valores: 'pendiente', 'lista', 'fallida'. NULL cuando el reporte no trae archivo.
+ALTER TABLE peticiones ADD COLUMN IF NOT EXISTS audio_estado VARCHAR(20);
+ALTER TABLE informes_mision ADD COLUMN IF NOT EXISTS foto_estado VARCHAR(20);
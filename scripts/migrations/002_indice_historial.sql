@@ -0,0 +1,3 @@
+-- Índice para la paginación por clave de /emergency/historial sobre (creado_en, id).
+-- CONCURRENTLY evita bloquear las inserciones; ejecutar fuera de una transacción.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_peticiones_creado_en_id ON peticiones (creado_en, id);
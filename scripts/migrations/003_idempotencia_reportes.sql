@@ -0,0 +1,6 @@
+-- Clave de idempotencia de /emergency/report (SHA-256 de usuario + Idempotency-Key).
+-- Solo la petición central (contacto_id NULL) es única: las de contactos repiten la clave.
+ALTER TABLE peticiones ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_peticiones_idempotency_key
+    ON peticiones (idempotency_key)
+    WHERE contacto_id IS NULL AND idempotency_key IS NOT NULL;
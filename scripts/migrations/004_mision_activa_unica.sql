@@ -0,0 +1,5 @@
+-- Máximo una misión despachada por profesional (respaldo del despacho atómico).
+-- Si ya hay profesionales con dos misiones despachadas, resolverlas antes de crear el índice.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_peticiones_mision_activa
+    ON peticiones (profesional_id)
+    WHERE estado_code = 'despachada';
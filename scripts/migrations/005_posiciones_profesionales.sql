@@ -0,0 +1,13 @@
+-- Recorrido de los profesionales de terreno. Se escribe en lote y muestreado
+-- (una posición cada LOCATION_HISTORY_SAMPLE_SECONDS por profesional), no
+-- una fila por cada ping del celular.
+CREATE TABLE IF NOT EXISTS posiciones_profesionales (
+    id BIGSERIAL PRIMARY KEY,
+    profesional_id UUID NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+    latitud DOUBLE PRECISION NOT NULL,
+    longitud DOUBLE PRECISION NOT NULL,
+    precision_m DOUBLE PRECISION,
+    registrado_en TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_posiciones_profesional_registrado
+    ON posiciones_profesionales (profesional_id, registrado_en);
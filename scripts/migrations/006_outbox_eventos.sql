@@ -0,0 +1,17 @@
+-- Outbox transaccional: efectos secundarios del flujo de emergencia (subida
+-- del audio de un reporte, foto de un informe) escritos en la misma
+-- transacción que las peticiones. Los consume el OutboxWorker con
+-- SELECT ... FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS outbox_eventos (
+    id BIGSERIAL PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    creado_en TIMESTAMP NOT NULL DEFAULT now(),
+    disponible_en TIMESTAMP NOT NULL DEFAULT now(),
+    intentos INTEGER NOT NULL DEFAULT 0,
+    ultimo_error TEXT,
+    procesado_en TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_eventos_pendientes
+    ON outbox_eventos (disponible_en)
+    WHERE procesado_en IS NULL;
@@ -0,0 +1,30 @@
+-- Línea de tiempo de las peticiones: una fila por cada cambio de estado
+-- (creación, despacho, resolución, ...). Solo inserción, escrita en lote.
+-- Sin FK a peticiones: el historial queda aunque la petición se archive.
+CREATE TABLE IF NOT EXISTS transiciones_peticiones (
+    id BIGSERIAL PRIMARY KEY,
+    peticion_id UUID NOT NULL,
+    estado_code VARCHAR(20) NOT NULL,
+    central BOOLEAN,
+    usuario_id UUID,
+    profesional_id UUID,
+    registrado_en TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_transiciones_peticion_registrado
+    ON transiciones_peticiones (peticion_id, registrado_en);
+CREATE INDEX IF NOT EXISTS ix_transiciones_registrado
+    ON transiciones_peticiones (registrado_en);
+
+-- Punto de partida para las peticiones que ya existen: su creación y, si
+-- están cerradas, su cierre. Los despachos anteriores no se pueden
+-- reconstruir (se sobrescribían en la fila).
+INSERT INTO transiciones_peticiones (peticion_id, estado_code, central, usuario_id, registrado_en)
+SELECT id, 'en_triaje', contacto_id IS NULL, usuario_id, creado_en FROM peticiones
+WHERE NOT EXISTS (SELECT 1 FROM transiciones_peticiones t WHERE t.peticion_id = peticiones.id);
+INSERT INTO transiciones_peticiones (peticion_id, estado_code, central, profesional_id, registrado_en)
+SELECT id, estado_code, contacto_id IS NULL, profesional_id, finalizado_en FROM peticiones
+WHERE finalizado_en IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM transiciones_peticiones t
+      WHERE t.peticion_id = peticiones.id AND t.registrado_en = peticiones.finalizado_en
+  );
@@ -0,0 +1,37 @@
+-- Archivo frío de peticiones cerradas, particionado por mes de creado_en.
+-- El archivador (app.main.archive_loop) mueve acá las peticiones resueltas,
+-- atendidas, canceladas o con error más viejas que ARCHIVE_AFTER_DAYS, con
+-- su informe de misión, y crea cada partición mensual la primera vez que la
+-- necesita (peticiones_archivo_AAAA_MM). La tabla `peticiones` queda con lo
+-- abierto y lo reciente.
+--
+-- La tabla caliente no se particiona: Postgres exige que la clave de
+-- partición esté en la clave primaria y en todo índice único, y eso rompería
+-- la FK de informes_mision y los índices únicos de idempotencia y de misión
+-- activa por profesional.
+CREATE TABLE IF NOT EXISTS peticiones_archivo (
+    id UUID NOT NULL,
+    creado_en TIMESTAMP NOT NULL,
+    usuario_id UUID NOT NULL,
+    contacto_id UUID,
+    ubicacion_id UUID,
+    operador_id UUID,
+    profesional_id UUID,
+    estado_code VARCHAR(20) NOT NULL,
+    finalizado_en TIMESTAMP,
+    mensaje TEXT,
+    audio TEXT,
+    audio_estado VARCHAR(20),
+    idempotency_key VARCHAR(64),
+    detalle_resolucion TEXT,
+    foto_url TEXT,
+    foto_estado VARCHAR(20),
+    informe_creado_en TIMESTAMP,
+    archivado_en TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, creado_en)
+) PARTITION BY RANGE (creado_en);
+
+CREATE INDEX IF NOT EXISTS ix_peticiones_archivo_usuario_creado_en
+    ON peticiones_archivo (usuario_id, creado_en);
+CREATE INDEX IF NOT EXISTS ix_peticiones_archivo_creado_en_id
+    ON peticiones_archivo (creado_en, id);
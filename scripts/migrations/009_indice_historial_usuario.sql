@@ -0,0 +1,12 @@
+-- Índice para /emergency/history (ORDER BY creado_en DESC, id DESC de un
+-- usuario) y los conteos del rate limit por usuario. Sin él, cada consulta
+-- recorre todas las peticiones recientes de todos los usuarios.
+-- CONCURRENTLY evita bloquear las inserciones; ejecutar fuera de una transacción.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_peticiones_usuario_creado_en_id
+    ON peticiones (usuario_id, creado_en, id);
+
+-- En el archivo particionado el índice se crea en cada partición (no admite
+-- CONCURRENTLY sobre la tabla padre); reemplaza al de la migración 008.
+CREATE INDEX IF NOT EXISTS ix_peticiones_archivo_usuario_creado_en_id
+    ON peticiones_archivo (usuario_id, creado_en, id);
+DROP INDEX IF EXISTS ix_peticiones_archivo_usuario_creado_en;
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia del despacho: muchos operadores despachando a la vez.
+
+Crea alertas y profesionales temporales y lanza despachos en paralelo (cada
+hilo con su propia sesión) combinando alertas y profesionales al azar, con
+muchas colisiones a propósito. Al final verifica que:
+
+  - ningún profesional tiene más de una misión despachada,
+  - cada alerta se despachó como máximo una vez,
+  - la cantidad de despachos exitosos coincide con la BD.
+
+Necesita una base PostgreSQL con el esquema de la app y la migración 004
+aplicada (DATABASE_URL o las variables POSTGRES_*). Borra todo al terminar.
+
+Uso:
+    python scripts/stress_dispatch.py --alerts 200 --professionals 20 --workers 32
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from app.crud.crud_peticion import crud_peticion, DispatchResult
+from app.db.session import SessionLocal
+
+
+def create_user(db, rol: str) -> str:
+    return db.execute(text("""
+        INSERT INTO usuarios (full_name, email, is_anonymous, is_active, genero, rol, created_at)
+        VALUES ('Stress', :email, false, true, 'Otro', :rol, now())
+        RETURNING id
+    """), {"email": f"stress-{time.time_ns()}@acompaniar.invalid", "rol": rol}).scalar()
+
+
+def setup(db, alerts: int, professionals: int):
+    victima_id = create_user(db, "Victima")
+    profesional_ids = [create_user(db, "Profesional_Terreno") for _ in range(professionals)]
+    peticion_ids = [
+        db.execute(text("""
+            INSERT INTO peticiones (usuario_id, estado_code, creado_en, mensaje)
+            VALUES (:u, 'en_triaje', now(), 'stress') RETURNING id
+        """), {"u": victima_id}).scalar()
+        for _ in range(alerts)
+    ]
+    db.commit()
+    return victima_id, profesional_ids, peticion_ids
+
+
+def cleanup(db, victima_id, profesional_ids):
+    db.execute(text("DELETE FROM peticiones WHERE usuario_id = :u"), {"u": victima_id})
+    db.execute(
+        text("DELETE FROM usuarios WHERE id = ANY(:ids)"),
+        {"ids": [victima_id, *profesional_ids]}
+    )
+    db.commit()
+
+
+def dispatch_once(peticion_id, profesional_id):
+    db = SessionLocal()
+    try:
+        resultado, _ = crud_peticion.dispatch(
+            db, peticion_id=peticion_id, profesional_id=profesional_id
+        )
+        return resultado
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--professionals", type=int, default=20)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    victima_id, profesional_ids, peticion_ids = setup(db, args.alerts, args.professionals)
+    try:
+        intentos = [
+            (random.choice(peticion_ids), random.choice(profesional_ids))
+            for _ in range(args.attempts)
+        ]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            resultados = list(pool.map(lambda args_: dispatch_once(*args_), intentos))
+        elapsed = time.perf_counter() - started
+
+        conteo = Counter(resultados)
+        print(f"{args.attempts} despachos en {elapsed:.2f}s con {args.workers} hilos")
+        for resultado in DispatchResult:
+            print(f"  {resultado.value:<27}{conteo.get(resultado, 0):>6}")
+
+        # Invariantes contra la BD
+        por_profesional = db.execute(text("""
+            SELECT profesional_id, count(*) FROM peticiones
+            WHERE usuario_id = :u AND estado_code = 'despachada'
+            GROUP BY profesional_id HAVING count(*) > 1
+        """), {"u": victima_id}).all()
+        despachadas = db.execute(text("""
+            SELECT count(*) FROM peticiones
+            WHERE usuario_id = :u AND estado_code = 'despachada'
+        """), {"u": victima_id}).scalar()
+
+        errores = []
+        if por_profesional:
+            errores.append(f"profesionales con más de una misión: {len(por_profesional)}")
+        if despachadas != conteo.get(DispatchResult.DESPACHADA, 0):
+            errores.append(
+                f"despachos exitosos ({conteo.get(DispatchResult.DESPACHADA, 0)}) "
+                f"!= alertas despachadas en la BD ({despachadas})"
+            )
+        if despachadas > min(args.alerts, args.professionals):
+            errores.append(f"más despachos ({despachadas}) que profesionales o alertas")
+
+        if errores:
+            print("\nFALLA:")
+            for error in errores:
+                print(f"  - {error}")
+            sys.exit(1)
+        print(f"\nOK: {despachadas} misiones, ninguna duplicada")
+    finally:
+        cleanup(db, victima_id, profesional_ids)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()